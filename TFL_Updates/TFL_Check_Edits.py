@@ -9,13 +9,14 @@
 #IAN - consider slightly permanent log file for error messages
 
 # Import modules
-import arcpy, sys, os, datetime, getpass
+import arcpy, os, datetime, getpass, json
 from datetime import datetime
 import re
+import pandas as pd
 import TFL_Config
-sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
-import geobc
 from utils.test_prod_check import test_in_working_dir
+from utils.coded_domain_validation import get_coded_values
+from utils import attribute_rules, bcgw_connection, containment, geometry_tools, instrumentation, line_topology, polygon_build, validation_report, warehouse_mirror
 
 # BRETT WAS HERE
 
@@ -28,6 +29,11 @@ TFL_Path = TFL_Config.TFL_Path(test=test)
 
 TFL_EDITS_FOLDER = TFL_Path.EDITS_FOLDER
 
+#Optional FileGDB copy of the warehouse layers to use instead of the BCGW (see utils.bcgw_connection.layer_path)
+LOCAL_WAREHOUSE = getattr(TFL_Config.Resources, 'LOCAL_WAREHOUSE_GDB', None)
+#Optional local mirror of the warehouse layers, read instead of the BCGW while fresh (see utils.warehouse_mirror)
+WAREHOUSE_MIRROR = getattr(TFL_Config.Resources, 'WAREHOUSE_MIRROR_GDB', None)
+
 ###############################################################################
 # get script tool parameters
 input_folder = arcpy.GetParameterAsText(1) #Folder containing the TFL line edits
@@ -37,50 +43,74 @@ tfl_number = re.search("^TFL_[0-9]+", input_folder).group()
 input_gdb = TFL_EDITS_FOLDER + os.sep + input_folder + os.sep + 'data' + os.sep + 'FADM_' + tfl_number + '.gdb'
 
 tfl_lines = input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_number + '_Line'
+tfl_boundary = input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_number + '_Boundary'
+transaction_table = input_gdb + os.sep + tfl_number + '_Transaction_Details'
+#Active line IDs and extents at the last passing check - used to limit topology checks to lines edited since
+topology_manifest = os.path.dirname(input_gdb) + os.sep + tfl_number + '_topology_check.json'
+
+#Line fields read once and shared by the topology, attribute and polygon build checks
+LINE_FIELDS = ['Legal_Description', 'Status_Code', 'Source_Code', 'last_edited_date']
+
+#Maximum number of OBJECTIDs listed in a single message
+MAX_LISTED_IDS = 20
+
+#If more than this fraction of the active lines have been edited since the last passing check, check all lines
+INCREMENTAL_MAX_FRACTION = 0.25
 
 def runapp(tfl_check_edits):
 
-        BCGWConnection = get_bcgw_connection(bcgw_uname,bcgw_pw)
+        BCGWConnection = bcgw_connection.get_connection(bcgw_uname,bcgw_pw,LOCAL_WAREHOUSE)
         #CONSIDER rewriting the BCGW connection function - was copied from other code without much review
 
         if not BCGWConnection is False: #only proceed if connection succeeds -
-            #Create active line topology
-            create_topology(input_gdb + os.sep + 'TFL_Data', tfl_lines)
+            check_timestamp = datetime.now().replace(microsecond=0) #whole seconds so it matches the date stored in the gdb
+            geometry_tools.reset_io_stats()
+
+            #Read the lines and the current boundary once - all of the checks below run against these in memory
+            with instrumentation.stage('read lines and boundary'):
+                spatial_reference = arcpy.Describe(tfl_lines).spatialReference
+                lines = geometry_tools.read_features(tfl_lines, LINE_FIELDS)
+                boundary_fields = get_boundary_fields(tfl_boundary)
+                boundary = geometry_tools.read_features(tfl_boundary, boundary_fields)
 
-            #Run topology tools and report on any errors
-            topology_result = run_topology(input_gdb + os.sep + 'TFL_data')
+            #Check topology rules on the active lines and report on any errors
+            topology_result, line_extents = check_line_topology(input_gdb + os.sep + 'TFL_Data', lines, spatial_reference)
 
             #Get list of domain values for the line attribute check
-            domain_list = get_coded_values(input_gdb, 'STATUS_CODE')
+            status_codes = get_coded_values(input_gdb, 'STATUS_CODE')
 
             #Check attribute rules on the lines
-            attributes_result = check_line_attributes(tfl_lines, domain_list)
+            line_attribute_failures = check_line_attributes(lines, status_codes)
+            attributes_result = not line_attribute_failures
 
             #Convert lines to polygons using TFL lines - inform if build fails
-            build_result = create_polys(input_gdb,tfl_lines,tfl_number)
+            build_result, new_boundary = create_polys(lines, boundary, boundary_fields, tfl_number, spatial_reference)
 
             #The next two checks use the TFL boundary - only run them if the polygons built
             if build_result is True:
 
                 #Check that the new TFL Boundary does not overlap with any other TFL
                 #This is a soft rule that will not prevent submission as there may be multiple overlaps
-                tfl_overlap_result = check_tfl_overlaps(tfl_number,input_gdb,BCGWConnection)
+                tfl_overlap_result = check_tfl_overlaps(tfl_number,input_gdb,new_boundary,spatial_reference,BCGWConnection)
 
                 #Check to see if there are any schedule A polygons NOT within the Schedule B - warn if found
-                schedule_a_within_result = check_schedule_a_is_within(tfl_number,input_gdb)
+                schedule_a_within_result = check_schedule_a_is_within(tfl_number,input_gdb,new_boundary,spatial_reference)
 
             #track completion of this stage in transaction details table
             if topology_result is True and attributes_result is True and build_result is True:
                 #Mark as passed and update table
-                update_transaction_details(input_gdb,tfl_number,"Yes")
+                update_transaction_details(input_gdb,tfl_number,"Yes",check_timestamp)
+                write_topology_manifest(line_extents, check_timestamp)
                 arcpy.AddMessage('\nScript completed with no errors - data can proceed to review stage when ready.\n \
                 Any changes to data will require this script to be re-run')
             else:
                 #Mark as failed
-                update_transaction_details(input_gdb,tfl_number,"No")
+                update_transaction_details(input_gdb,tfl_number,"No",check_timestamp)
                 arcpy.AddWarning('\nScript completed with errors found - please review the error messages and \
                 correct before re-running test')
 
+            arcpy.AddMessage(geometry_tools.io_summary())
+
         else:
             arcpy.AddError('\nProblem creating BCGW Connection - please re-enter credentials')
 
@@ -88,247 +118,222 @@ def runapp(tfl_check_edits):
 ## Functions section
 ###############################################################################
 
-def create_topology(workspace, tfl_lines):
-    """Creates topology in the edit workspace creates an ACTIVE TFL line FC and adds rules to it
-    workspace is the feature dataset"""
-    arcpy.env.workspace = workspace
-    topology = workspace + os.sep + 'TFL_Active_Line_Topology'
-    active_lines = workspace + os.sep + 'TFL_Active_Lines__do_not_edit'
-    if arcpy.Exists(topology):
-        arcpy.Delete_management(topology)
-    #make feature layer of active lines
-    if arcpy.Exists(active_lines):
-        arcpy.Delete_management(active_lines)
-    tfl_active_lines_layer = arcpy.MakeFeatureLayer_management(tfl_lines, 'tfl_active_lines_layer', "Status_Code IN ('ACTIVE')")
-    arcpy.CopyFeatures_management('tfl_active_lines_layer', active_lines)
-    feature_class = active_lines
-    del tfl_active_lines_layer
-
-    try:
-        arcpy.CreateTopology_management(workspace,'TFL_Active_Line_Topology', .0001)
-        arcpy.AddFeatureClassToTopology_management(topology,feature_class)
-        #set the rules then add them to the topology
-        rules = ['Must Not Overlap (Line)',
-        'Must Not Intersect (Line)',
-        'Must Not Have Dangles (Line)',
-        'Must Not Self-Overlap (Line)',
-        'Must Not Self-Intersect (Line)',
-        'Must Be Single Part (Line)']
-        for rule in rules:
-            arcpy.AddRuleToTopology_management(topology,rule,feature_class)
-        arcpy.AddMessage('Added topology to TFL Active Lines')
-    except:
-        arcpy.AddError('Error adding topology')
-
-def run_topology(input_gdb):
-    """Runs topology on the TFL lines and prints any errors as arcpy messages
-    returns true if all tests pass and false otherwise. If errors are found then
-    the topology_Error feature classes will be saved in the edit database, otherwise
-    they will be deleted"""
-    #Check for pre-existing topology featureclasses
-    if arcpy.Exists(input_gdb + os.sep + 'Topology_Error_line'):
-        arcpy.Delete_management(input_gdb + os.sep + 'Topology_Error_line')
-    if arcpy.Exists(input_gdb + os.sep + 'Topology_Error_point'):
-        arcpy.Delete_management(input_gdb + os.sep + 'Topology_Error_point')
-
-    #Run topology that was created in TFL_Prepare_Edits
-    arcpy.ValidateTopology_management(input_gdb + os.sep + 'TFL_Active_Line_Topology')
-    arcpy.ExportTopologyErrors_management(input_gdb + os.sep + 'TFL_Active_Line_Topology', input_gdb, 'Topology_Error')
-
-    #Check output topology feature classes - if they are empty - delete them, otherwise add the errors to a list
-    errors = []
-    arcpy.env.workspace = input_gdb
-    arcpy.env.XYTolerance = "0.0001 Meters"
-    feature_classes = arcpy.ListFeatureClasses()
-    for feature_class in feature_classes:
-        if 'Topology_Error' in feature_class:
-            if int(arcpy.GetCount_management(feature_class).getOutput(0)) > 0:
-                with arcpy.da.SearchCursor(feature_class, 'RuleDescription') as cursor:
-                    for row in cursor:
-                        errors.append(row[0])
-            else:
-                arcpy.Delete_management(feature_class)
+@instrumentation.timed('line topology')
+def check_line_topology(workspace, lines, spatial_reference):
+    """Takes the TFL lines frame (from geometry_tools.read_features) and checks the ACTIVE lines against the line topology rules (overlap, intersect, dangles,
+    self-overlap, self-intersect, single part) in memory and prints any errors as arcpy messages.
+    If only a few lines have been edited since the last passing check, only those lines and their
+    neighbours (at their new and previous locations) are checked. Returns a tuple of (True if all tests
+    pass and False otherwise, {active line ID: extent}). If errors are found they are saved to the Topology_Error_line and
+    Topology_Error_point feature classes in the workspace (feature dataset)"""
+    #Remove outputs from previous runs - including the geodatabase topology used by earlier versions of this tool
+    for previous in ['Topology_Error_line', 'Topology_Error_point', 'TFL_Active_Line_Topology', 'TFL_Active_Lines__do_not_edit']:
+        if arcpy.Exists(workspace + os.sep + previous):
+            arcpy.Delete_management(workspace + os.sep + previous)
+
+    active_lines = lines[lines['Status_Code'] == 'ACTIVE']
+    line_extents = line_topology.extents(active_lines.index.values, active_lines['geometry'].values)
+
+    edited_line_ids, previous_extents = get_edited_line_ids(active_lines)
+    if edited_line_ids is None:
+        arcpy.AddMessage('Checking topology on all {} active lines'.format(len(active_lines)))
+    else:
+        arcpy.AddMessage('Checking topology on {} lines edited since the last passing check and their neighbours'.format(len(edited_line_ids)))
+    errors = line_topology.validate_line_topology(active_lines.index.values, active_lines['geometry'].values,
+                                                  seed_oids=edited_line_ids, seed_extents=previous_extents)
 
     if not errors:
         arcpy.AddMessage('No topology errors found\n')
-        return(True)
-    else:
-        arcpy.AddWarning('Topology errors found - please review the topology results and correct\n')
-        for error in errors:
-            arcpy.AddWarning(error)
-        return(False)
-
-def create_polys(input_gdb, tfl_lines, tfl_basename):
-    """"Takes input TFL lines and attempts to build polygons to a temp layer. If build
-    succeeds, appends them to the empty TFL Boundary feature class, deletes the temp
-    layer and returns True. If no polygons created, deleted temp layer and returns False"""
-
-    #Check if a previous temp poly exists - if so delete it first
-    if arcpy.Exists(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly'):
-        arcpy.Delete_management(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly')
-
+        return(True, line_extents)
+
+    #save the error geometries so they can be reviewed in the map
+    error_fields = [('RuleDescription', 'TEXT', 50), ('OriginObjectID', 'LONG', None), ('DestinationObjectID', 'LONG', None)]
+    error_df = pd.DataFrame([(error.rule, error.oids[0], error.oids[1] if len(error.oids) > 1 else None, error.geometry) for error in errors],
+                            columns=['RuleDescription', 'OriginObjectID', 'DestinationObjectID', 'geometry'])
+    is_point = error_df['geometry'].map(lambda geometry: geometry.geom_type == 'Point')
+    if is_point.any():
+        geometry_tools.write_features(workspace + os.sep + 'Topology_Error_point', error_df[is_point], 'POINT', spatial_reference, error_fields)
+    if (~is_point).any():
+        geometry_tools.write_features(workspace + os.sep + 'Topology_Error_line', error_df[~is_point], 'POLYLINE', spatial_reference, error_fields)
+
+    arcpy.AddWarning('Topology errors found - please review the topology results and correct\n')
+    for error in errors:
+        arcpy.AddWarning(error.rule)
+    return(False, line_extents)
+
+def get_edited_line_ids(active_lines):
+    """Takes the active lines (with last_edited_date) and returns a tuple of (IDs of lines edited since the
+    last passing check edits run, extents of those lines at that check), or (None, None) if all lines need
+    checking. The previous extents let the check find lines left behind when an edited line was moved.
+    All lines are checked if the last check did not pass, if any line active at that check is gone (deleted
+    or retired lines leave no edit date behind), or if more than INCREMENTAL_MAX_FRACTION of the lines were edited"""
+    if not os.path.exists(topology_manifest):
+        return None, None
+
+    check_edits_passed, check_edits_date = None, None
+    with arcpy.da.SearchCursor(transaction_table, ['Check_Edits_Passed', 'Check_Edits_Date']) as cursor:
+        for row in cursor:
+            check_edits_passed, check_edits_date = row
+    if check_edits_passed != 'Yes' or check_edits_date is None:
+        return None, None
+
+    with open(topology_manifest) as f:
+        manifest = json.load(f)
+    #the manifest must come from the same check run as the transaction details (and record the line extents)
+    if manifest.get('check_edits_date') != check_edits_date.isoformat() or 'line_extents' not in manifest:
+        return None, None
+    previous_extents = dict((int(oid), extent) for oid, extent in manifest['line_extents'].items())
+    previous_ids = set(previous_extents)
+    if previous_ids - set(active_lines.index):
+        return None, None
+
+    edited = pd.to_datetime(active_lines['last_edited_date']) > check_edits_date
+    edited |= ~active_lines.index.isin(previous_ids)
+    edited_line_ids = [int(oid) for oid in active_lines.index[edited.values]]
+    if len(edited_line_ids) > INCREMENTAL_MAX_FRACTION * len(active_lines):
+        return None, None
+    return edited_line_ids, [previous_extents[oid] for oid in edited_line_ids if oid in previous_extents]
+
+def write_topology_manifest(line_extents, check_timestamp):
+    """Saves the active line IDs and extents from a passing check so the next check can be limited to edited lines"""
+    with open(topology_manifest, 'w') as f:
+        json.dump({'check_edits_date': check_timestamp.isoformat(), 'line_extents': line_extents}, f)
+
+def get_boundary_fields(tfl_boundary):
+    """Returns the editable attribute fields of the TFL Boundary - the attributes carried over when it is rebuilt"""
+    return [field.name for field in arcpy.ListFields(tfl_boundary) if field.editable and field.type not in ('OID', 'Geometry', 'GlobalID')]
+
+@instrumentation.timed('build polygons')
+def create_polys(lines, boundary, boundary_fields, tfl_basename, spatial_reference):
+    """"Takes the TFL lines and current TFL Boundary frames and attempts to build polygons in
+    memory from the active and retired lines. Attributes from the existing TFL Boundary polygons
+    (if any) are carried over to the new polygons that contain them, and new polygons without a
+    previous boundary polygon are dropped. If the build succeeds, replaces the TFL Boundary features
+    in a single write and returns (True, new boundary frame). If no polygons created, leaves the
+    boundary as is and returns (False, None)"""
     #select only the active and retired lines - use to build polys - retired lines are used for deletions
-    arcpy.MakeFeatureLayer_management(tfl_lines, 'tfl_lines_layer', "Status_Code IN ('ACTIVE', 'RETIRED')")
-
-    #If there are any records in the TFL Boundary poly, copy the layer to points (to save attributes), then create the polys
-    if int(arcpy.GetCount_management(input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary')[0]) > 0:
-        #check for previous temp points layer
-        if arcpy.Exists(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Boundary_Points'):
-            arcpy.Delete_management(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Boundary_Points')
-        #copy polygons to points to allow the attributes to be copied over later
-        arcpy.AddMessage('----- copying TFL boundary to temp points')
-        #Use feature to point to save poly attributes temporarily
-        arcpy.FeatureToPoint_management(input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary','Temp_Boundary_Points', "INSIDE")
-        arcpy.AddMessage('----- deleting previous boundary')
-        arcpy.DeleteRows_management(input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary')
-        #create temp poly using the points as attributes
-        arcpy.FeatureToPolygon_management('tfl_lines_layer',input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly','','','Temp_Boundary_Points')
-        #run inverted selection to create a feature layer for poly's with no points, then delete it
-        arcpy.MakeFeatureLayer_management('Temp_Poly','Poly_Without_Points')
-        arcpy.SelectLayerByLocation_management('Poly_Without_Points','INTERSECT','Temp_Boundary_Points','','','INVERT')
-        arcpy.DeleteFeatures_management('Poly_Without_Points')
-
-    #otherwise - just create them without using the temp points
-    else:
-        arcpy.FeatureToPolygon_management('tfl_lines_layer',input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly')
-
-    if int(arcpy.GetCount_management(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly').getOutput(0)) == 0:
-        arcpy.AddWarning("===== Error - No polygons created\n")
-        return(False)
-    else:
+    build_lines = lines[lines['Status_Code'].isin(['ACTIVE', 'RETIRED'])]
 
-        #Append Temp_Poly into empty _Boundary
-        arcpy.AddMessage('Appending new geometry to TFL Boundary polygon')
-        arcpy.Append_management(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly',input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary', 'NO_TEST')
-        arcpy.Delete_management(input_gdb + os.sep + 'TFL_Data' + os.sep + 'Temp_Poly')
+    arcpy.AddMessage('----- building polygons from TFL lines')
+    polys = polygon_build.build_polygons(build_lines['geometry'].values, boundary if len(boundary) else None, boundary_fields)
 
-        #If there are temp boundary points, delete them
-        if arcpy.Exists(input_gdb + os.sep + 'Temp_Boundary_Points'):
-            arcpy.Delete_management(input_gdb + os.sep + 'Temp_Boundary_Points')
-
-        #replace underscores and zeros to create the Forest File ID
-        if '_0' in tfl_basename:
-            forest_file_id = tfl_basename.replace('_0','')
-        else:
-            forest_file_id = tfl_basename.replace('_','')
-
-        #Populate the required fields
-        arcpy.AddMessage('----- Populating TFL Boundary polygon attributes\n')
-        fields = ['FOREST_FILE_ID', 'FEATURE_CLASS_SKEY']
-        with arcpy.da.UpdateCursor(input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary', fields) as cursor:
-            for row in cursor:
-                row[0] = forest_file_id
-                row[1] = 830
-                cursor.updateRow(row)
-        return(True) #success
-
-def check_line_attributes(tfl_lines, domain_list):
-    """Checks the TFL Lines for null values in fields that should be populated
-    if nulls are found, prints arcpy message with the null fields. Returns true
-    if no nulls are found, and False if nulls are found. Calls function to check required line attributes from domain"""
-    fields = ['Legal_Description', 'Status_Code','Source_Code']
-    #use set instead of list because it only stores unique values and we are only
-    #interested in knowing which fields have nulls
-    nulls_found = set()
-    domain_error = False
-    with arcpy.da.SearchCursor(tfl_lines, fields) as cursor:
-        for row in cursor:
-            if row[0] == None:
-                nulls_found.add('Legal_Description')
-            if row[1] == None:
-                nulls_found.add('Status_Code')
-            if row[2] == None:
-                nulls_found.add('Source_Code')
-            if row[1] not in domain_list:
-                domain_error = True
-
-    if nulls_found:
-        arcpy.AddWarning('ERROR: Null values found in ' + str(nulls_found))
-    if domain_error:
-        arcpy.AddWarning('ERROR: one or more lines are not using domain values for STATUS_CODE')
-    if nulls_found or domain_error:
-        return(False)
-    else:
-        return(True)
+    if len(polys) == 0:
+        arcpy.AddWarning("===== Error - No polygons created\n")
+        return(False, None)
 
-def get_bcgw_connection(bcgw_uname, bcgw_pw):
-# SET UP BCGW CONNECTION -----------------------------------------------------------------
-    arcpy.AddMessage(" ")
-    arcpy.AddMessage("Setting up the BCGW connection...\n")
-
-    # Run the  "BCGWConnectionFileModule.create" function which creates the BCGW
-    # connection file and save the pathname to the variable "BCGWConnection"
-    connection = geobc.BCGWConnection()
-    success = connection.create_bcgw_connection_file(bcgw_uname,bcgw_pw)
-    if success:
-        BCGWConnection = connection.bcgw_connection_file
+    #replace underscores and zeros to create the Forest File ID
+    if '_0' in tfl_basename:
+        forest_file_id = tfl_basename.replace('_0','')
     else:
-        BCGWConnection = False
-    #-----------------------------------------------------------------------------------------
-    return BCGWConnection
-
-
-def check_tfl_overlaps(tfl_basename, input_gdb, BCGWConnection):
-    """takes input TFL and GCBW connection. Checks to see if the
+        forest_file_id = tfl_basename.replace('_','')
+
+    #Populate the required fields
+    arcpy.AddMessage('----- Populating TFL Boundary polygon attributes')
+    polys['FOREST_FILE_ID'] = forest_file_id
+    polys['FEATURE_CLASS_SKEY'] = 830
+
+    #Replace the TFL Boundary features with the new polygons
+    arcpy.AddMessage('Writing new geometry to TFL Boundary polygon\n')
+    arcpy.DeleteRows_management(tfl_boundary)
+    geometry_tools.insert_features(tfl_boundary, polys, boundary_fields, spatial_reference)
+    return(True, polys) #success
+
+@instrumentation.timed('line attributes')
+def check_line_attributes(lines, status_codes):
+    """Takes the TFL lines frame and checks for null values in Legal_Description, Status_Code and Source_Code
+    and for Status_Code values that are not in status_codes (a set of the domain values). All rules
+    in attribute_rules.LINE_RULES are evaluated at once against the frame.
+    Prints the failing line OBJECTIDs for each field and saves them to the Line_Attribute_Errors
+    table in the gdb (deleted if there are none). Returns a dictionary of {field: [OBJECTIDs]}
+    which is empty if all lines pass"""
+    results = attribute_rules.evaluate_rules(lines, attribute_rules.LINE_RULES, {'STATUS_CODE': status_codes})
+    failed = attribute_rules.failed(results, attribute_rules.ERROR)
+
+    failures = {}
+    for result in failed:
+        oids = [int(oid) for oid in lines.index[result.mask]]
+        failures.setdefault(result.rule.field, set()).update(oids)
+        listed = ', '.join(str(oid) for oid in oids[:MAX_LISTED_IDS]) + (' ...' if len(oids) > MAX_LISTED_IDS else '')
+        arcpy.AddWarning('ERROR: ' + attribute_rules.format_message(result) + ' - {} lines, OBJECTID: {}'.format(len(oids), listed))
+    failures = dict((field, sorted(oids)) for field, oids in failures.items())
+
+    error_table = input_gdb + os.sep + 'Line_Attribute_Errors'
+    if failed:
+        validation_report.write_table(validation_report.build_records(os.path.basename(tfl_lines), lines, failed), error_table)
+        arcpy.AddWarning('Failing lines saved to the Line_Attribute_Errors table - join on OBJECT_ID to find them in the map')
+    elif arcpy.Exists(error_table):
+        arcpy.Delete_management(error_table)
+
+    return failures
+
+@instrumentation.timed('TFL overlaps')
+def check_tfl_overlaps(tfl_basename, input_gdb, boundary, spatial_reference, BCGWConnection):
+    """takes input TFL, the new TFL Boundary frame and GCBW connection. Checks to see if the
     new TFL Boundary overlaps with any other TFL's in the BCGW.
-    If overlaps exist, saves them in the working database and
-    returns False. If no overlaps, deletes temp layer and returns True"""
+    Only BCGW TFLs within the envelope of the new boundary are read, and the
+    intersection is done in memory. Every area overlap is reported - TFLs that
+    only share an edge are not. If overlaps exist, saves them in the working
+    database and returns False. If no overlaps, returns True"""
     #clean up from any previous runs
-    if arcpy.Exists(input_gdb + os.sep + 'TFL_Overlaps'):
-        arcpy.Delete_management(input_gdb + os.sep + 'TFL_Overlaps')
-    if arcpy.Exists(input_gdb + os.sep + 'tfl_whse_selection'):
-        arcpy.Delete_management(input_gdb + os.sep + 'tfl_whse_selection')
+    overlaps_fc = input_gdb + os.sep + 'TFL_Overlaps'
+    if arcpy.Exists(overlaps_fc):
+        arcpy.Delete_management(overlaps_fc)
 
-    tfl_whse_fc = BCGWConnection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
+    tfl_whse_fc = warehouse_mirror.resolve(BCGWConnection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP', WAREHOUSE_MIRROR)
     if '_0' in tfl_basename:
         tfl_FFID_modified = tfl_basename.replace('_0','')
     else:
         tfl_FFID_modified = tfl_basename.replace('_','')
-    arcpy.MakeFeatureLayer_management(tfl_whse_fc, 'tfl_whse_fl')
-    arcpy.SelectLayerByAttribute_management('tfl_whse_fl','NEW_SELECTION', "FOREST_FILE_ID <> '" + tfl_FFID_modified + "'")
-    arcpy.CopyFeatures_management('tfl_whse_fl',input_gdb + os.sep + 'tfl_whse_selection')
-    input_layers = [input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Boundary',input_gdb + os.sep + 'tfl_whse_selection']
-
-    arcpy.Intersect_analysis(input_layers,input_gdb + os.sep + 'TFL_Overlaps')
-    arcpy.Delete_management(input_gdb + os.sep + 'tfl_whse_selection')
-
-    if int(arcpy.GetCount_management(input_gdb + os.sep + 'TFL_Overlaps').getOutput(0)) > 0:
+    #only read the other TFLs that fall within the envelope of the new boundary
+    whse_tfls = geometry_tools.read_features(tfl_whse_fc, ['FOREST_FILE_ID'], "FOREST_FILE_ID <> '" + tfl_FFID_modified + "'",
+                                             spatial_filter=geometry_tools.envelope(boundary['geometry'], spatial_reference),
+                                             spatial_reference=spatial_reference)
+    arcpy.AddMessage('Read {} TFL features ({:,} bytes) from BCGW within the boundary envelope'.format(len(whse_tfls), whse_tfls.attrs['bytes_read']))
+
+    #intersect each boundary polygon with the BCGW TFLs it touches - keep the area overlaps, not shared edges
+    overlaps = [(whse_tfls['FOREST_FILE_ID'].values[w], overlap)
+                for _, w, overlap in containment.find_overlaps(boundary['geometry'].values, whse_tfls['geometry'].values)]
+
+    if overlaps:
+        overlaps_df = pd.DataFrame(overlaps, columns=['FOREST_FILE_ID', 'geometry'])
+        geometry_tools.write_features(overlaps_fc, overlaps_df, 'POLYGON', spatial_reference, [('FOREST_FILE_ID', 'TEXT', 10)])
         arcpy.AddWarning('===== Overlaps found with another TFL in BCGW Current View - please check the TFL Overlaps feature class in the working GDB\n')
         return(False)
     else:
         arcpy.AddMessage('No TFL overlaps found\n')
-        arcpy.Delete_management(input_gdb + os.sep + 'TFL_Overlaps')
         return(True)
 
-def check_schedule_a_is_within(tfl_basename, input_gdb):
-    """Takes input edit database and checks to ensure that all schedule A land is
-    within the newly created/updated TFL Boundary. Returns False if Schedule A
-    exists outside of boundary and True if all Schedule A is within"""
-
-    arcpy.env.workspace = input_gdb
-
-    if arcpy.Exists(input_gdb + os.sep + 'schedule_a_outside'):
-        arcpy.Delete_management(input_gdb + os.sep + 'schedule_a_outside')
-
-    tfl_boundary = arcpy.MakeFeatureLayer_management(input_gdb + os.sep + tfl_basename + '_Boundary','tfl_boundary')
-    tfl_schedule_a = arcpy.MakeFeatureLayer_management(input_gdb + os.sep + tfl_basename + '_Schedule_A', 'tfl_schedule_a')
-    schedule_a_outside = arcpy.Erase_analysis(tfl_schedule_a,tfl_boundary,'schedule_a_outside')
-    if int(arcpy.GetCount_management(schedule_a_outside)[0])>0:
+@instrumentation.timed('Schedule A within boundary')
+def check_schedule_a_is_within(tfl_basename, input_gdb, boundary, spatial_reference):
+    """Takes input edit database and the new TFL Boundary frame and checks to ensure that all
+    schedule A land is within the boundary, in memory. Only the parts of Schedule A outside the
+    boundary (larger than the area tolerance) are saved, to the schedule_a_outside feature class.
+    Returns False if Schedule A exists outside of boundary and True if all Schedule A is within"""
+    outside_fc = input_gdb + os.sep + 'schedule_a_outside'
+    if arcpy.Exists(outside_fc):
+        arcpy.Delete_management(outside_fc)
+
+    schedule_a = geometry_tools.read_features(input_gdb + os.sep + 'TFL_Data' + os.sep + tfl_basename + '_Schedule_A')
+    outside = containment.find_outside(schedule_a['geometry'].values, boundary['geometry'].values)
+    if outside:
+        outside_df = pd.DataFrame([(int(schedule_a.index[index]), geometry) for index, geometry in outside],
+                                  columns=['SCHEDULE_A_OID', 'geometry'])
+        geometry_tools.write_features(outside_fc, outside_df, 'POLYGON', spatial_reference, [('SCHEDULE_A_OID', 'LONG', None)])
         arcpy.AddWarning('===== Found Schedule A polygons outside of TFL Boundary - please review the schedule_a_outside feature class\n')
         return(False)
     else:
         arcpy.AddMessage('Schedule A is all within the boundary\n')
-        arcpy.Delete_management(schedule_a_outside)
         return(True)
 
-def update_transaction_details(input_gdb,tfl_basename, result):
+@instrumentation.timed('update transaction details')
+def update_transaction_details(input_gdb,tfl_basename, result, timestamp=None):
     """Takes the result of all checks and either inserts (if there is no record
     or updates (if there is a record) the transaction details table. This table
     should only ever have 0 or 1 records as it is used to track completion of stages
-    in the edit process. Saves check results and editor user name"""
+    in the edit process. Saves check results, check time (now if not given) and editor user name"""
     fields = ['Check_Edits_Passed','Check_Edits_Date','Edits_Checked_By']
     user = getpass.getuser()
-    timestamp = datetime.now()
+    timestamp = timestamp or datetime.now()
     transaction_table = input_gdb + os.sep + tfl_basename + '_Transaction_Details'
     #Check to see if there is already a record - then update or insert as needed
     count = arcpy.GetCount_management(transaction_table)
@@ -347,19 +352,7 @@ def update_transaction_details(input_gdb,tfl_basename, result):
     else:
         arcpy.AddError('ERROR - more than one row in transaction details table - something wrong')
 
-def get_coded_values(gdb, domain_name):
-    """takes a gdb object and a string of a domain name, returns a list of domain values.
-       NOTE: only works for coded value domains"""
-    domains = arcpy.da.ListDomains(gdb)
-    domain_list = []
-    for domain in domains:
-        if domain.name == domain_name:
-            values = domain.codedValues
-            for val in values.items():
-                domain_list.append(val[0])
-
-    return(domain_list)
-
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('tfl_check_edits')
\ No newline at end of file
+    with instrumentation.run('TFL_Check_Edits', os.path.dirname(working_location)):
+        runapp('tfl_check_edits')
\ No newline at end of file
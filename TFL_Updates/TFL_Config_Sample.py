@@ -12,6 +12,12 @@
 
 class Resources():
     GEOBC_LIBRARY_PATH = R'\\spatialfiles.bcgov\ilmb\dss\dsswhse\Tools and Resources\Scripts\Python\Library'
+    #Optional - path to a FileGDB with copies of the BCGW layers (dots in names replaced with underscores,
+    #e.g. WHSE_ADMIN_BOUNDARIES_FADM_TFL_ALL_SP). When set, the tools use it instead of connecting to the BCGW
+    LOCAL_WAREHOUSE_GDB = None
+    #Optional - path to the FileGDB mirror of the BCGW layers kept up to date by utils/warehouse_mirror.py.
+    #When set, the tools read layers from it while the mirror copy is fresh
+    WAREHOUSE_MIRROR_GDB = None
 
 class TFL_Path():
     """Class of properties for file paths. Uses test boolean to determine if
@@ -19,6 +25,7 @@ class TFL_Path():
     passed from calling script, with a default setting of working in test"""
     def __init__(self, test = True):
         self.test = test
+        #TEMPLATE_MAP can be an ArcMap .mxd or an ArcGIS Pro .aprx - the review map is saved in the same format
 
         if self.test:
             self.FINAL_FOLDER = R'\\UNC\path\to\test\1_TFL_Final'
@@ -13,6 +13,7 @@ import TFL_Config
 sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
 import geobc
 from utils.test_prod_check import test_in_working_dir
+from utils import instrumentation
 
 
 ###############################################################################
@@ -45,14 +46,18 @@ def runapp(move_to_working):
     arcpy.AddMessage('input folder to move is: ' + input_folder)
 
     # Call check_for_locks method to check the gdb - compact first to address self-locks
-    arcpy.Compact_management(input_gdb)
+    with instrumentation.stage('compact gdb'):
+        arcpy.Compact_management(input_gdb)
     gdb_object = geobc.GDBInfo(input_gdb)
     lock_owner_list = gdb_object.check_for_locks()
     if not lock_owner_list:
-        arcpy.UncompressFileGeodatabaseData_management(input_gdb) #If the GDB is in pending - it is probably compressed
+        with instrumentation.stage('uncompress gdb'):
+            arcpy.UncompressFileGeodatabaseData_management(input_gdb) #If the GDB is in pending - it is probably compressed
         #Move the required entities to the pending area
         try:
-            shutil.copytree(input_folder,TFL_WORKING_FOLDERS + os.sep + input_tfl)
+            with instrumentation.stage('copy to working'):
+                shutil.copytree(input_folder,TFL_WORKING_FOLDERS + os.sep + input_tfl)
+                instrumentation.count(bytes_copied=instrumentation.dataset_size(TFL_WORKING_FOLDERS + os.sep + input_tfl))
             #message user and end script
             arcpy.AddMessage('TFL folder has been copied to 2_TFL_Working folder')
             try:
@@ -73,4 +78,5 @@ def runapp(move_to_working):
 
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('move_to_working')
\ No newline at end of file
+    with instrumentation.run('TFL_Move_To_Working', os.path.dirname(working_location)):
+        runapp('move_to_working')
\ No newline at end of file
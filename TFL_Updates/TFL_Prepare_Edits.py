@@ -10,14 +10,13 @@
 #IAN - add versioning and modification notes after satisfied w/ v0.1
 
 # Import modules
-import arcpy, sys, os, datetime, shutil, getpass
+import arcpy, os, datetime, shutil, getpass
 from os.path import join
 from datetime import datetime
 from distutils.dir_util import copy_tree
 import TFL_Config
-sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
-import geobc
 from utils.test_prod_check import test_in_working_dir
+from utils import bcgw_connection, change_detection, geometry_tools, instrumentation, line_change_set, warehouse_mirror
 
 
 ###############################################################################
@@ -34,6 +33,11 @@ TFL_PENDING_FOLDER = TFL_Path.PENDING_FOLDERS
 
 TFL_TEMPLATES_GDB = TFL_Path.TEMPLATES_GDB
 
+#Optional FileGDB copy of the warehouse layers to use instead of the BCGW (see utils.bcgw_connection.layer_path)
+LOCAL_WAREHOUSE = getattr(TFL_Config.Resources, 'LOCAL_WAREHOUSE_GDB', None)
+#Optional local mirror of the warehouse layers, read instead of the BCGW while fresh (see utils.warehouse_mirror)
+WAREHOUSE_MIRROR = getattr(TFL_Config.Resources, 'WAREHOUSE_MIRROR_GDB', None)
+
 ###############################################################################
 # get script tool parameters
 input_tfl = arcpy.GetParameterAsText(1) #Folder containing the final TFL data for editing
@@ -52,7 +56,7 @@ def runapp(tfl_prepare_edits):
     arcpy.AddMessage('extracted at '+str(extract_timestamp))
 
     #establish the BCGW connection to check the schedule A AND TFL Boundary
-    BCGWConnection = get_bcgw_connection(bcgw_uname,bcgw_pw)
+    BCGWConnection = bcgw_connection.get_connection(bcgw_uname,bcgw_pw,LOCAL_WAREHOUSE)
 
     if not BCGWConnection is False: #only proceed if connection succeeds
 
@@ -65,8 +69,9 @@ def runapp(tfl_prepare_edits):
 
 
             #uncompress the gdb - final is compressed to prevent accidental edits
-            arcpy.UncompressFileGeodatabaseData_management(TFL_EDITS_FOLDER + os.sep + folder_basename + os.sep + \
-            'data' + os.sep + 'FADM_' + folder_basename + '.gdb')
+            with instrumentation.stage('uncompress gdb'):
+                arcpy.UncompressFileGeodatabaseData_management(TFL_EDITS_FOLDER + os.sep + folder_basename + os.sep + \
+                'data' + os.sep + 'FADM_' + folder_basename + '.gdb')
 
             #Workspace is the feature dataset
             workspace = TFL_EDITS_FOLDER + os.sep + folder_basename + os.sep + \
@@ -75,6 +80,8 @@ def runapp(tfl_prepare_edits):
             # enable editor tracking on lines
             tfl_lines = os.path.join(workspace, folder_basename + '_Line')
             arcpy.EnableEditorTracking_management(tfl_lines, 'created_user', 'created_date', 'last_edited_user', 'last_edited_date', 'NO_ADD_FIELDS', 'DATABASE_TIME')
+            #index the edit date so the changed lines can be found quickly at review and submission
+            line_change_set.add_edit_date_index(tfl_lines)
 
             #Delete all tables from Edit gdb except the TFL Lines and Schedule A
             delete_tables(workspace)
@@ -108,6 +115,7 @@ def runapp(tfl_prepare_edits):
 ###############################################################################
 ## Functions section
 ###############################################################################
+@instrumentation.timed('copy final to edits')
 def copy_input_tfl(folder_basename):
     """ Takes input folder - creates folder structure and copies data from final folder returns Boolean True for success"""
     tfl_edit_folder = join(TFL_EDITS_FOLDER, folder_basename)
@@ -128,6 +136,7 @@ def copy_input_tfl(folder_basename):
 
         arcpy.Copy_management(join(input_tfl, 'data', 'FADM_' + folder_basename + '.gdb'), \
                             join(TFL_EDITS_FOLDER, folder_basename, 'data', 'FADM_' + folder_basename + '.gdb'))
+        instrumentation.count(bytes_copied=instrumentation.dataset_size(join(TFL_EDITS_FOLDER, folder_basename, 'data', 'FADM_' + folder_basename + '.gdb')))
 
         arcpy.AddMessage('Completed copy from TFL Final\n')
         return True
@@ -166,6 +175,7 @@ def tfl_exists(folder_basename):
     return False
 
 
+@instrumentation.timed('delete tables')
 def delete_tables(workspace):
     """Take edit workspace and delete all database tables that are not used as inputs (TFL Lines and Schedule A excepted)"""
     arcpy.env.workspace = workspace
@@ -195,6 +205,7 @@ def delete_tables(workspace):
             arcpy.Delete_management(feature_class)
         arcpy.AddMessage('Completed delete tables\n')
 
+@instrumentation.timed('copy template tables')
 def copy_tables_from_template(workspace, folder_basename):
     """Copies tables from the template database to the edit workspace - excluding TFL Lines and Schedule A"""
     arcpy.env.workspace = TFL_TEMPLATES_GDB
@@ -225,6 +236,7 @@ def copy_tables_from_template(workspace, folder_basename):
                     arcpy.AddMessage('Copied ' + table + ' from template')
         arcpy.AddMessage('Completed copy of tables from template database\n')
 
+@instrumentation.timed('delete non-active lines')
 def delete_non_active_lines(workspace, folder_basename):
     """Deletes any lines that do not have Status Code = ACTIVE from the TFL Lines - these should represent the current boundary"""
     arcpy.env.workspace = workspace
@@ -239,6 +251,7 @@ def delete_non_active_lines(workspace, folder_basename):
     #IAN - return something if it can't even evaluate the selectLayerByAttribute...e.g., #arcpy.GetMessages()
     arcpy.AddMessage('Completed search and delete function for non-active lines\n')
 
+@instrumentation.timed('build polygons')
 def create_polys(input_workspace, folder_basename):
     """"Takes input TFL lines and attempts to build polygons to a temp layer. If build
     succeeds, informs user and deletes the temp feature class. If no polygons created,
@@ -262,6 +275,7 @@ def create_polys(input_workspace, folder_basename):
         arcpy.AddMessage('One or more polygons created from active input lines\n')
         arcpy.Delete_management(input_workspace + os.sep + 'Temp_Poly')
 
+@instrumentation.timed('create topology')
 def create_topology(workspace, folder_basename):
     """Creates topology in the edit workspace and adds rules to the TFL Lines"""
     arcpy.env.workspace = workspace
@@ -285,6 +299,7 @@ def create_topology(workspace, folder_basename):
     except:
         arcpy.AddError('Error adding topology')
 
+@instrumentation.timed('validate topology')
 def run_topology(input_gdb):
     """Runs topology on the TFL lines and prints any errors as arcpy messages
     returns true if all tests pass and false otherwise. If errors are found then
@@ -327,23 +342,7 @@ def run_topology(input_gdb):
         arcpy.AddWarning('Error validating topology - manual repair of topology errors using map extent may be required')
         return(False)
 
-def get_bcgw_connection(bcgw_uname, bcgw_pw):
-# SET UP BCGW CONNECTION -----------------------------------------------------------------
-    arcpy.AddMessage(" ")
-    arcpy.AddMessage("Setting up the BCGW connection...")
-
-    # Run the  "BCGWConnectionFileModule.create" function which creates the BCGW
-    # connection file and save the pathname to the variable "BCGWConnection"
-    connection = geobc.BCGWConnection()
-    success = connection.create_bcgw_connection_file(bcgw_uname,bcgw_pw)
-    if success:
-        BCGWConnection = connection.bcgw_connection_file
-    else:
-        BCGWConnection = False
-    #-----------------------------------------------------------------------------------------
-    return BCGWConnection
-
-
+@instrumentation.timed('BCGW differences')
 def check_bcgw_to_final_differences(tfl_basename, input_gdb, BCGWConnection): #IAN - use standard variable names here
     """takes input folder and bcgw connection - compares the TFL Final with BCGW for schedule A and boundary and
     saves any differences between them to the edit database."""
@@ -357,46 +356,49 @@ def check_bcgw_to_final_differences(tfl_basename, input_gdb, BCGWConnection): #I
 
     arcpy.AddMessage('Checking differences between BCGW and final TFLs...')
 
-    tfl_whse = BCGWConnection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
-    sched_a_whse = BCGWConnection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A'
+    tfl_whse = warehouse_mirror.resolve(BCGWConnection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP', WAREHOUSE_MIRROR)
+    sched_a_whse = warehouse_mirror.resolve(BCGWConnection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A', WAREHOUSE_MIRROR)
     #IAN - this may change when we standardize TFL Current View ForestFileID
     if '_0' in folder_basename:
         sched_a_ffid = folder_basename.replace('_0','')
     else:
         sched_a_ffid = folder_basename.replace('_','')
 
-    #Compare Schedule A sources
-    sched_a_diff = join(input_gdb, folder_basename+'_Sched_A_BCGW_Difference')
+    #read each source once - the warehouse layers are projected to match the final data
+    spatial_reference = arcpy.Describe(boundary_final).spatialReference
+    final_schedule_a = geometry_tools.read_features(schedule_a_final)
+    final_boundary = geometry_tools.read_features(boundary_final)
+    bcgw_schedule_a = geometry_tools.read_features(sched_a_whse, where_clause="FOREST_FILE_ID = '" + sched_a_ffid + "' AND RETIREMENT_DATE IS NULL", spatial_reference=spatial_reference)
+    bcgw_boundary = geometry_tools.read_features(tfl_whse, where_clause="FOREST_FILE_ID = '" + folder_basename.replace('_',' ') + "'", spatial_reference=spatial_reference)
 
-    bcgw_sched_a_fl = arcpy.MakeFeatureLayer_management(sched_a_whse, 'bcgw_sched_a_fl', "FOREST_FILE_ID = '" + sched_a_ffid + "' AND RETIREMENT_DATE IS NULL")
-    if arcpy.Exists(sched_a_diff):
-        arcpy.Delete_management(sched_a_diff)
-
-    arcpy.SymDiff_analysis(bcgw_sched_a_fl, schedule_a_final, sched_a_diff)
-
-    #Compare TFL Current View sources
-    boundary_diff = join(input_gdb, folder_basename+'_Boundary_BCGW_Difference')
-
-    bcgw_boundary_fl = arcpy.MakeFeatureLayer_management(tfl_whse,'bcgw_boundary_fl', "FOREST_FILE_ID = '" + folder_basename.replace('_',' ') + "'")
-    if arcpy.Exists(boundary_diff):
-        arcpy.Delete_management(boundary_diff)
-
-    arcpy.SymDiff_analysis(bcgw_boundary_fl,boundary_final,boundary_diff)
-
-    #Check the difference layers - if there are any differences warn the editor - otherwise - delete them
-    if int(arcpy.GetCount_management(sched_a_diff)[0]) > 0:
+    #Compare Schedule A sources - if there are any differences warn the editor - a difference layer is only saved when there are differences
+    sched_a_diff = join(input_gdb, folder_basename+'_Sched_A_BCGW_Difference')
+    if save_differences(bcgw_schedule_a, final_schedule_a, sched_a_diff, spatial_reference, 'BCGW', 'Final'):
         arcpy.AddWarning('===== Warning: differences found in Schedule A: TFL Final and BCGW are not equal')
         arcpy.AddWarning('Make sure to check the _Sched_A_BCGW_Difference dataset in the working folder to review and resolve differences')
     else:
         arcpy.AddMessage('No differences found between TFL Final Schedule A and BCGW Schedule A')
-        arcpy.Delete_management(sched_a_diff)
 
-    if int(arcpy.GetCount_management(boundary_diff)[0]) > 0:
+    #Compare TFL Current View sources
+    boundary_diff = join(input_gdb, folder_basename+'_Boundary_BCGW_Difference')
+    if save_differences(bcgw_boundary, final_boundary, boundary_diff, spatial_reference, 'BCGW', 'Final'):
         arcpy.AddWarning('===== Warning: differences found in Boundary: TFL Final and BCGW are not equal')
         arcpy.AddWarning('Make sure to check the _Boundary_BCGW_Differenc dataset in the working folder to review and resolve differences\n')
     else:
         arcpy.AddMessage('No differences found between Final TFL Boundary and BCGW TFL Boundary\n')
-        arcpy.Delete_management(boundary_diff)
+
+def save_differences(left, right, out_fc, spatial_reference, left_label, right_label):
+    """Takes two frames of polygons (from geometry_tools.read_features) and finds the areas that are only
+    in one of them - matching features are skipped with a geometry hash so only changed features are
+    overlaid. If there are differences, saves them to out_fc with a SOURCE field (left_label or
+    right_label - the layer the area is only in) and returns True. Otherwise returns False"""
+    if arcpy.Exists(out_fc):
+        arcpy.Delete_management(out_fc)
+    differences = change_detection.difference_frame(left['geometry'].values, right['geometry'].values, left_label, right_label)
+    if not len(differences):
+        return(False)
+    geometry_tools.write_features(out_fc, differences, 'POLYGON', spatial_reference, change_detection.DIFFERENCE_FIELDS)
+    return(True)
 
 
 def update_change_history(table, timestamp, user):
@@ -410,4 +412,5 @@ def update_change_history(table, timestamp, user):
 
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('tfl_prepare_edits')
\ No newline at end of file
+    with instrumentation.run('TFL_Prepare_Edits', os.path.dirname(working_location)):
+        runapp('tfl_prepare_edits')
\ No newline at end of file
@@ -10,15 +10,18 @@
 
 
 # Import modules
-import arcpy, sys, os, datetime, shutil, getpass
+import arcpy, sys, os, datetime, shutil, getpass, glob
 from os.path import join
 from datetime import datetime
 import logging
 import re
+import pandas as pd
 import TFL_Config
 sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
 import geobc
 from utils.test_prod_check import test_in_working_dir
+from utils.coded_domain_validation import get_coded_values, table_to_data_frame
+from utils import attribute_rules, bcgw_connection, containment, geometry_tools, instrumentation, line_change_set, review_differences, review_map, review_preview, warehouse_mirror
 
 
 ###############################################################################
@@ -33,6 +36,15 @@ TFL_WORKING_FOLDERS = TFL_Path.EDITS_FOLDER
 TFL_FINAL_FOLDERS = TFL_Path.FINAL_FOLDER
 TFL_TEMPLATE_MAP = TFL_Path.TEMPLATE_MAP
 
+#Optional FileGDB copy of the warehouse layers to use instead of the BCGW (see utils.bcgw_connection.layer_path)
+LOCAL_WAREHOUSE = getattr(TFL_Config.Resources, 'LOCAL_WAREHOUSE_GDB', None)
+#Optional local mirror of the warehouse layers, read instead of the BCGW while fresh (see utils.warehouse_mirror)
+WAREHOUSE_MIRROR = getattr(TFL_Config.Resources, 'WAREHOUSE_MIRROR_GDB', None)
+
+#Difference layers drawn in the review previews, and the colour for each SOURCE (the layer an area is only in)
+PREVIEW_DIFFERENCES = ['_Boundary_Difference', '_Schedule_A_Difference', '_Boundary_BCGW_Difference', '_Sched_A_BCGW_Difference']
+PREVIEW_SOURCE_COLOURS = {'Working': 'red', 'Final': 'blue', 'BCGW': 'purple'}
+
 ###############################################################################
 # set up basic logging config
 log_file = os.path.join(os.path.dirname(working_location), 'tool_errors.log')
@@ -59,7 +71,8 @@ def runapp(TFL_Prepare_Review_Package):
     is_locked = ''
 
     # Call check_for_locks method to check the gdb - compact first to remove self locks
-    arcpy.Compact_management(input_gdb)
+    with instrumentation.stage('compact gdb'):
+        arcpy.Compact_management(input_gdb)
     gdb_object = geobc.GDBInfo(input_gdb)
     lock_owner_list = gdb_object.check_for_locks()
 
@@ -72,7 +85,7 @@ def runapp(TFL_Prepare_Review_Package):
     if is_locked == 'No' or is_locked == 'Self':
 
         #check the BCGW connection before doing any actual work
-        BCGWConnection = get_bcgw_connection(bcgw_uname,bcgw_pw)
+        BCGWConnection = bcgw_connection.get_connection(bcgw_uname,bcgw_pw,LOCAL_WAREHOUSE)
 
         if BCGWConnection: #only proceed if connection succeeds -
 
@@ -92,10 +105,16 @@ def runapp(TFL_Prepare_Review_Package):
                 #Create the draft change summary and add it to the folder - or Update if already there
                 create_update_readme(input_folder, tfl_number,input_gdb)
 
+                #Draw PNG/PDF previews of the changes beside the readme
+                create_review_previews(input_folder, tfl_number, input_gdb)
+
                 #Move folder to review area
                 try:
-                    arcpy.Copy_management(input_folder, TFL_REVIEW_FOLDERS + os.sep + input_tfl)
-                    arcpy.Compact_management(os.path.join(TFL_REVIEW_FOLDERS, input_tfl, 'Data', 'FADM_' + tfl_number + '.gdb'))
+                    with instrumentation.stage('copy to review'):
+                        arcpy.Copy_management(input_folder, TFL_REVIEW_FOLDERS + os.sep + input_tfl)
+                        instrumentation.count(bytes_copied=instrumentation.dataset_size(TFL_REVIEW_FOLDERS + os.sep + input_tfl))
+                    with instrumentation.stage('compact gdb'):
+                        arcpy.Compact_management(os.path.join(TFL_REVIEW_FOLDERS, input_tfl, 'Data', 'FADM_' + tfl_number + '.gdb'))
 
                     # copy_data(input_tfl, TFL_REVIEW_FOLDERS)
                     #message user and end script
@@ -121,6 +140,7 @@ def runapp(TFL_Prepare_Review_Package):
 ###############################################################################
 #checks to ensure that the check edits tool was run AFTER any edit datestamps
 #and that the check edits tool passed
+@instrumentation.timed('check prerequisites')
 def check_prerequisites(input_gdb,input_tfl, BCGWConnection):
     """Takes the input database, checks to see that check edits datestamp is
     after the last tracked edits on lines and Schedule A, and that the check
@@ -169,31 +189,23 @@ def check_prerequisites(input_gdb,input_tfl, BCGWConnection):
         arcpy.AddWarning('Edits done to TFL lines or Schedule A since last check - Run Check Edits tool before running Prepare Review Package tool')
         return(False)
 
+@instrumentation.timed('boundary attribute checks')
 def check_poly(tfl_poly, input_gdb, BCGWConnection):
     """Takes input poly feature class and input gdb, checks to make sure that all rows have a poly type and that it and leg tool are
         using domain values. Checks to ensure if replacement then that is only poly type. If replacement, adds timber licences
         to the gdb"""
     arcpy.AddMessage('Checking polygon attribute rules')
-    poly_type_values = get_coded_values(input_gdb,'POLY_TYPE') #get values for poly type domain
-    leg_tools_values = get_coded_values(input_gdb, 'Legislative_Tool')
-    #check the TFL_Boundary to make sure all features have a poly type
-    #also check if poly type is consistent (either ALL replacement - or combo of others)
-    poly_type_set = True
-    poly_types = set()
-    domain_error = set()
-    with arcpy.da.SearchCursor(tfl_poly,['Poly_Type', 'Legislative_Tool']) as cursor:
-        for row in cursor:
-            if row[0] is None:
-                poly_type_set = False
-            else:
-                if row[0] not in poly_type_values:
-                    domain_error.add('Poly_Type')
-                poly_types.add(row[0])
-            if row[1]:
-                if row[1] not in leg_tools_values:
-                    domain_error.add('Legislative_Tool')
-        del row
-    del cursor
+    domains = {'POLY_TYPE': get_coded_values(input_gdb,'POLY_TYPE'), #get values for poly type domain
+               'Legislative_Tool': get_coded_values(input_gdb, 'Legislative_Tool')}
+    #check the TFL_Boundary to make sure all features have a poly type, are using domain values
+    #and that poly type is consistent (either ALL replacement - or combo of others)
+    poly_df = table_to_data_frame(tfl_poly, input_fields=['Poly_Type', 'Legislative_Tool'])
+    results = attribute_rules.evaluate_rules(poly_df, attribute_rules.REVIEW_BOUNDARY_RULES, domains)
+    failed_rules = [result.rule for result in attribute_rules.failed(results, attribute_rules.ERROR)]
+
+    poly_type_set = attribute_rules.POLY_TYPE_MISSING not in failed_rules
+    domain_error = set(rule.field for rule in failed_rules if rule.predicate[0] == 'in_domain')
+    poly_types = set(poly_df['Poly_Type'].dropna())
     if domain_error:
         arcpy.AddWarning('WARNING: One or more TFL_Boundary features are not using domain values in ' + str(domain_error))
     if not poly_type_set:
@@ -223,52 +235,33 @@ def check_poly(tfl_poly, input_gdb, BCGWConnection):
         return(True)
 
 
+@instrumentation.timed('change detection')
 def save_changes_to_gdb(input_gdb,input_tfl,bcgw_connection):
     """ Takes input database. Finds line changes using last edited date stamp and saves those as separate dataset
-    finds area changes using symmetrical difference tool comparison to previous final and saves those (if any)"""
+    finds area changes by comparing to the previous final (and the previous final to BCGW) and saves those (if any)"""
 
     arcpy.env.workspace = input_gdb
 
     table_object = geobc.TableInfo()
     check_out_date = table_object.get_last_date(input_gdb + os.sep + input_tfl + '_Change_History','Date_Extracted')
-    check_out_date = check_out_date.strftime("%b %d %Y %H:%M:%S") #format to string for use in query
 
-    arcpy.AddMessage('Checked out on ' + check_out_date)
+    arcpy.AddMessage('Checked out on ' + check_out_date.strftime("%b %d %Y %H:%M:%S"))
     tfl_lines = current_tfl_layer_name + '_Line' 
     schedule_a = current_tfl_layer_name + '_Schedule_A' 
 
-    #make a feature layer of the boundary poly not including any deletion areas for the comparison
     boundary = current_tfl_layer_name + '_Boundary'
-    arcpy.MakeFeatureLayer_management(boundary, 'Boundary_fl', "Poly_Type <> 'Deletion'")
     boundary_final = final_tfl_layer_name + '_Boundary' 
     schedule_a_final = final_tfl_layer_name + '_Schedule_A' 
 
-    #make a feature layer of the changed lines - if there are any - save to database
-    if arcpy.Exists(input_gdb + os.sep + input_tfl + '_Line_Changes'):
-        arcpy.Delete_management(input_gdb + os.sep + input_tfl + '_Line_Changes')
-    changed_lines = arcpy.MakeFeatureLayer_management(tfl_lines,'lines_fl',"last_edited_date >  date '" + check_out_date + "'")
-    arcpy.CopyFeatures_management(changed_lines,input_gdb + os.sep + input_tfl + '_Line_Changes')
-    arcpy.Delete_management(changed_lines)
-
-    #Get a difference layer for the TFL Boundary (compare to TFL Final)
-    final_boundary_diff = join(input_gdb, input_tfl+'_Boundary_Difference')
+    #save the changed lines to the database - reused if the lines haven't been edited since they were last saved
+    line_change_set.get_change_set(input_gdb, tfl_lines, input_gdb + os.sep + input_tfl + '_Line_Changes', check_out_date)
 
-    if arcpy.Exists(final_boundary_diff):
-        arcpy.Delete_management(final_boundary_diff)
-
-    arcpy.SymDiff_analysis(boundary, 'Boundary_fl', final_boundary_diff)
-
-    #Difference layer TFL Schedule A from Final
-    final_sched_a_diff = join(input_gdb, input_tfl+'_Schedule_A_Difference')
-
-    if arcpy.Exists(final_sched_a_diff):
-        arcpy.Delete_management(final_sched_a_diff)
-    arcpy.SymDiff_analysis(schedule_a, schedule_a_final, final_sched_a_diff)
+    spatial_reference = arcpy.Describe(boundary_final).spatialReference
 
     #set up parameters for
     #Schedule A and Current boundary Difference layers from BCGW to final
-    tfl_whse = bcgw_connection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
-    sched_a_whse = bcgw_connection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A'
+    tfl_whse = warehouse_mirror.resolve(bcgw_connection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP', WAREHOUSE_MIRROR)
+    sched_a_whse = warehouse_mirror.resolve(bcgw_connection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A', WAREHOUSE_MIRROR)
 
     #get the format for the forest file ID for query
     if '_0' in input_tfl:
@@ -276,152 +269,115 @@ def save_changes_to_gdb(input_gdb,input_tfl,bcgw_connection):
     else:
         ffid = input_tfl.replace('_','')
 
-    bcgw_sched_a_diff = join(input_gdb, input_tfl+'_Sched_A_BCGW_Difference')    
-
-    bcgw_sched_a_fl = arcpy.MakeFeatureLayer_management(sched_a_whse, 'bcgw_sched_a_fl', "FOREST_FILE_ID = '" + ffid + "' AND RETIREMENT_DATE IS NULL")
-
-    if arcpy.Exists(bcgw_sched_a_diff):
-        arcpy.Delete_management(bcgw_sched_a_diff)
-
-    arcpy.SymDiff_analysis(bcgw_sched_a_fl, schedule_a_final, bcgw_sched_a_diff)
-    arcpy.Delete_management(bcgw_sched_a_fl)
-
-    #make a difference layer between previous final and BCGW
-    bcgw_boundary_diff = join(input_gdb, input_tfl + '_Boundary_BCGW_Difference')
-
-    bcgw_boundary_fl = arcpy.MakeFeatureLayer_management(tfl_whse,'bcgw_boundary_fl', "FOREST_FILE_ID = '" + ffid + "'")
-    if arcpy.Exists(bcgw_boundary_diff):
-        arcpy.Delete_management(bcgw_boundary_diff)
-    arcpy.SymDiff_analysis(bcgw_boundary_fl,'boundary_fl',bcgw_boundary_diff)
-    arcpy.Delete_management(bcgw_boundary_fl)
-    arcpy.Delete_management('boundary_fl')
-
-    #Check the difference layers - if there are any differences notify the editor - otherwise - delete them
-    #NOTE: this is pretty repetetive and should probably be within a function
-    if int(arcpy.GetCount_management(bcgw_sched_a_diff)[0]) > 0:
+    #The comparisons are independent - run them at the same time, each in its own process, and merge the
+    #results into the gdb. A difference layer is only saved when there are differences
+    #(the working boundary not including any deletion areas for the comparison)
+    comparisons = [
+        review_differences.comparison(input_tfl + '_Sched_A_BCGW_Difference', (sched_a_whse, "FOREST_FILE_ID = '" + ffid + "' AND RETIREMENT_DATE IS NULL"),
+                                      (schedule_a_final, None), 'BCGW', 'Final'),
+        review_differences.comparison(input_tfl + '_Boundary_BCGW_Difference', (tfl_whse, "FOREST_FILE_ID = '" + ffid + "'"),
+                                      (boundary_final, None), 'BCGW', 'Final'),
+        review_differences.comparison(input_tfl + '_Schedule_A_Difference', (schedule_a, None), (schedule_a_final, None), 'Working', 'Final'),
+        review_differences.comparison(input_tfl + '_Boundary_Difference', (boundary, "Poly_Type <> 'Deletion'"), (boundary_final, None), 'Working', 'Final')]
+    found = review_differences.build_differences(comparisons, input_gdb, spatial_reference)
+
+    if found[input_tfl + '_Sched_A_BCGW_Difference']:
         arcpy.AddMessage('Differences found between final Schedule A and BCGW Schedule A -- Saving difference layer')
     else:
         arcpy.AddMessage('No differences found between final Schedule A and BCGW Schedule A')
-        arcpy.Delete_management(bcgw_sched_a_diff)
 
-    if int(arcpy.GetCount_management(bcgw_boundary_diff)[0]) > 0:
+    if found[input_tfl + '_Boundary_BCGW_Difference']:
         arcpy.AddMessage('Differences found between final boundary and BCGW boundary -- Saving difference layer')
     else:
         arcpy.AddMessage('No differences between final Boundary and BCGW boundary')
-        arcpy.Delete_management(bcgw_boundary_diff)
 
-    if int(arcpy.GetCount_management(final_sched_a_diff)[0]) > 0:
+    if found[input_tfl + '_Schedule_A_Difference']:
         arcpy.AddMessage('Difference found between working and final Schedule A -- Saving difference')
     else:
         arcpy.AddMessage('No differences found between working and final Schedule A')
-        arcpy.Delete_management(final_sched_a_diff)
 
-    if int(arcpy.GetCount_management(final_boundary_diff)[0]) > 0:
+    if found[input_tfl + '_Boundary_Difference']:
         arcpy.AddMessage('Differences found between working and final boundary - Saving difference layer\n')
     else:
         arcpy.AddMessage('No differences found between working and final boundary\n')
-        arcpy.Delete_management(final_boundary_diff)
 
 
 def difference_layer_check(gdb_difference_layer):
     pass
 
+@instrumentation.timed('create review map')
 def create_review_map(inputgdb,input_tfl):
-    """Takes input database and makes a copy of the review template. Checks for all derived layers in the edit
-    database and if they exist, updates the path to the edit version. Updates path for all base layers.
-    saves the copy of the review map document"""
-    derived_layers_to_update = ['TFL_XX_Line_Changes','TFL_XX_Boundary_BCGW_Difference','TFL_XX_Boundary_Difference','TFL_XX_Sched_A_BCGW_Difference','TFL_XX_Schedule_A_Difference']
-    base_layers_to_update = ['TFL_XX_Line','TFL_XX_Boundary','TFL_XX_Schedule_A']
-    #delete previous doc if there is one
-    temp_map = input_folder + os.sep + 'arcgisprojects' + os.sep + input_tfl + '_Temp.mxd'
-    review_map = input_folder + os.sep + 'arcgisprojects' + os.sep + input_tfl + '_Review.mxd'
-    if os.path.exists(review_map):
-        os.remove(review_map)
-
-    #copy the template with the new name
-    shutil.copy(TFL_TEMPLATE_MAP,temp_map)
-
-    #update the data sources to the working data
-    mxd = arcpy.mapping.MapDocument(temp_map)
-    for data_frame in arcpy.mapping.ListDataFrames(mxd):
-        for layer in arcpy.mapping.ListLayers(mxd):
-            if layer.supports('DATASOURCE'):
-                if layer.datasetName in derived_layers_to_update:
-                    if arcpy.Exists(inputgdb + os.sep + layer.datasetName.replace('TFL_XX',input_tfl)):
-                        layer.replaceDataSource(inputgdb,"FILEGDB_WORKSPACE", layer.datasetName.replace('TFL_XX',input_tfl))
-                        layer.name = layer.datasetName.replace('TFL_XX',input_tfl)
-                    else:
-                        arcpy.mapping.RemoveLayer(data_frame,layer)
-                elif layer.datasetName in base_layers_to_update:
-                    if arcpy.Exists(inputgdb + os.sep + 'TFL_Data' + os.sep + layer.datasetName.replace('TFL_XX',input_tfl)):
-                        layer.replaceDataSource(inputgdb,"FILEGDB_WORKSPACE", layer.datasetName.replace('TFL_XX',input_tfl))
-                        layer.name = layer.datasetName.replace('TFL_XX',input_tfl)
-##                    else:
-##                        #IAN - addWarning('shouldn't remove')
-##                        arcpy.mapping.RemoveLayer(data_frame,layer)
-    mxd.saveACopy(review_map)
-    del mxd
-    del review_map
-    os.remove(temp_map)
+    """Takes input database and saves a copy of the review template (.mxd or .aprx) with the layers pointed at the
+    edit version. Derived layers are removed from the map if they don't exist in the database"""
+    review_map_path = input_folder + os.sep + 'arcgisprojects' + os.sep + input_tfl + '_Review' + os.path.splitext(TFL_TEMPLATE_MAP)[1]
+    review_map.build_review_map(TFL_TEMPLATE_MAP, inputgdb, input_tfl, review_map_path)
 
 
+@instrumentation.timed('Schedule A within boundary')
 def check_schedule_a_is_within(tfl_basename, input_gdb):
     """Takes input edit database and checks to ensure that all schedule A land is
-    within the newly created/updated TFL Boundary. Returns False if Schedule A
-    exists outside of boundary and True if all Schedule A is within"""
-    arcpy.env.workspace = input_gdb
-
-    if arcpy.Exists(input_gdb + os.sep + 'schedule_a_outside'):
-        arcpy.Delete_management(input_gdb + os.sep + 'schedule_a_outside')
-
-    arcpy.AddMessage('Lookingfor boundary at : ' + input_gdb + os.sep + tfl_basename + '_Boundary')
-
-    tfl_boundary = arcpy.MakeFeatureLayer_management(input_gdb + os.sep + tfl_basename + '_Boundary','tfl_boundary')
-    tfl_schedule_a = arcpy.MakeFeatureLayer_management(input_gdb + os.sep + tfl_basename + '_Schedule_A', 'tfl_schedule_a')
-    schedule_a_outside = arcpy.Erase_analysis(tfl_schedule_a,tfl_boundary,'schedule_a_outside')
-    arcpy.Delete_management(tfl_boundary)
-    arcpy.Delete_management(tfl_schedule_a)
-    if int(arcpy.GetCount_management(schedule_a_outside)[0])>0:
+    within the TFL Boundary, in memory. Only the parts of Schedule A outside the boundary
+    (larger than the area tolerance) are saved, to the schedule_a_outside feature class.
+    Returns False if Schedule A exists outside of boundary and True if all Schedule A is within"""
+    outside_fc = input_gdb + os.sep + 'schedule_a_outside'
+    if arcpy.Exists(outside_fc):
+        arcpy.Delete_management(outside_fc)
+
+    tfl_boundary = join(input_gdb, 'TFL_Data', tfl_basename + '_Boundary')
+    spatial_reference = arcpy.Describe(tfl_boundary).spatialReference
+    boundary = geometry_tools.read_features(tfl_boundary)
+    schedule_a = geometry_tools.read_features(join(input_gdb, 'TFL_Data', tfl_basename + '_Schedule_A'))
+    outside = containment.find_outside(schedule_a['geometry'].values, boundary['geometry'].values)
+    if outside:
+        outside_df = pd.DataFrame([(int(schedule_a.index[index]), geometry) for index, geometry in outside],
+                                  columns=['SCHEDULE_A_OID', 'geometry'])
+        geometry_tools.write_features(outside_fc, outside_df, 'POLYGON', spatial_reference, [('SCHEDULE_A_OID', 'LONG', None)])
         arcpy.AddWarning('ERROR: Found Schedule A polygons outside of TFL Boundary - please review the schedule_a_outside feature class and fix before re-submitting')
         return(False)
     else:
         arcpy.AddMessage('Schedule A is all within the boundary')
-        arcpy.Delete_management(schedule_a_outside)
         return(True)
   
 
+@instrumentation.timed('timber licences')
 def get_timber_licences(tfl_poly, input_gdb, BCGW_Connection):
     """Used only when change is replacement. Takes the TFL Poly and finds all
-       Timber Licenses that are within. Adds the list of licenses to the email
-       message text so that FADM staff can confirm with FTB if they should be
-       included in the TFL"""
-    timber_licences = []
-    bcgw_timber_licence = BCGW_Connection + '\\WHSE_FOREST_TENURE.FTEN_TIMBER_LICENCE_POLY_SVW'
-    arcpy.env.workspace = input_gdb
-    #make a point layer from the timber licenses to check within
-    temp_points = arcpy.FeatureToPoint_management(bcgw_timber_licence,'Temp_TL_Points', "INSIDE")
-    #make a feature layer of the points to allow a selection
-    temp_points_fl = arcpy.MakeFeatureLayer_management(temp_points,'temp_points_fl')
-    #make a feature layer of the active timber licences - we will select into this layer after using points to intersect (avoids intersect on edges)
-    timber_licence_fl = arcpy.MakeFeatureLayer_management(bcgw_timber_licence, 'timber_licence_fl', "LIFE_CYCLE_STATUS_CODE = 'ACTIVE'")
-    arcpy.SelectLayerByLocation_management(temp_points_fl,'INTERSECT',tfl_poly)
-    #then select the timber licences that intersect these points
-    arcpy.SelectLayerByLocation_management(timber_licence_fl,'INTERSECT',temp_points_fl)
-    #delete if the timber licences exists, then create
+       active Timber Licenses that are within (their interior point is inside the TFL).
+       Only licences within the envelope of the TFL are read, and the points are
+       tested in memory. Saves the licences to Timber_Licence in the input gdb and
+       returns the list of forest file IDs so that FADM staff can confirm with FTB
+       if they should be included in the TFL"""
+    bcgw_timber_licence = warehouse_mirror.resolve(BCGW_Connection, 'WHSE_FOREST_TENURE.FTEN_TIMBER_LICENCE_POLY_SVW', WAREHOUSE_MIRROR)
+    spatial_reference = arcpy.Describe(tfl_poly).spatialReference
+    boundary = geometry_tools.read_features(tfl_poly)
+
+    #only the active licences within the envelope of the TFL are candidates
+    candidates = geometry_tools.read_features(bcgw_timber_licence, ['FOREST_FILE_ID'], "LIFE_CYCLE_STATUS_CODE = 'ACTIVE'",
+                                              spatial_filter=geometry_tools.envelope(boundary['geometry'], spatial_reference),
+                                              spatial_reference=spatial_reference)
+    #use a point inside each licence to test (avoids matching licences that only share an edge with the TFL)
+    within = containment.interior_points_within(candidates['geometry'].values, boundary['geometry'].values)
+    timber_licences = candidates[within]
+
+    #delete if the timber licences exists, then create - copied from the source so all licence attributes are kept
     if arcpy.Exists(input_gdb + os.sep + 'Timber_Licence'):
         arcpy.Delete_management(input_gdb + os.sep + 'Timber_Licence')
+    oid_field = arcpy.Describe(bcgw_timber_licence).OIDFieldName
+    if len(timber_licences):
+        where_clause = oid_field + ' IN (' + ','.join(str(oid) for oid in timber_licences.index) + ')'
+    else:
+        where_clause = '1 = 0'
+    timber_licence_fl = arcpy.MakeFeatureLayer_management(bcgw_timber_licence, 'timber_licence_fl', where_clause)
     arcpy.CopyFeatures_management(timber_licence_fl,input_gdb + os.sep + 'Timber_Licence')
-
-    with arcpy.da.SearchCursor(temp_points_fl,['FOREST_FILE_ID']) as cursor:
-        for row in cursor:
-            arcpy.AddMessage('found forest file ID : ' + row[0])
-
-    arcpy.Delete_management(temp_points)
-    arcpy.Delete_management(temp_points_fl)
     arcpy.Delete_management(timber_licence_fl)
 
+    for forest_file_id in timber_licences['FOREST_FILE_ID']:
+        arcpy.AddMessage('found forest file ID : ' + str(forest_file_id))
+    return list(timber_licences['FOREST_FILE_ID'])
 
 
+
+@instrumentation.timed('create readme')
 def create_update_readme(input_folder,input_tfl, input_gdb):
     """Takes the input Change Description and Change Summary text and creates a readme
     file in the working directory. Overwrites if there is one already.
@@ -453,37 +409,39 @@ def create_update_readme(input_folder,input_tfl, input_gdb):
         del row
     del cursor
 
-
-def get_coded_values(gdb, domain_name):
-    """takes a gdb object and a string of a domain name, returns a list of domain values.
-       NOTE: only works for coded value domains"""
-    domains = arcpy.da.ListDomains(gdb)
-    domain_list = []
-    for domain in domains:
-        if domain.name == domain_name:
-            values = domain.codedValues
-            for val in values.items():
-                domain_list.append(val[0])
-
-    return(domain_list)
-
-def get_bcgw_connection(bcgw_uname, bcgw_pw):
-# SET UP BCGW CONNECTION -----------------------------------------------------------------
-    arcpy.AddMessage(" ")
-    arcpy.AddMessage("Setting up the BCGW connection...\n")
-
-    # Run the  "BCGWConnectionFileModule.create" function which creates the BCGW
-    # connection file and save the pathname to the variable "BCGWConnection"
-    connection = geobc.BCGWConnection()
-    success = connection.create_bcgw_connection_file(bcgw_uname,bcgw_pw)
-    if success:
-        BCGWConnection = connection.bcgw_connection_file
-    else:
-        BCGWConnection = False
-    #-----------------------------------------------------------------------------------------
-    return BCGWConnection
+@instrumentation.timed('review previews')
+def create_review_previews(input_folder, input_tfl, input_gdb):
+    """Draws PNG and PDF previews of the boundary, line changes and difference layers (an overview plus
+    close-ups where there are changes) to the documents folder, so reviewers can see the changes without
+    opening the review map. Replaces any previous previews"""
+    if not review_preview.available():
+        arcpy.AddWarning('matplotlib is not available - review previews were not created')
+        return
+
+    out_base = input_folder + os.sep + 'documents' + os.sep + input_tfl + '_preview'
+    for old_preview in glob.glob(out_base + '*'):
+        os.remove(old_preview)
+
+    boundary = geometry_tools.read_features(current_tfl_layer_name + '_Boundary')
+    layers = [{'label': 'Boundary', 'geometries': boundary['geometry'].values, 'color': 'black', 'fill': False}]
+    for suffix in PREVIEW_DIFFERENCES:
+        difference_fc = join(input_gdb, input_tfl + suffix)
+        if arcpy.Exists(difference_fc):
+            differences = geometry_tools.read_features(difference_fc, ['SOURCE'])
+            for source, group in differences.groupby('SOURCE'):
+                layers.append({'label': suffix.strip('_').replace('_', ' ') + ' - only in ' + source,
+                               'geometries': group['geometry'].values, 'color': PREVIEW_SOURCE_COLOURS.get(source, 'orange'),
+                               'fill': True, 'change': True})
+    line_changes = join(input_gdb, input_tfl + '_Line_Changes')
+    if arcpy.Exists(line_changes):
+        layers.append({'label': 'Line changes', 'geometries': geometry_tools.read_features(line_changes)['geometry'].values,
+                       'color': 'green', 'fill': False, 'change': True})
+
+    previews = review_preview.render_previews(layers, input_tfl.replace('_', ' ') + ' review', out_base)
+    arcpy.AddMessage('Saved {} review preview files to the documents folder'.format(len(previews)))
 
 
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('TFL_Prepare_Review_Package')
\ No newline at end of file
+    with instrumentation.run('TFL_Prepare_Review_Package', os.path.dirname(working_location)):
+        runapp('TFL_Prepare_Review_Package')
\ No newline at end of file
@@ -16,7 +16,7 @@ import re
 import TFL_Config
 sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
 import geobc
-from utils import coded_domain_validation
+from utils import coded_domain_validation, instrumentation
 from utils.test_prod_check import test_in_working_dir
 
 
@@ -67,7 +67,10 @@ def runapp(tfl_set_to_pending):
             arcpy.AddMessage('Check for locks after get editor: ' + str(lock_owner_list))
             if not user == edit_user:
 
-                errors = coded_domain_validation.validate_domains(input_gdb, workspace)
+                report_table = os.path.join(input_gdb, tfl_number + '_Validation_Report')
+                report_json = os.path.join(input_folder, 'documents', tfl_number + '_validation_report.json')
+                with instrumentation.stage('domain validation'):
+                    errors = coded_domain_validation.validate_domains(input_gdb, workspace, report_table=report_table, report_json=report_json)
 
                 if not errors:
                     arcpy.AddMessage('\nNo attribute value errors found')
@@ -85,10 +88,13 @@ def runapp(tfl_set_to_pending):
                     gdb_object = geobc.GDBInfo(input_gdb)
                     lock_owner_list = gdb_object.check_for_locks()
                     arcpy.AddMessage('Check for locks after setting reviewer ' + str(lock_owner_list))
-                    arcpy.CompressFileGeodatabaseData_management(input_gdb) #compress gdb to prevent changes from here to final
+                    with instrumentation.stage('compress gdb'):
+                        arcpy.CompressFileGeodatabaseData_management(input_gdb) #compress gdb to prevent changes from here to final
                     if not lock_owner_list:
                         try:
-                            shutil.copytree(input_folder,TFL_PENDING_FOLDERS + os.sep + input_tfl)
+                            with instrumentation.stage('copy to pending'):
+                                shutil.copytree(input_folder,TFL_PENDING_FOLDERS + os.sep + input_tfl)
+                                instrumentation.count(bytes_copied=instrumentation.dataset_size(TFL_PENDING_FOLDERS + os.sep + input_tfl))
                             #message user and end script
                             arcpy.AddMessage('Copied - TFL folder to 4_TFL_Pending folder')
                             try:
@@ -111,6 +117,7 @@ def runapp(tfl_set_to_pending):
 ###############################################################################
 ## Functions section
 ###############################################################################
+@instrumentation.timed('remove topology')
 def remove_topology_and_active_lines(workspace):
     """Removes topology from the database"""
     arcpy.env.workspace = workspace
@@ -155,4 +162,5 @@ def set_reviewer(user):
 
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('set_to_pending')
\ No newline at end of file
+    with instrumentation.run('TFL_Set_To_Pending', os.path.dirname(working_location)):
+        runapp('set_to_pending')
\ No newline at end of file
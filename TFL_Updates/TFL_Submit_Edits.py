@@ -17,6 +17,7 @@ import TFL_Config
 sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
 import geobc
 from utils.test_prod_check import test_in_working_dir
+from utils import bcgw_connection, cadastre_intersection, geometry_tools, instrumentation, line_change_set, staging_writer, warehouse_mirror
 
 
 ###############################################################################
@@ -33,8 +34,13 @@ TFL_STAGING_FOLDER = TFL_Path.STAGING
 TFL_PENDING_FOLDERS = TFL_Path.PENDING_FOLDERS
 TFL_FINAL_FOLDERS = TFL_Path.FINAL_FOLDER
 TFL_ARCHIVE = TFL_Path.ARCHIVE
-PMBC = r'\\WHSE_CADASTRE.PMBC_PARCEL_FABRIC_POLY_SVW'
-TANTALIS = r'\\WHSE_TANTALIS.TA_SURVEY_PARCELS_SVW'
+PMBC = 'WHSE_CADASTRE.PMBC_PARCEL_FABRIC_POLY_SVW'
+TANTALIS = 'WHSE_TANTALIS.TA_SURVEY_PARCELS_SVW'
+
+#Optional FileGDB copy of the warehouse layers to use instead of the BCGW (see utils.bcgw_connection.layer_path)
+LOCAL_WAREHOUSE = getattr(TFL_Config.Resources, 'LOCAL_WAREHOUSE_GDB', None)
+#Optional local mirror of the warehouse layers, read instead of the BCGW while fresh (see utils.warehouse_mirror)
+WAREHOUSE_MIRROR = getattr(TFL_Config.Resources, 'WAREHOUSE_MIRROR_GDB', None)
 ###################################################################################
 # set up basic logging config
 log_file = os.path.join(os.path.dirname(working_location), 'tool_errors.log')
@@ -92,7 +98,7 @@ def runapp(tfl_submit_edits):
     if check_input_parameters():
 
         #establish the BCGW connection to check the schedule A AND TFL Boundary
-        BCGWConnection = get_bcgw_connection(bcgw_uname,bcgw_pw)
+        BCGWConnection = bcgw_connection.get_connection(bcgw_uname,bcgw_pw,LOCAL_WAREHOUSE)
 
         if not BCGWConnection is False: #only proceed if connection succeeds
 
@@ -113,44 +119,59 @@ def runapp(tfl_submit_edits):
                 #Check for locks on all the output datasets to update - only proceed if clear
                 if not check_outputs_for_locks(datasets_to_update):
                     #first uncompress the gdb, needed for updating submitter and adding intersecting cadastre
-                    arcpy.UncompressFileGeodatabaseData_management(input_gdb)
-
-                    #Remove the previous TFL from the TFL overview and add the updated one
-                    update_tfl_overview()
-
-                    if 'Replacement' in datasets_to_update:
-                        update_tfl_agreement()
-
-                    if 'Addition' in datasets_to_update:
-                        #if a single instrument, first set skey on the local data based on the inputs - also updates input fields
-                        if change_type == 'Instrument - Single':
-                            if tfl_component == 'Schedule A':
-                                update_skey('Addition', 831)
-                            else:
-                                update_skey('Addition', 832)
-                        update_tfl_addition()
-
-                    if 'Deletion' in datasets_to_update:
-                        #if a single instrument, first set skey on the local data based on the inputs
-                        if change_type == 'Instrument - Single':
-                            if tfl_component == 'Schedule A':
-                                update_skey('Deletion', 835)
-                            else:
-                                update_skey('Deletion', 836)
-                        update_tfl_deletion()
-
-                    if 'Schedule_A' in datasets_to_update:
-                        update_tfl_schedule_a()
-
-                    #Update the change history with the submitter and datestamp
-                    check_out_date = check_out_date.strftime("%b %d %Y %H:%M:%S") #format to string for use in query
-                    update_submitter(check_out_date)
-
-                    #Create copy of cadastre that intersects TFL lines and add to final folder
-                    intersect_cadastre(BCGWConnection,datasets_to_update,check_out_date)
-
-                    #Compress the database now to prevent accidental edits
-                    arcpy.CompressFileGeodatabaseData_management(input_gdb)
+                    with instrumentation.stage('uncompress gdb'):
+                        arcpy.UncompressFileGeodatabaseData_management(input_gdb)
+
+                    staging_updated = False
+                    try:
+                        #Staging is updated all-or-nothing - each update adds its staging feature class to the transaction,
+                        #the new rows are staged and checked, then all targets are committed together (rolled back on failure)
+                        transaction = staging_writer.StagingTransaction()
+
+                        #Remove the previous TFL from the TFL overview and add the updated one
+                        update_tfl_overview(transaction)
+
+                        if 'Replacement' in datasets_to_update:
+                            update_tfl_agreement(transaction)
+
+                        if 'Addition' in datasets_to_update:
+                            #if a single instrument, first set skey on the local data based on the inputs - also updates input fields
+                            if change_type == 'Instrument - Single':
+                                if tfl_component == 'Schedule A':
+                                    update_skey('Addition', 831)
+                                else:
+                                    update_skey('Addition', 832)
+                            update_tfl_addition(transaction)
+
+                        if 'Deletion' in datasets_to_update:
+                            #if a single instrument, first set skey on the local data based on the inputs
+                            if change_type == 'Instrument - Single':
+                                if tfl_component == 'Schedule A':
+                                    update_skey('Deletion', 835)
+                                else:
+                                    update_skey('Deletion', 836)
+                            update_tfl_deletion(transaction)
+
+                        if 'Schedule_A' in datasets_to_update:
+                            update_tfl_schedule_a(transaction)
+
+                        staging_updated = transaction.run()
+                        arcpy.Delete_management(input_gdb + os.sep + 'TFL_Boundary_dissolve')
+
+                        if staging_updated:
+                            #Update the change history with the submitter and datestamp
+                            update_submitter(check_out_date.strftime("%b %d %Y %H:%M:%S")) #format to string for use in query
+
+                            #Create copy of cadastre that intersects TFL lines and add to final folder
+                            intersect_cadastre(BCGWConnection,datasets_to_update,check_out_date)
+                    finally:
+                        #Compress the database now to prevent accidental edits - also when the submission stops
+                        with instrumentation.stage('compress gdb'):
+                            arcpy.CompressFileGeodatabaseData_management(input_gdb)
+
+                    if not staging_updated:
+                        arcpy.AddError('Submission stopped - the TFL has been left in the Pending folder')
+                        return
 
                     #Move the review package folder to the new final and rename it with datestamp
                     move_and_archive()
@@ -204,23 +225,7 @@ def check_input_parameters():
 
     return input_check
 
-def get_bcgw_connection(bcgw_uname, bcgw_pw):
-# SET UP BCGW CONNECTION -----------------------------------------------------------------
-    arcpy.AddMessage(" ")
-    arcpy.AddMessage("Setting up the BCGW connection...")
-
-    # Run the  "BCGWConnectionFileModule.create" function which creates the BCGW
-    # connection file and save the pathname to the variable "BCGWConnection"
-    connection = geobc.BCGWConnection()
-    success = connection.create_bcgw_connection_file(bcgw_uname,bcgw_pw)
-    if success:
-        BCGWConnection = connection.bcgw_connection_file
-    else:
-        BCGWConnection = False
-    #-----------------------------------------------------------------------------------------
-    return BCGWConnection
-
-
+@instrumentation.timed('get update list')
 def get_update_list(check_out_date,BCGWConnection):
     """Checks the output poly types in the TFL boundary and the edit date on the
        schedule A and returns a list of datasets to update."""
@@ -237,7 +242,7 @@ def get_update_list(check_out_date,BCGWConnection):
     #Refactor - First check if there is any Schedule A for this TFL in the warehouse - if not - no update
 
     #If there is in warehouse - check if the difference layer exists (from prepare review package tool) if so, update
-    sched_a_whse = BCGWConnection + '\\WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A'
+    sched_a_whse = warehouse_mirror.resolve(BCGWConnection, 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A', WAREHOUSE_MIRROR)
 
     #get the format for the forest file ID for query - remove underscores and leading 0
     if '_0' in input_tfl:
@@ -266,6 +271,7 @@ def get_update_list(check_out_date,BCGWConnection):
         update_list.add('Schedule_A')
     return(update_list)
 
+@instrumentation.timed('check output locks')
 def check_outputs_for_locks(datasets_to_update):
 
     # Call check_for_locks method on overview first - this is always updated in normal flow
@@ -314,25 +320,18 @@ def check_outputs_for_locks(datasets_to_update):
 
     return False
 
-def update_tfl_overview():
-    """Makes a backup copy of TFL Overview in staging then deletes the previous
-       backup. Takes any TFL Poly features tagged as overview, addition or replacement,
-       merges them and then adds them to the new TFL overview in staging. Updates
+@instrumentation.timed('prepare TFL overview')
+def update_tfl_overview(transaction):
+    """Adds the TFL Overview in staging to the transaction - the features for the TFL are replaced
+       (and kept in an undo feature class for rollback, see utils.staging_writer). Takes any TFL Poly features
+       tagged as overview, addition or replacement, merges them to make the new TFL overview. Sets
        The required fields in the new features"""
     #create a feature layer that merges the addition and current view polygons - dissolve to a single feature
     where_clause = "(Poly_Type='Addition') OR (Poly_Type='Current_View')OR (Poly_Type='Replacement')"
     boundary_fl = arcpy.MakeFeatureLayer_management(tfl_poly,'TFL_Boundary_all',where_clause)
     arcpy.Dissolve_management('TFL_Boundary_all','TFL_Boundary_dissolve','FOREST_FILE_ID')
     arcpy.Delete_management(boundary_fl)
-    #make a backup copy of the staging overview dataset - delete the old backup first
-    arcpy.Delete_management(staging_overview + '_BACKUP')
-    arcpy.Copy_management(staging_overview,staging_overview + '_BACKUP')
-    #delete the features for the current TFL from overview
-    overview_fl = arcpy.MakeFeatureLayer_management(staging_overview,'TFL_Overview_FL', "FOREST_FILE_ID = '" + forest_file_id + "'")
-    arcpy.DeleteFeatures_management('TFL_Overview_FL')
-    #append the new overview
-    arcpy.Append_management('TFL_Boundary_dissolve',staging_overview,'NO_TEST')
-    #update the licensee in the overview - use the lookup to find it
+    #get the licensee for the overview - use the lookup to find it
     licensee_lookup = r'\\spatialfiles.bcgov\ilmb\dss\projects\Mflnro\FADM_Tree_Farm_Licences\TFL_templates\data\TFL_Lookup_Tables.gdb\Licensee_Lookup'
     where_clause = "FOREST_FILE_ID = '" + forest_file_id + "'"
     fields = ['FOREST_FILE_ID','LICENCEE']
@@ -341,201 +340,34 @@ def update_tfl_overview():
             licensee = row[1]
     #edit code to reflect the schema change: remove WHO_UPDATED, OBJECT_VERSION_SKEY, FEATURE_CODE
     #change COMMENTS to DESCRIPTION, DOCUMENT_TYPE to LEGISLATIVE_TOOL, INS_AMD_ID to DOCUMENT_NUMBER
-    #fields = ['FOREST_FILE_ID','LICENCEE','TFL_TYPE', 'FEATURE_CLASS_SKEY','WHEN_UPDATED','WHO_UPDATED']
-    fields = ['FOREST_FILE_ID','LICENCEE','TFL_TYPE', 'FEATURE_CLASS_SKEY','WHEN_UPDATED']
-    with arcpy.da.UpdateCursor(staging_overview,fields,where_clause) as cursor:
-        for row in cursor:
-            row[1] = licensee
-            row[2] = 'See Licence'
-            row[3] = 830
-            row[4] = submitted_timestamp
-            #row[5] = 'GeoBC'
-            cursor.updateRow(row)
-    arcpy.Delete_management(input_gdb + os.sep + 'TFL_Boundary_dissolve')
-    arcpy.Delete_management(overview_fl)
-    arcpy.AddMessage('Updated TFL Overview in Staging folder')
-    print('Updated TFL Overview in Staging folder')
-
-def update_tfl_agreement():
-    """Makes a backup copy of TFL Agreement in staging then deletes the previous
-       backup. Removes features for the TFL from the staging agreement then
-       takes any TFL Poly features tagged as replacement, and adds them
-       to the TFL Agreement in staging. Updates the required fields in the new features"""
-    #make a backup copy of the staging agreement dataset - delete the old backup first
-    arcpy.Delete_management(staging_agreement_bdy + '_BACKUP')
-    arcpy.Copy_management(staging_agreement_bdy,staging_agreement_bdy + '_BACKUP')
-    #delete the features for the current TFL from agreement
-    arcpy.MakeFeatureLayer_management(staging_agreement_bdy,'TFL_Agreement_FL', "FOREST_FILE_ID = '" + forest_file_id + "'")
-    arcpy.DeleteFeatures_management('TFL_Agreement_FL')
-    arcpy.Delete_management('TFL_Agreement_FL')
-    #append the new agreement boundary
-    arcpy.Append_management(tfl_poly,staging_agreement_bdy,'NO_TEST')
-    #update the required fields in the new record
-    where_clause = "FOREST_FILE_ID = '" + forest_file_id + "'"
-    #fields = ['FOREST_FILE_ID','EFFECTIVE_DATE','FEATURE_CLASS_SKEY','WHO_UPDATED','WHEN_UPDATED']
-    fields = ['FOREST_FILE_ID','EFFECTIVE_DATE','FEATURE_CLASS_SKEY','WHEN_UPDATED']
-    with arcpy.da.UpdateCursor(staging_agreement_bdy,fields,where_clause) as cursor:
-        for row in cursor:
-            row[1] = effective_date
-            row[2] = 830
-            #row[3] = 'GeoBC'
-            #row[4] = submitted_timestamp
-            row[3] = submitted_timestamp
-            cursor.updateRow(row)
-    arcpy.AddMessage('Updated TFL Agreement Boundary in Staging folder')
-
-def update_tfl_addition():
-    """Makes a backup copy of TFL Addition in staging then deletes the previous
-       backup. Takes any TFL Poly features tagged as addition, and adds them
-       to the new TFL Addition in staging."""
-    #create a feature layer
-    where_clause = "Poly_Type='Addition'"
-    TFL_Boundary_addition = arcpy.MakeFeatureLayer_management(tfl_poly,'TFL_Boundary_addition',where_clause)
-    #make a backup copy of the staging overview dataset - delete the old backup first
-    arcpy.Delete_management(staging_addition + '_BACKUP')
-    arcpy.Copy_management(staging_addition,staging_addition + '_BACKUP')
-    count = arcpy.GetCount_management(TFL_Boundary_addition)
-    arcpy.AddMessage('Appending ' + str(count) + ' additions to staging')
-
-    #make a field map for the deletion feature layer
-    field_mappings_addition = arcpy.FieldMappings()
-    #legislative tool
-    f_map_tool = arcpy.FieldMap()
-    f_map_tool.addInputField(TFL_Boundary_addition, 'Legislative_Tool')
-    tool                  = f_map_tool.outputField
-    #change the field name from document_type to legislative_tool by YJ
-    tool.name             = 'Legislative_Tool'
-    f_map_tool.outputField  = tool
-    field_mappings_addition.addFieldMap(f_map_tool)
-    #document number
-    f_map_number = arcpy.FieldMap()
-    f_map_number.addInputField(TFL_Boundary_addition, 'Document_Number')
-    number                  = f_map_number.outputField
-    #change INS_AMD_ID TO DOCUMENT_NUMBER by yj
-    number.name             = 'DOCUMENT_NUMBEER'
-    f_map_number.outputField  = number
-    field_mappings_addition.addFieldMap(f_map_number)
-    #description
-    f_map_description = arcpy.FieldMap()
-    f_map_description.addInputField(TFL_Boundary_addition, 'Description')
-    description             = f_map_description.outputField
-    #change COMMENTS to DESCRIPTION by yj
-    description.name        = 'Description'
-    f_map_description.outputField  = description
-    field_mappings_addition.addFieldMap(f_map_description)
-    #Forest File ID
-    f_map_ffid = arcpy.FieldMap()
-    f_map_ffid.addInputField(TFL_Boundary_addition, 'FOREST_FILE_ID')
-    ffid             = f_map_ffid.outputField
-    ffid.name        = 'FOREST_FILE_ID'
-    f_map_ffid.outputField  = ffid
-    field_mappings_addition.addFieldMap(f_map_ffid)
-    #Feature class skey
-    f_map_skey = arcpy.FieldMap()
-    f_map_skey.addInputField(TFL_Boundary_addition, 'FEATURE_CLASS_SKEY')
-    skey             = f_map_skey.outputField
-    skey.name        = 'FEATURE_CLASS_SKEY'
-    f_map_skey.outputField  = skey
-    field_mappings_addition.addFieldMap(f_map_skey)
-    #effective date
-    f_map_date = arcpy.FieldMap()
-    f_map_date.addInputField(TFL_Boundary_addition, 'EFFECTIVE_DATE')
-    date             = f_map_date.outputField
-    date.name        = 'EFFECTIVE_DATE'
-    f_map_date.outputField  = date
-    field_mappings_addition.addFieldMap(f_map_date)
-
-    #append the new addition
-    arcpy.Append_management(TFL_Boundary_addition,staging_addition,'NO_TEST',field_mappings_addition)
-    arcpy.Delete_management(TFL_Boundary_addition)
-
-    #update the required fields in the new record
-    where_clause = "WHEN_UPDATED IS NULL"
-    #remove WHO_UPDATED by yj
-    fields = ['WHEN_UPDATED']
-    with arcpy.da.UpdateCursor(staging_addition,fields,where_clause) as cursor:
-        for row in cursor:
-            #row[0] = 'GeoBC'
-            #row[1] = datetime.now()
-            row[0] = datetime.now()
-            cursor.updateRow(row)
-    arcpy.AddMessage('Updated TFL Addition in Staging folder')
-
-
-def update_tfl_deletion():
-    """Makes a backup copy of TFL Deletion in staging then deletes the previous
-       backup. Takes any TFL Poly features tagged as deletion, and appends them
-       to the new TFL Deletion in staging."""
-    #create a feature layer
-    where_clause = "Poly_Type='Deletion'"
-    TFL_Boundary_deletion = arcpy.MakeFeatureLayer_management(tfl_poly,'TFL_Boundary_deletion',where_clause)
-    count = arcpy.GetCount_management(TFL_Boundary_deletion)
-    arcpy.AddMessage('Appending ' + str(count) + ' deletions to staging')
-
-    #make a backup copy of the staging overview dataset - delete the old backup first
-    arcpy.Delete_management(staging_deletion + '_BACKUP')
-    arcpy.Copy_management(staging_deletion,staging_deletion + '_BACKUP')
-    #make a field map for the deletion feature layer
-    field_mappings_deletion = arcpy.FieldMappings()
-    #legislative tool
-    f_map_tool = arcpy.FieldMap()
-    f_map_tool.addInputField(TFL_Boundary_deletion, 'Legislative_Tool')
-    tool                  = f_map_tool.outputField
-    tool.name             = 'DOCUMENT_TYPE'
-    f_map_tool.outputField  = tool
-    field_mappings_deletion.addFieldMap(f_map_tool)
-    #document number
-    f_map_number = arcpy.FieldMap()
-    f_map_number.addInputField(TFL_Boundary_deletion, 'Document_Number')
-    number                  = f_map_number.outputField
-    number.name             = 'INS_AMD_ID'
-    f_map_number.outputField  = number
-    field_mappings_deletion.addFieldMap(f_map_number)
-    #description
-    f_map_description = arcpy.FieldMap()
-    f_map_description.addInputField(TFL_Boundary_deletion, 'Description')
-    description             = f_map_description.outputField
-    description.name        = 'COMMENTS'
-    f_map_description.outputField  = description
-    field_mappings_deletion.addFieldMap(f_map_description)
-    #Forest File ID
-    f_map_ffid = arcpy.FieldMap()
-    f_map_ffid.addInputField(TFL_Boundary_deletion, 'FOREST_FILE_ID')
-    ffid             = f_map_ffid.outputField
-    ffid.name        = 'FOREST_FILE_ID'
-    f_map_ffid.outputField  = ffid
-    field_mappings_deletion.addFieldMap(f_map_ffid)
-    #Feature class skey
-    f_map_skey = arcpy.FieldMap()
-    f_map_skey.addInputField(TFL_Boundary_deletion, 'FEATURE_CLASS_SKEY')
-    skey             = f_map_skey.outputField
-    skey.name        = 'FEATURE_CLASS_SKEY'
-    f_map_skey.outputField  = skey
-    field_mappings_deletion.addFieldMap(f_map_skey)
-
-    f_map_date = arcpy.FieldMap()
-    f_map_date.addInputField(TFL_Boundary_deletion, 'EFFECTIVE_DATE')
-    date             = f_map_date.outputField
-    date.name        = 'EFFECTIVE_DATE'
-    f_map_date.outputField  = date
-    field_mappings_deletion.addFieldMap(f_map_date)
-
-    #append the new deletion
-    arcpy.Append_management(TFL_Boundary_deletion,staging_deletion,'NO_TEST', field_mappings_deletion)
-    arcpy.Delete_management(TFL_Boundary_deletion)
-
-    #update the required fields in the new record
-    where_clause = "WHEN_UPDATED IS NULL"
-    #remove WHO_UPDATED by yj
-    #fields = ['WHO_UPDATED','WHEN_UPDATED']
-    fields = ['WHEN_UPDATED']
-    with arcpy.da.UpdateCursor(staging_deletion,fields,where_clause) as cursor:
-        for row in cursor:
-            #row[0] = 'GeoBC'
-            #row[1] = datetime.now()
-            row[0] = datetime.now()
-            cursor.updateRow(row)
-    arcpy.AddMessage('Updated TFL Deletion in Staging folder')
+    #replace the features for the current TFL in overview with the new overview
+    #the attributes set on the new features are declared in utils.field_mappings
+    #the dissolve makes exactly one overview feature for the TFL
+    transaction.add(staging_overview, where_clause, input_gdb + os.sep + 'TFL_Boundary_dissolve',
+                    parameters={'licensee': licensee, 'submitted_timestamp': submitted_timestamp}, label='TFL Overview',
+                    min_rows=1, max_rows=1)
+
+def update_tfl_agreement(transaction):
+    """Adds the TFL Agreement in staging to the transaction - the features for the TFL are replaced
+       (and kept in an undo feature class for rollback, see utils.staging_writer) by any TFL Poly features
+       tagged as replacement. Sets the required fields in the new features"""
+    #replace the features for the current TFL in agreement with the new agreement boundary
+    transaction.add(staging_agreement_bdy, "FOREST_FILE_ID = '" + forest_file_id + "'", tfl_poly,
+                    parameters={'effective_date': effective_date, 'submitted_timestamp': submitted_timestamp}, label='TFL Agreement Boundary',
+                    min_rows=1)
+
+def update_tfl_addition(transaction):
+    """Adds the TFL Addition in staging to the transaction - any TFL Poly features tagged as addition
+       are added (and recorded for rollback, see utils.staging_writer)."""
+    transaction.add(staging_addition, None, tfl_poly, "Poly_Type='Addition'",
+                    parameters={'submitted_timestamp': submitted_timestamp}, label='TFL Addition')
+
+
+def update_tfl_deletion(transaction):
+    """Adds the TFL Deletion in staging to the transaction - any TFL Poly features tagged as deletion
+       are added (and recorded for rollback, see utils.staging_writer)."""
+    transaction.add(staging_deletion, None, tfl_poly, "Poly_Type='Deletion'",
+                    parameters={'submitted_timestamp': submitted_timestamp}, label='TFL Deletion')
 
 def update_skey(poly_type, skey):
     """takes , and finds the last (most recent)
@@ -556,35 +388,13 @@ def update_skey(poly_type, skey):
     del cursor
     arcpy.AddMessage('Updated SKEY for ' + poly_type)
 
-def update_tfl_schedule_a():
-    """Makes a backup copy of TFL Schedule A in staging then deletes the previous
-       backup. Takes any TFL Poly features tagged as deletion, and adds them
-       to the new TFL Deletion in staging."""
+def update_tfl_schedule_a(transaction):
+    """Adds the TFL Schedule A in staging to the transaction - the features for the TFL are replaced
+       (and kept in an undo feature class for rollback, see utils.staging_writer) by the TFL Schedule A."""
     #TO DO: check to ensure schedule A attributes are correct - when should this happen? might be better in a different tool?
 
-    where_clause = "FOREST_FILE_ID = '" + forest_file_id + "'"
-    #make a backup copy of the staging overview dataset - delete the old backup first
-    arcpy.Delete_management(staging_schedule_a + '_BACKUP')
-    arcpy.Copy_management(staging_schedule_a,staging_schedule_a + '_BACKUP')
-    #delete the features for the current TFL from additions
-    arcpy.MakeFeatureLayer_management(staging_schedule_a,'TFL_Schedule_A_FL', where_clause)
-    arcpy.DeleteFeatures_management('TFL_Schedule_A_FL')
-    #append the new addition
-    arcpy.Append_management(tfl_schedule_a,staging_schedule_a,'NO_TEST')
-    #update the required fields in the new records
-    #remove WHO_UPDATED by yj
-    #fields = ['WHO_UPDATED','WHEN_UPDATED','FEATURE_CLASS_SKEY']
-    fields = ['WHEN_UPDATED','FEATURE_CLASS_SKEY']
-    with arcpy.da.UpdateCursor(staging_schedule_a,fields,where_clause) as cursor:
-        for row in cursor:
-            #row[0] = 'GeoBC'
-            #row[1] = datetime.now()
-            #row[2] = 837
-            row[0] = datetime.now()
-            row[1] = 837
-            cursor.updateRow(row)
-    arcpy.AddMessage('Updated TFL Schedule A in Staging folder')
-    arcpy.Delete_management('TFL_Schedule_A_FL')
+    transaction.add(staging_schedule_a, "FOREST_FILE_ID = '" + forest_file_id + "'", tfl_schedule_a,
+                    parameters={'submitted_timestamp': submitted_timestamp}, label='TFL Schedule A', min_rows=1)
 
 def update_submitter(check_out_date):
     """takes , and finds the last (most recent)
@@ -599,41 +409,36 @@ def update_submitter(check_out_date):
     del cursor
     arcpy.AddMessage('Updated Submitter and date')
 
+@instrumentation.timed('intersect cadastre')
 def intersect_cadastre(bcgw_connection, datasets_to_update, check_out_date):
     """If change is replacement, intersects all TFL lines with cadastral datasets
        (PMBC, Tantalis), otherwise, intersects only updated lines. Saves
        Intersecting features to a FC in the local GDB to provide context for
-       future research."""
+       future research. The lines are merged into one search area and both
+       cadastral datasets are read through it at the same time"""
     #removed ICF BCGW connection/intersection
-    pmbc_whse = bcgw_connection + PMBC
-    tantalis_whse = bcgw_connection + TANTALIS
+    pmbc_whse = warehouse_mirror.resolve(bcgw_connection, PMBC, WAREHOUSE_MIRROR)
+    tantalis_whse = warehouse_mirror.resolve(bcgw_connection, TANTALIS, WAREHOUSE_MIRROR)
     cadastral_to_copy = {'PMBC': pmbc_whse ,'TANTALIS': tantalis_whse}
     if 'Replacement' in datasets_to_update:
-        #make feature layer of all active lines
-        where_clause = "Status_Code = 'ACTIVE'"
-        lines_fl = arcpy.MakeFeatureLayer_management(tfl_line,'TFL_Line_FL',where_clause)
+        #all active lines
+        lines = geometry_tools.read_features(tfl_line, where_clause="Status_Code = 'ACTIVE'")
     else:
-        #If not a replacement, use the line changes feature class created for the review package (minus deleted lines)
-        where_clause = "Status_Code IN ('ACTIVE','RETIRED')"
-        lines_fl = arcpy.MakeFeatureLayer_management(tfl_line_changes,'TFL_Line_FL',where_clause)
-
-    line_count = int(arcpy.GetCount_management('TFL_Line_FL')[0])
-
-    #For each cadastre - make a selection that instersects the feature layer and copy to the local
-    for key, value in cadastral_to_copy.iteritems(): #NOTE: iteritems is python2 and will need to be updated for arcPro to python 3
-        temp_fl = arcpy.MakeFeatureLayer_management(value, key + '_FL')
-        arcpy.SelectLayerByLocation_management(key + '_FL','INTERSECT','TFL_Line_FL')
-        feature_count = int(arcpy.GetCount_management(key + '_FL')[0])
-        if feature_count == 0:
+        #If not a replacement, use the line changes saved for the review package (minus deleted lines) - only rebuilt if the lines changed since
+        line_change_set.get_change_set(input_gdb, tfl_line, tfl_line_changes, check_out_date)
+        lines = geometry_tools.read_features(tfl_line_changes, where_clause="Status_Code IN ('ACTIVE','RETIRED')")
+
+    #For each cadastre - copy the features that intersect the lines to the local
+    spatial_reference = arcpy.Describe(tfl_line).spatialReference
+    counts = cadastre_intersection.copy_intersecting(cadastral_to_copy, lines['geometry'].values, input_gdb, spatial_reference)
+    for key in sorted(counts):
+        if counts[key] == 0:
             arcpy.AddMessage('No intersecting features found for ' + key)
         else:
-            arcpy.CopyFeatures_management(key + '_FL',key + '_Intersection')
-            arcpy.AddMessage('Copied intersecting features from ' + key)
-        arcpy.Delete_management(temp_fl)
-
-    arcpy.Delete_management(lines_fl)
+            arcpy.AddMessage('Copied ' + str(counts[key]) + ' intersecting features from ' + key)
 
 
+@instrumentation.timed('move to final and archive')
 def move_and_archive():
     arcpy.env.workspace = working_location
 
@@ -650,6 +455,7 @@ def move_and_archive():
 
     #copy the working folder to final
     arcpy.Copy_management(input_folder, TFL_FINAL_FOLDERS + os.sep + input_tfl)
+    instrumentation.count(bytes_copied=instrumentation.dataset_size(TFL_FINAL_FOLDERS + os.sep + input_tfl))
     arcpy.Compact_management(os.path.join(TFL_FINAL_FOLDERS, input_tfl, 'Data', 'FADM_' + input_tfl + '.gdb'))      # there may be leftover locks, compacting seems to get rid of them in this situation
     # shutil.copytree(input_folder, TFL_FINAL_FOLDERS + os.sep + input_tfl, ignore=shutil.ignore_patterns('*.lock'))    #alternative workaround for lock issues
     arcpy.AddMessage('Moved package to TFL Final folder')
@@ -668,4 +474,5 @@ def move_and_archive():
 
 #This section calls the other routines (def)
 if __name__ == '__main__':
-    runapp('tfl_submit_edits')
\ No newline at end of file
+    with instrumentation.run('TFL_Submit_Edits', os.path.dirname(working_location)):
+        runapp('tfl_submit_edits')
\ No newline at end of file
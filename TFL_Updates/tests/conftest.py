@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tools import the shared modules as utils.*, from the TFL_Updates folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+from shapely import Polygon, box
+
+from utils import change_detection
+
+
+def square(x=0, y=0, size=10):
+    return box(x, y, x + size, y + size)
+
+
+def test_vertex_order_and_start_point_give_the_same_key():
+    polygon = Polygon([(0, 0), (10, 0), (10, 10), (0, 10)])
+    reversed_polygon = Polygon([(0, 10), (10, 10), (10, 0), (0, 0)])
+    shifted_start = Polygon([(10, 10), (0, 10), (0, 0), (10, 0)])
+    keys = change_detection.geometry_keys([polygon, reversed_polygon, shifted_start])
+    assert keys[0] == keys[1] == keys[2]
+    assert keys[0] != change_detection.geometry_keys([square(1)])[0]
+
+
+def test_missing_geometries_have_no_key():
+    assert change_detection.geometry_keys([None, Polygon()]) == [(None, None), (None, None)]
+
+
+def test_duplicates_only_match_once():
+    left_mask, right_mask = change_detection.unmatched([square(), square()], [square()])
+    assert left_mask.tolist() == [False, True]
+    assert right_mask.tolist() == [False]
+
+    left_mask, right_mask = change_detection.unmatched([square()], [square(), square(), square(20)])
+    assert left_mask.tolist() == [False]
+    assert right_mask[:2].sum() == 1     # one of the two duplicates is left over
+    assert right_mask[2]
+
+
+def test_slivers_below_the_area_tolerance_are_dropped():
+    # extra vertex 0.001 above the top edge - a 0.005 sliver, under DEFAULT_AREA_TOLERANCE
+    sliver = Polygon([(0, 0), (10, 0), (10, 10), (5, 10.001), (0, 10)])
+    assert change_detection.find_differences([square()], [sliver]) == ([], [])
+
+    # a 1m bump is a real change
+    bump = Polygon([(0, 0), (10, 0), (10, 10), (5, 11), (0, 10)])
+    left_only, right_only = change_detection.find_differences([square()], [bump])
+    assert left_only == []
+    assert len(right_only) == 1
+    assert abs(right_only[0].area - 5) < 0.001
+
+
+def test_no_change_skips_the_overlay(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('overlay run when every feature matched')
+    monkeypatch.setattr(change_detection.shapely, 'union_all', fail)
+    monkeypatch.setattr(change_detection.shapely, 'difference', fail)
+
+    left = [square(), square(20), Polygon([(0, 10), (10, 10), (10, 0), (0, 0)])]
+    right = [square(20), square(), square()]
+    assert change_detection.find_differences(left, right) == ([], [])
+
+
+def test_difference_frame_labels_each_side():
+    frame = change_detection.difference_frame([square()], [square(5)], 'Working', 'Final')
+    assert sorted(frame['SOURCE']) == ['Final', 'Working']
+    assert [name for name, _, _ in change_detection.DIFFERENCE_FIELDS] == ['SOURCE']
@@ -0,0 +1,17 @@
+from shapely import box
+
+from utils import containment
+
+
+def test_small_overlaps_are_reported():
+    overlaps = containment.find_overlaps([box(0, 0, 10, 10)], [box(9.99, 0, 20, 10), box(30, 0, 40, 10)])
+    assert [(a, b) for a, b, _ in overlaps] == [(0, 0)]
+    assert abs(overlaps[0][2].area - 0.1) < 1e-6
+
+
+def test_shared_edges_are_not_overlaps():
+    assert containment.find_overlaps([box(0, 0, 10, 10)], [box(10, 0, 20, 10), box(10, 10, 20, 20)]) == []
+
+
+def test_overlaps_under_a_given_tolerance_are_ignored():
+    assert containment.find_overlaps([box(0, 0, 10, 10)], [box(9.99, 0, 20, 10)], area_tolerance=1.0) == []
@@ -0,0 +1,109 @@
+from shapely import LineString, MultiLineString, Point
+
+from utils import line_topology
+
+
+def rules_found(errors):
+    return [(error.rule, error.oids) for error in errors]
+
+
+def test_line_doubling_back_is_a_self_overlap():
+    errors = line_topology.validate_line_topology([1], [LineString([(0, 0), (10, 0), (5, 0)])])
+    assert (line_topology.MUST_NOT_SELF_OVERLAP, (1,)) in rules_found(errors)
+    assert line_topology.MUST_NOT_SELF_INTERSECT not in [error.rule for error in errors]
+    overlap = [error for error in errors if error.rule == line_topology.MUST_NOT_SELF_OVERLAP][0]
+    assert overlap.geometry.equals(LineString([(5, 0), (10, 0)]))
+
+
+def test_line_retracing_earlier_segment_is_a_self_overlap():
+    line = LineString([(0, 0), (10, 0), (10, 5), (4, 5), (4, 0), (8, 0)])
+    errors = line_topology.validate_line_topology([1], [line], rules=[line_topology.MUST_NOT_SELF_OVERLAP])
+    assert rules_found(errors) == [(line_topology.MUST_NOT_SELF_OVERLAP, (1,))]
+    assert errors[0].geometry.equals(LineString([(4, 0), (8, 0)]))
+
+
+def test_line_crossing_itself_is_a_self_intersect():
+    line = LineString([(0, 0), (10, 0), (10, 10), (5, -5)])
+    errors = line_topology.validate_line_topology([1], [line], rules=[line_topology.MUST_NOT_SELF_OVERLAP,
+                                                                     line_topology.MUST_NOT_SELF_INTERSECT])
+    assert rules_found(errors) == [(line_topology.MUST_NOT_SELF_INTERSECT, (1,))]
+    assert errors[0].geometry.distance(Point(20 / 3.0, 0)) < 0.001
+
+
+def test_closed_loop_is_not_a_self_intersect():
+    loop = LineString([(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)])
+    errors = line_topology.validate_line_topology([1], [loop], rules=[line_topology.MUST_NOT_SELF_OVERLAP,
+                                                                     line_topology.MUST_NOT_SELF_INTERSECT])
+    assert errors == []
+
+
+def test_dangles_are_unconnected_end_points():
+    lines = [LineString([(0, 0), (10, 0)]), LineString([(10, 0), (10, 10)]), LineString([(5, 0), (5, -5)])]
+    errors = line_topology.validate_line_topology([1, 2, 3], lines, rules=[line_topology.MUST_NOT_HAVE_DANGLES])
+    dangles = sorted((error.oids, tuple(error.geometry.coords[0])) for error in errors)
+    # (5, 0) touches the interior of line 1, so only the free ends dangle
+    assert dangles == [((1,), (0.0, 0.0)), ((2,), (10.0, 10.0)), ((3,), (5.0, -5.0))]
+
+
+def test_connected_ring_has_no_dangles():
+    lines = [LineString([(0, 0), (10, 0)]), LineString([(10, 0), (10, 10)]), LineString([(10, 10), (0, 0)])]
+    assert line_topology.validate_line_topology([1, 2, 3], lines, rules=[line_topology.MUST_NOT_HAVE_DANGLES]) == []
+
+
+def test_lines_sharing_a_stretch_overlap():
+    lines = [LineString([(0, 0), (10, 0)]), LineString([(5, 0), (15, 0)])]
+    errors = line_topology.validate_line_topology([1, 2], lines, rules=[line_topology.MUST_NOT_OVERLAP,
+                                                                       line_topology.MUST_NOT_INTERSECT])
+    assert rules_found(errors) == [(line_topology.MUST_NOT_OVERLAP, (1, 2))]
+    assert errors[0].geometry.equals(LineString([(5, 0), (10, 0)]))
+
+
+def test_lines_crossing_intersect():
+    lines = [LineString([(0, 0), (10, 0)]), LineString([(5, -5), (5, 5)])]
+    errors = line_topology.validate_line_topology([1, 2], lines, rules=[line_topology.MUST_NOT_OVERLAP,
+                                                                       line_topology.MUST_NOT_INTERSECT])
+    assert rules_found(errors) == [(line_topology.MUST_NOT_INTERSECT, (1, 2))]
+    assert errors[0].geometry.equals(Point(5, 0))
+
+
+def test_lines_meeting_at_end_points_are_clean():
+    lines = [LineString([(0, 0), (10, 0)]), LineString([(10, 0), (10, 10)])]
+    assert line_topology.validate_line_topology([1, 2], lines, rules=[line_topology.MUST_NOT_OVERLAP,
+                                                                     line_topology.MUST_NOT_INTERSECT]) == []
+
+
+def test_multipart_line_is_not_single_part():
+    line = MultiLineString([[(0, 0), (10, 0)], [(20, 0), (30, 0)]])
+    errors = line_topology.validate_line_topology([1], [line], rules=[line_topology.MUST_BE_SINGLE_PART])
+    assert rules_found(errors) == [(line_topology.MUST_BE_SINGLE_PART, (1,))]
+
+
+def square_ring():
+    return {1: LineString([(0, 0), (10, 0)]), 2: LineString([(10, 0), (10, 10)]),
+            3: LineString([(10, 10), (0, 10)]), 4: LineString([(0, 10), (0, 0)])}
+
+
+def test_moved_line_leaves_former_neighbours_dangling():
+    lines = square_ring()
+    previous_extents = line_topology.extents([4], [lines[4]])
+    # line 4 is moved away to a closed loop of its own, which is clean - the dangles are on lines 1 and 3
+    lines[4] = LineString([(100, 100), (110, 100), (110, 110), (100, 100)])
+    oids = sorted(lines)
+    geometries = [lines[oid] for oid in oids]
+    full = line_topology.validate_line_topology(oids, geometries, rules=[line_topology.MUST_NOT_HAVE_DANGLES])
+    assert sorted(rules_found(full)) == [(line_topology.MUST_NOT_HAVE_DANGLES, (1,)), (line_topology.MUST_NOT_HAVE_DANGLES, (3,))]
+
+    incremental = line_topology.validate_line_topology(oids, geometries, rules=[line_topology.MUST_NOT_HAVE_DANGLES],
+                                                       seed_oids=[4], seed_extents=list(previous_extents.values()))
+    assert rules_found(incremental) == rules_found(full)
+
+
+def test_incremental_check_matches_full_check_for_edited_line():
+    lines = square_ring()
+    lines[2] = LineString([(10, 0), (12, 10)])
+    oids = sorted(lines)
+    geometries = [lines[oid] for oid in oids]
+    full = line_topology.validate_line_topology(oids, geometries)
+    incremental = line_topology.validate_line_topology(oids, geometries, seed_oids=[2],
+                                                       seed_extents=[line_topology.extents([2], [square_ring()[2]])[2]])
+    assert full and rules_found(incremental) == rules_found(full)
@@ -0,0 +1,52 @@
+import pandas as pd
+import shapely
+from shapely import LineString
+
+from utils import line_topology, polygon_build
+
+
+def square(xmin, ymin, xmax, ymax, gap=0.0):
+    """Four lines around a square - the last line stops gap short of the first corner"""
+    return [LineString([(xmin, ymin), (xmax, ymin)]), LineString([(xmax, ymin), (xmax, ymax)]),
+            LineString([(xmax, ymax), (xmin, ymax)]), LineString([(xmin, ymax), (xmin, ymin + gap)])]
+
+
+def areas(polygons):
+    return sorted(round(float(area), 3) for area in shapely.area(polygons['geometry'].values))
+
+
+def test_exact_ring_builds_one_polygon():
+    assert areas(polygon_build.build_polygons(square(0, 0, 10, 10))) == [100.0]
+
+
+def test_gap_within_tolerance_still_builds():
+    lines = square(0, 0, 10, 10, gap=line_topology.DEFAULT_TOLERANCE / 2)
+    assert line_topology.validate_line_topology(range(len(lines)), lines) == []
+    assert areas(polygon_build.build_polygons(lines)) == [100.0]
+
+
+def test_gap_beyond_tolerance_builds_nothing():
+    lines = square(0, 0, 10, 10, gap=line_topology.DEFAULT_TOLERANCE * 10)
+    assert len(polygon_build.build_polygons(lines)) == 0
+
+
+def test_line_ending_just_short_of_another_splits_the_polygon():
+    lines = square(0, 0, 10, 10) + [LineString([(5, line_topology.DEFAULT_TOLERANCE / 2), (5, 10)])]
+    assert areas(polygon_build.build_polygons(lines)) == [50.0, 50.0]
+
+
+def test_hole_with_gap_within_tolerance():
+    lines = square(0, 0, 10, 10) + square(3, 3, 6, 6, gap=line_topology.DEFAULT_TOLERANCE / 2)
+    polygons = polygon_build.build_polygons(lines)
+    assert areas(polygons) == [9.0, 91.0]
+    outer = polygons['geometry'].values[shapely.area(polygons['geometry'].values).argmax()]
+    assert len(outer.interiors) == 1
+
+
+def test_attributes_carried_from_previous_polygons():
+    labels = pd.DataFrame({'Poly_Type': ['Current_View', 'Addition'],
+                           'geometry': [shapely.box(0, 0, 5, 10), shapely.box(5, 0, 10, 10)]}, index=[1, 2])
+    lines = square(0, 0, 10, 10) + [LineString([(5, 0), (5, 10)])]
+    polygons = polygon_build.build_polygons(lines, labels)
+    by_type = dict(zip(polygons['Poly_Type'], shapely.bounds(polygons['geometry'].values).tolist()))
+    assert by_type == {'Current_View': [0.0, 0.0, 5.0, 10.0], 'Addition': [5.0, 0.0, 10.0, 10.0]}
@@ -0,0 +1,203 @@
+######################################################################
+## attribute_rules.py
+## Purpose: Declarative attribute rules for TFL feature classes. Rules are
+##          declared as data, compiled to vectorized pandas/NumPy masks and
+##          evaluated together against a single read of each table
+###############################################################################
+from collections import namedtuple
+
+import numpy as np
+
+# Rule severities. Only ERROR rules cause a check to fail - INFO rules are counted and reported
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+
+# A rule is the field it applies to, a predicate describing the rows that FAIL the rule, a severity, and a message.
+# Predicates are tuples of (predicate name, arguments...) - see PREDICATES below for the available names.
+# Messages may use {count} (number of failing rows) and {field}
+Rule = namedtuple('Rule', ['name', 'field', 'predicate', 'severity', 'message'])
+
+# The result of evaluating a rule against a table. mask is a boolean array, True for rows that fail the rule
+RuleResult = namedtuple('RuleResult', ['rule', 'mask', 'count'])
+
+# This list can be updated to ignore certain fields. Change_type is currently being ignored because it is not used and will almost always contain domain errors
+IGNORE_FIELDS = ['CHANGE_TYPE']
+
+# Values are normalized before rules are evaluated. The domain values for 'IS_INSET_POINT' are ['Yes', 'No'],
+# but values written into fields are commonly ['yes', 'no'] so the casing is converted to match the domain
+FIELD_TRANSFORMS = {'IS_INSET_POINT': 'title'}
+
+# Checks that wouldn't be caught by schema/domain checks on the TFL Boundary
+POLY_TYPE_MISSING = Rule('poly_type_missing', 'Poly_Type', ('not_null',), ERROR,
+                         '{count} features are missing a Poly_Type')
+POLY_TYPE_MIXED = Rule('poly_type_mixed', 'Poly_Type', ('not_mixed_with', 'Replacement'), ERROR,
+                       'The Poly_Type field contains "Replacement" along with other Poly_Types. This is not allowed')
+LEGISLATIVE_TOOL_MISSING = Rule('legislative_tool_missing', 'Legislative_Tool', ('null_unless', 'Poly_Type', 'Current_View'), ERROR,
+                                'There are {count} instances where Legislative_Tool is null, but Poly_Type is not a "Current View"')
+
+BOUNDARY_RULES = [POLY_TYPE_MISSING, POLY_TYPE_MIXED, LEGISLATIVE_TOOL_MISSING]
+
+# Boundary checks run before a review package is created. Legislative_Tool may still be null at this stage
+POLY_TYPE_DOMAIN = Rule('poly_type_domain', 'Poly_Type', ('in_domain', 'POLY_TYPE', True), ERROR,
+                        'One or more TFL_Boundary features are not using domain values in {field}')
+LEGISLATIVE_TOOL_DOMAIN = Rule('legislative_tool_domain', 'Legislative_Tool', ('in_domain', 'Legislative_Tool', True), ERROR,
+                               'One or more TFL_Boundary features are not using domain values in {field}')
+REVIEW_BOUNDARY_RULES = [POLY_TYPE_MISSING, POLY_TYPE_DOMAIN, LEGISLATIVE_TOOL_DOMAIN, POLY_TYPE_MIXED]
+
+# Required attributes on the TFL Lines
+LINE_RULES = [
+    Rule('legal_description_missing', 'Legal_Description', ('not_null',), ERROR, 'Null values found in {field}'),
+    Rule('status_code_missing', 'Status_Code', ('not_null',), ERROR, 'Null values found in {field}'),
+    Rule('source_code_missing', 'Source_Code', ('not_null',), ERROR, 'Null values found in {field}'),
+    Rule('status_code_domain', 'Status_Code', ('in_domain', 'STATUS_CODE', False), ERROR,
+         'one or more lines are not using domain values for STATUS_CODE'),
+]
+
+
+def domain_rules(fields):
+    """
+    Builds the domain and null count rules for a list of arcpy Field objects (fields without a domain,
+    and fields in IGNORE_FIELDS, are skipped).
+
+    Args:
+        fields: list of arcpy Field objects
+
+    Returns:
+        list of Rules
+    """
+    rules = []
+    for field in fields:
+        if not field.domain or field.name in IGNORE_FIELDS:
+            continue
+        rules.append(Rule('domain', field.name, ('in_domain', field.domain, field.isNullable), ERROR, 'Domain Errors: {count}'))
+        rules.append(Rule('null', field.name, ('not_null',), INFO, 'Null: {count}'))
+    return rules
+
+
+def applicable_rules(rules, columns):
+    """Returns the rules whose fields are all present in columns"""
+    columns = set(columns)
+    return [rule for rule in rules if set(rule_fields(rule)) <= columns]
+
+
+def rule_fields(rule):
+    """Returns every field a rule reads - its own field plus any field named in the predicate"""
+    fields = [rule.field]
+    if rule.predicate[0] == 'null_unless':
+        fields.append(rule.predicate[1])
+    return fields
+
+
+def compile_rules(rules, domains=None):
+    """
+    Compiles rules into functions that take a dataframe and return a boolean mask of failing rows.
+
+    Args:
+        rules: list of Rules
+        domains: Dictionary of {domain name: set of coded values}, required for 'in_domain' rules
+
+    Returns:
+        list of (Rule, function) tuples
+    """
+    compiled = []
+    for rule in rules:
+        factory = PREDICATES[rule.predicate[0]]
+        compiled.append((rule, factory(rule.field, domains or {}, *rule.predicate[1:])))
+    return compiled
+
+
+def evaluate_rules(df, rules, domains=None):
+    """
+    Evaluates all rules against a dataframe in one pass and returns a result for each rule. Rules for fields
+    that are not in the dataframe are skipped.
+
+    Args:
+        df: Pandas dataframe of a feature class table
+        rules: list of Rules, or the output of compile_rules
+        domains: Dictionary of {domain name: set of coded values}, required for 'in_domain' rules
+
+    Returns:
+        list of RuleResults
+    """
+    if rules and isinstance(rules[0], Rule):
+        rules = compile_rules(applicable_rules(rules, df.columns), domains)
+
+    df = apply_transforms(df)
+
+    results = []
+    for rule, predicate in rules:
+        mask = np.asarray(predicate(df), dtype=bool)
+        results.append(RuleResult(rule, mask, int(mask.sum())))
+    return results
+
+
+def failed(results, severity=None):
+    """Returns the results with at least one failing row, optionally limited to one severity"""
+    return [result for result in results if result.count and (severity is None or result.rule.severity == severity)]
+
+
+def format_message(result):
+    """Returns the rule message for a result, filled in with the failing row count and field"""
+    return result.rule.message.format(count=result.count, field=result.rule.field)
+
+
+def apply_transforms(df):
+    """Normalizes the fields listed in FIELD_TRANSFORMS. Returns a new dataframe if anything was changed"""
+    transform_fields = [field for field in FIELD_TRANSFORMS if field in df.columns]
+    if not transform_fields:
+        return df
+    df = df.copy()
+    for field in transform_fields:
+        if FIELD_TRANSFORMS[field] == 'title':
+            df[field] = df[field].astype(object).str.title()
+    return df
+
+
+###############################################################################
+## Predicates - each returns a function giving True for the rows that FAIL
+###############################################################################
+
+def _not_null(field, domains):
+    """Fails where the field is null"""
+    return lambda df: df[field].isnull().values
+
+
+def _in_domain(field, domains, domain_name, nullable=True):
+    """Fails where the value isn't in the coded domain. Nulls only fail if the field isn't nullable.
+    Range domains aren't in the coded domain catalogue, so fields using them never fail"""
+    if domain_name not in domains:
+        return lambda df: np.zeros(len(df), dtype=bool)
+    values = domains[domain_name]     # a set - the membership test is a hash lookup per distinct value
+
+    def predicate(df):
+        column = df[field]
+        mask = ~column.isin(values).values
+        if nullable:
+            mask &= column.notnull().values
+        return mask
+    return predicate
+
+
+def _not_mixed_with(field, domains, value):
+    """If any row has value, fails every other row (e.g. Replacement can't be mixed with other Poly_Types)"""
+    def predicate(df):
+        column = df[field]
+        present = (column == value).values
+        if present.any() and column.nunique(dropna=False) > 1:
+            return ~present
+        return np.zeros(len(column), dtype=bool)
+    return predicate
+
+
+def _null_unless(field, domains, other_field, other_value):
+    """Fails where the field is null, except where other_field equals other_value"""
+    return lambda df: (df[field].isnull() & (df[other_field] != other_value)).values
+
+
+PREDICATES = {
+    'not_null': _not_null,
+    'in_domain': _in_domain,
+    'not_mixed_with': _not_mixed_with,
+    'null_unless': _null_unless,
+}
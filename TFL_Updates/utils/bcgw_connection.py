@@ -0,0 +1,120 @@
+######################################################################
+## bcgw_connection.py
+## Purpose: Shared BCGW connection manager for the TFL tools. Connection
+##          files are cached per user and reused across tool runs in the
+##          same ArcGIS session until they expire, then removed on exit.
+##          Can point the tools at a local FileGDB copy of the warehouse
+##          layers instead of the BCGW (e.g. for testing)
+###############################################################################
+import atexit
+import hashlib
+import os
+import sys
+import time
+
+import arcpy
+
+from utils import instrumentation
+
+# Connection files are reused for this many seconds before a new one is created
+CONNECTION_TTL = 4 * 60 * 60
+
+# Warehouse layer used to check that a cached connection still works
+VALIDATION_LAYER = 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
+
+# Cached connection files - {(user, password hash): (connection file path, time created)}
+_CONNECTIONS = {}
+
+
+@instrumentation.timed('BCGW connect')
+def get_connection(bcgw_uname, bcgw_pw, local_warehouse=None):
+    """
+    Returns a BCGW connection file for the user, reusing the cached one if it is younger than CONNECTION_TTL
+    and still connects. Otherwise creates a new connection file with geobc.
+
+    Args:
+        bcgw_uname: BCGW user name
+        bcgw_pw: BCGW password
+        local_warehouse: Optional path to a FileGDB holding copies of the warehouse layers (see layer_path).
+                         If given, it is returned instead of connecting to the BCGW
+
+    Returns:
+        Path to the connection file (or local_warehouse), or False if the connection could not be made
+    """
+    if local_warehouse:
+        arcpy.AddMessage('Using local copy of warehouse layers: ' + local_warehouse)
+        return local_warehouse
+
+    key = (bcgw_uname.upper(), hashlib.sha256(bcgw_pw.encode('utf-8')).hexdigest())
+    if key in _CONNECTIONS:
+        connection, created = _CONNECTIONS[key]
+        if time.time() - created < CONNECTION_TTL and is_valid(connection):
+            arcpy.AddMessage('Reusing BCGW connection created {:.0f} minutes ago\n'.format((time.time() - created) / 60))
+            return connection
+        remove_connection(connection)
+
+    arcpy.AddMessage(" ")
+    arcpy.AddMessage("Setting up the BCGW connection...\n")
+    import TFL_Config
+    if TFL_Config.Resources.GEOBC_LIBRARY_PATH not in sys.path:
+        sys.path.append(TFL_Config.Resources.GEOBC_LIBRARY_PATH)
+    import geobc
+    connection = geobc.BCGWConnection()
+    success = connection.create_bcgw_connection_file(bcgw_uname, bcgw_pw)
+    if not success:
+        return False
+    _CONNECTIONS[key] = (connection.bcgw_connection_file, time.time())
+    return connection.bcgw_connection_file
+
+
+def is_valid(connection):
+    """Returns True if the connection file exists and the validation layer can be reached through it"""
+    try:
+        return os.path.exists(connection) and arcpy.Exists(layer_path(connection, VALIDATION_LAYER))
+    except Exception:
+        return False
+
+
+def layer_path(connection, layer):
+    """
+    Returns the path to a warehouse layer through a connection. For a local FileGDB stand-in, the layer is
+    looked up by its name with the dot replaced (e.g. WHSE_ADMIN_BOUNDARIES_FADM_TFL_ALL_SP), since
+    FileGDB names can't contain the schema separator. If the FileGDB is a warehouse mirror, the current
+    copy named in its manifest is used instead (see utils.warehouse_mirror).
+
+    Args:
+        connection: Connection file from get_connection, or a local FileGDB
+        layer: Warehouse layer name, e.g. 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
+
+    Returns:
+        Path to the layer
+    """
+    layer = layer.lstrip('\\')
+    if connection.lower().endswith('.gdb'):
+        from utils import warehouse_mirror     # imported here - warehouse_mirror imports this module
+        entry = warehouse_mirror.read_manifest(connection).get(layer, {})
+        if 'name' in entry:
+            return os.path.join(connection, entry['name'])
+        return os.path.join(connection, layer.replace('.', '_'))
+    return connection + '\\' + layer
+
+
+def remove_connection(connection):
+    """Deletes a connection file and drops it from the cache"""
+    for key, (cached, _) in list(_CONNECTIONS.items()):
+        if cached == connection:
+            del _CONNECTIONS[key]
+    try:
+        if os.path.exists(connection):
+            os.remove(connection)
+    except OSError:
+        pass    # still in use - it will be left for the next session
+
+
+def remove_all():
+    """Deletes every cached connection file. Registered to run when the ArcGIS session exits"""
+    for connection, _ in list(_CONNECTIONS.values()):
+        remove_connection(connection)
+
+
+atexit.register(remove_all)
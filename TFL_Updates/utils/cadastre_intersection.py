@@ -0,0 +1,124 @@
+######################################################################
+## cadastre_intersection.py
+## Purpose: Copy the cadastre parcels (PMBC, Tantalis) that intersect TFL
+##          lines. The lines are buffered and merged once into a single
+##          search area, each cadastre source is read through that area in
+##          its own worker process, and parcels are matched to the lines in
+##          memory before being written with one insert cursor each
+###############################################################################
+import os
+import time
+
+import numpy as np
+import shapely
+
+import arcpy
+
+from utils import geometry_tools, instrumentation
+from utils.parallel import map_in_processes, uses_processes
+
+# Lines are buffered by this distance (units of the data - m for BC Albers) to make the search area, so parcels
+# that only touch a line are still selected by the data source. Parcels are then matched to the lines within the
+# XY tolerance of the data, as SelectLayerByLocation INTERSECT does
+SEARCH_BUFFER = 1.0
+
+# Field types that can't be read with a cursor along with the geometry
+SKIP_TYPES = ['OID', 'Geometry', 'GlobalID', 'Blob', 'Raster']
+
+
+def search_area(line_geometries, distance=SEARCH_BUFFER):
+    """Returns the lines buffered by distance and merged into one Shapely geometry (None if there are no lines)"""
+    line_geometries = np.asarray(line_geometries, dtype=object)
+    line_geometries = line_geometries[~(shapely.is_missing(line_geometries) | shapely.is_empty(line_geometries))]
+    if not len(line_geometries):
+        return None
+    return shapely.union_all(shapely.buffer(line_geometries, distance))
+
+
+def intersects_lines(geometries, line_geometries, tolerance=0):
+    """Returns a boolean array, True for each geometry that intersects any of the lines, or is within tolerance of one"""
+    geometries = np.asarray(geometries, dtype=object)
+    matched = np.zeros(len(geometries), dtype=bool)
+    if not len(geometries) or not len(line_geometries):
+        return matched
+    tree = shapely.STRtree(np.asarray(line_geometries, dtype=object))
+    if tolerance > 0:
+        found = tree.query(geometries, predicate='dwithin', distance=tolerance)
+    else:
+        found = tree.query(geometries, predicate='intersects')
+    matched[np.unique(found[0])] = True
+    return matched
+
+
+def read_intersecting(job):
+    """
+    Worker for copy_intersecting - reads the features of one cadastre source in the search area and keeps those
+    that intersect the lines (within the XY tolerance). Runs in a worker process, so the job holds only plain values
+    (geometries as WKB and the spatial reference as a string).
+
+    Returns:
+        dict with the name, the attribute fields, a dataframe of the intersecting features, the number of
+        features read and seconds taken
+    """
+    started = time.time()
+    spatial_reference = arcpy.SpatialReference()
+    spatial_reference.loadFromString(job['spatial_reference'])
+    area = geometry_tools.to_arcpy(shapely.from_wkb(job['area']), spatial_reference)
+    lines = shapely.from_wkb(np.array(job['lines'], dtype=object))
+
+    fields = [field.name for field in arcpy.ListFields(job['path']) if field.type not in SKIP_TYPES and field.editable]
+    candidates = geometry_tools.read_features(job['path'], fields, spatial_filter=area, spatial_reference=spatial_reference)
+    features = candidates[intersects_lines(candidates['geometry'].values, lines, job['tolerance'])]
+    return {'name': job['name'], 'fields': fields, 'features': features, 'features_read': len(candidates),
+            'seconds': time.time() - started}
+
+
+def copy_intersecting(cadastre, line_geometries, out_gdb, spatial_reference, parallel=True):
+    """
+    Copies the features of each cadastre source that intersect the lines (within the XY tolerance of the
+    spatial reference) to <name>_Intersection in out_gdb, replacing any previous copy. Sources are read at the
+    same time in worker processes. A copy is only made when there are intersecting features.
+
+    Args:
+        cadastre: {name: path} of the cadastre sources, e.g. {'PMBC': ..., 'TANTALIS': ...}
+        line_geometries: Shapely lines
+        out_gdb: gdb to write the intersecting features to
+        spatial_reference: arcpy SpatialReference of the lines (the features are written in it)
+        parallel: If False, the sources are read one after another in this process
+
+    Returns:
+        {name: number of intersecting features}
+    """
+    area = search_area(line_geometries)
+    counts = dict((name, 0) for name in cadastre)
+    for name in cadastre:
+        out_fc = os.path.join(out_gdb, name + '_Intersection')
+        if arcpy.Exists(out_fc):
+            arcpy.Delete_management(out_fc)
+    if area is None:
+        return counts
+
+    tolerance = spatial_reference.XYTolerance
+    tolerance = tolerance if tolerance and tolerance == tolerance else 0     # NaN when the spatial reference has no tolerance set
+    jobs = [{'name': name, 'path': path, 'area': shapely.to_wkb(area), 'spatial_reference': spatial_reference.exportToString(),
+             'tolerance': tolerance,
+             'lines': list(shapely.to_wkb(np.asarray(line_geometries, dtype=object)))} for name, path in sorted(cadastre.items())]
+    #reads in this process are already counted by read_features - only reads in worker processes are added below
+    in_workers = parallel and uses_processes(len(jobs))
+    if parallel:
+        results = map_in_processes(read_intersecting, jobs)
+    else:
+        results = [read_intersecting(job) for job in jobs]
+
+    for result in results:
+        if in_workers:
+            instrumentation.count(features_read=result['features_read'])
+        arcpy.AddMessage('Read {} in {:.1f}s'.format(result['name'], result['seconds']))
+        if not len(result['features']):
+            continue
+        out_fc = os.path.join(out_gdb, result['name'] + '_Intersection')
+        arcpy.CreateFeatureclass_management(out_gdb, result['name'] + '_Intersection', 'POLYGON',
+                                            template=cadastre[result['name']], spatial_reference=spatial_reference)
+        geometry_tools.insert_features(out_fc, result['features'], result['fields'], spatial_reference)
+        counts[result['name']] = len(result['features'])
+    return counts
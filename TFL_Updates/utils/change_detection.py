@@ -0,0 +1,136 @@
+######################################################################
+## change_detection.py
+## Purpose: Find the differences between two versions of a polygon layer
+##          (e.g. working vs final, final vs BCGW). Features are matched by
+##          a hash of their snapped, normalized geometry first, so only the
+##          features that changed go through a symmetric difference.
+##          Has no arcpy dependency so it can be run and tested anywhere
+###############################################################################
+import hashlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Coordinates are snapped to this grid (units of the data - m for BC Albers) before hashing, so the same
+# polygon stored by different sources with tiny coordinate differences still matches
+DEFAULT_GRID_SIZE = 0.001
+
+# Difference parts smaller than this (square units of the data) are slivers from snapping, not changes
+DEFAULT_AREA_TOLERANCE = 0.01
+
+# Schema of a difference layer - (field name, field type, length). SOURCE is the label of the layer an area is only in
+DIFFERENCE_FIELDS = [('SOURCE', 'TEXT', 20)]
+
+
+def geometry_keys(geometries, grid_size=DEFAULT_GRID_SIZE):
+    """
+    Returns a key for each geometry made of its area (to the grid size) and a hash of its snapped,
+    normalized WKB. Equal keys mean equal geometries, whatever the vertex order, start point or part order.
+
+    Args:
+        geometries: Sequence of Shapely geometries
+        grid_size: Size of the grid coordinates are snapped to
+
+    Returns:
+        list of (area, hash) tuples - (None, None) for missing geometries
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    keys = [(None, None)] * len(geometries)
+    present = np.flatnonzero(~(shapely.is_missing(geometries) | shapely.is_empty(geometries)))
+    if not len(present):
+        return keys
+
+    snapped = shapely.normalize(shapely.set_precision(geometries[present], grid_size))
+    areas = np.round(shapely.area(snapped) / grid_size).astype(np.int64)
+    for index, area, wkb in zip(present, areas, shapely.to_wkb(snapped)):
+        keys[index] = (int(area), hashlib.sha1(wkb).hexdigest())
+    return keys
+
+
+def unmatched(left_geometries, right_geometries, grid_size=DEFAULT_GRID_SIZE):
+    """
+    Matches features between two layers by geometry key. Each feature can match only one feature on the
+    other side, so duplicates are handled.
+
+    Args:
+        left_geometries: Sequence of Shapely geometries
+        right_geometries: Sequence of Shapely geometries
+        grid_size: Size of the grid coordinates are snapped to
+
+    Returns:
+        (left mask, right mask) - boolean arrays, True for features with no identical feature on the other side
+    """
+    left_keys = geometry_keys(left_geometries, grid_size)
+    right_keys = geometry_keys(right_geometries, grid_size)
+    remaining = Counter(key for key in right_keys if key[1])
+
+    left_mask = np.zeros(len(left_keys), dtype=bool)
+    for index, key in enumerate(left_keys):
+        if not key[1]:
+            continue
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            left_mask[index] = True
+
+    # whatever is left over on the right had no match on the left
+    right_mask = np.zeros(len(right_keys), dtype=bool)
+    for index in reversed(range(len(right_keys))):
+        key = right_keys[index]
+        if key[1] and remaining[key]:
+            remaining[key] -= 1
+            right_mask[index] = True
+    return left_mask, right_mask
+
+
+def find_differences(left_geometries, right_geometries, grid_size=DEFAULT_GRID_SIZE, area_tolerance=DEFAULT_AREA_TOLERANCE):
+    """
+    Finds the areas that are in only one of two polygon layers - the in-memory equivalent of SymDiff_analysis.
+    When every feature has an identical match (the usual "no change" case) no overlay is done. Otherwise only
+    the unmatched features are overlaid, which also catches features that were split or merged without
+    changing the area covered.
+
+    Args:
+        left_geometries: Sequence of Shapely polygons
+        right_geometries: Sequence of Shapely polygons
+        grid_size: Size of the grid coordinates are snapped to
+        area_tolerance: Difference parts with a smaller area than this are ignored
+
+    Returns:
+        (left only, right only) - lists of Shapely polygons covering the areas only in the left/right layer
+    """
+    left_geometries = np.asarray(left_geometries, dtype=object)
+    right_geometries = np.asarray(right_geometries, dtype=object)
+    left_mask, right_mask = unmatched(left_geometries, right_geometries, grid_size)
+    if not (left_mask.any() or right_mask.any()):
+        return [], []
+
+    left = shapely.union_all(shapely.set_precision(left_geometries[left_mask], grid_size))
+    right = shapely.union_all(shapely.set_precision(right_geometries[right_mask], grid_size))
+    return (_parts(shapely.difference(left, right, grid_size=grid_size), area_tolerance),
+            _parts(shapely.difference(right, left, grid_size=grid_size), area_tolerance))
+
+
+def difference_frame(left_geometries, right_geometries, left_label, right_label):
+    """
+    Finds the differences between two polygon layers (see find_differences) as a difference layer.
+
+    Args:
+        left_geometries: Sequence of Shapely polygons
+        right_geometries: Sequence of Shapely polygons
+        left_label: SOURCE value for areas only in the left layer, e.g. 'Working'
+        right_label: SOURCE value for areas only in the right layer, e.g. 'Final'
+
+    Returns:
+        Pandas dataframe with SOURCE and geometry columns (see DIFFERENCE_FIELDS) - empty if there are no differences
+    """
+    left_only, right_only = find_differences(left_geometries, right_geometries)
+    return pd.DataFrame([(left_label, geometry) for geometry in left_only] + [(right_label, geometry) for geometry in right_only],
+                        columns=['SOURCE', 'geometry'])
+
+
+def _parts(geometry, area_tolerance):
+    """Returns the polygons of a geometry that are at least area_tolerance in area (lines and points left by the overlay are dropped)"""
+    return [part for part in shapely.get_parts(geometry) if part.geom_type == 'Polygon' and part.area >= area_tolerance]
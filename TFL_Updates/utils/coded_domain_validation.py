@@ -2,10 +2,12 @@ import arcpy
 from arcpy import env
 import os
 import pandas as pd
-import numpy as np
+from utils.table_reader import read_table
+from utils import attribute_rules, validation_report
 
-# This list can be updated to ignore certain fields. Change_type is currently being ignored because it is not used and will almost always contain domain errors
-IGNORE_FIELDS = ['CHANGE_TYPE']
+# Domain catalogues keyed by gdb path. Modules stay loaded between tool runs in an ArcGIS session, so
+# this lets repeat runs skip re-reading domains when the gdb has not changed
+_DOMAIN_CATALOGUE_CACHE = {}
 
 
 def get_coded_domain_name_values(gdb):
@@ -14,169 +16,262 @@ def get_coded_domain_name_values(gdb):
     the domain names as keys and the domain values as values. It only returns
     the coded domain values, not range values.
 
+    Results come from the shared domain catalogue, so repeated calls against a
+    gdb that has not been modified do not re-read the domains.
+
     Args:
         gdb: Path to ESRI Geodatabase
 
     Returns:
         Dictionary of domain names and values.
-        Format:: {Domain.name}:{Domain.value1, Domain.value2,...}
+        Format:: {Domain.name}:frozenset({Domain.value1, Domain.value2,...})
+    """
+    return get_domain_catalogue(gdb)['values']
+
+
+def get_coded_values(gdb, domain_name):
+    """
+    Returns the coded values for a single domain from the shared domain catalogue.
+
+    Args:
+        gdb: Path to ESRI Geodatabase
+        domain_name: Name of a coded value domain
+
+    Returns:
+        frozenset of the domain values. Empty if the domain is not found or is not a coded value domain
     """
-    domains = arcpy.da.ListDomains(gdb)
-    domain_dict = {}
+    return get_domain_catalogue(gdb)['values'].get(domain_name, frozenset())
+
+
+def get_coded_domain_dtypes(gdb):
+    """
+    Returns a pandas CategoricalDtype for each coded value domain in the gdb, with the coded
+    values as the categories. Useful for compact, fast comparisons on domain fields.
+
+    Args:
+        gdb: Path to ESRI Geodatabase
+
+    Returns:
+        Dictionary of domain names and pandas CategoricalDtypes
+    """
+    return get_domain_catalogue(gdb)['dtypes']
+
 
-    for domain in domains:
+def get_domain_catalogue(gdb):
+    """
+    Builds (or returns the cached copy of) the domain catalogue for a gdb. The catalogue is memoized
+    on the gdb path and its modification time, so it is only rebuilt when the gdb has changed.
+
+    Args:
+        gdb: Path to ESRI Geodatabase
+
+    Returns:
+        Dictionary with 'values' ({Domain.name: frozenset of coded values}) and
+        'dtypes' ({Domain.name: pandas CategoricalDtype})
+    """
+    key = os.path.normcase(os.path.abspath(gdb))
+    modified = gdb_modified_time(gdb)
+
+    cached = _DOMAIN_CATALOGUE_CACHE.get(key)
+    if cached and modified is not None and cached['modified'] == modified:
+        return cached
+
+    values = {}
+    for domain in arcpy.da.ListDomains(gdb):
         if domain.domainType == 'CodedValue':
-            coded_values = domain.codedValues
-            for key in coded_values.keys():
-               domain_dict.setdefault(domain.name,[]).append(key)
-    return domain_dict
+            values[domain.name] = frozenset(domain.codedValues.keys())
+
+    dtypes = {}
+    for name, codes in values.items():
+        dtypes[name] = pd.CategoricalDtype(categories=sorted(codes, key=str))
 
+    catalogue = {'modified': modified, 'values': values, 'dtypes': dtypes}
+    _DOMAIN_CATALOGUE_CACHE[key] = catalogue
+    return catalogue
 
-def table_to_data_frame(in_table, input_fields=None, where_clause=None):
+
+def gdb_modified_time(gdb):
+    """
+    Returns the most recent modification time of a file geodatabase. A file gdb is a folder, and its
+    own timestamp does not change when an existing table (such as the domain table) is edited, so
+    the newest file within the folder is used instead.
+
+    Args:
+        gdb: Path to ESRI Geodatabase
+
+    Returns:
+        float timestamp, or None if the path is not a folder (e.g. an enterprise connection)
+    """
+    if not os.path.isdir(gdb):
+        return None
+    latest = os.path.getmtime(gdb)
+    for entry in os.listdir(gdb):
+        try:
+            latest = max(latest, os.path.getmtime(os.path.join(gdb, entry)))
+        except OSError:
+            pass    # lock files can disappear while listing
+    return latest
+
+
+def table_to_data_frame(in_table, input_fields=None, where_clause=None, categorical_fields=None):
     """Function will convert an arcgis table into a pandas dataframe with an object ID index, and the selected
-    input fields using an arcpy.da.SearchCursor.
+    input fields. Values are read into NumPy arrays with explicit dtypes (see utils.table_reader.read_table).
 
     Args:
         in_table: Path to ESRI feature class
         input_fields: String or list of strings containing output field names. If None, all fields will be returned.
         where_clause: where_clause as per arcpy.da.SearchCursor documentation
+        categorical_fields: List of field names to store as pandas categoricals
 
     Returns:
         Pandas dataframe
     """
-    OIDFieldName = arcpy.Describe(in_table).OIDFieldName
-    if input_fields:
-        final_fields = [OIDFieldName] + input_fields
-    else:
-        final_fields = [field.name for field in arcpy.ListFields(in_table)]
-    data = [row for row in arcpy.da.SearchCursor(in_table, final_fields, where_clause=where_clause)]
-    fc_dataframe = pd.DataFrame(data, columns=final_fields)
-    fc_dataframe = fc_dataframe.set_index(OIDFieldName, drop=True)
-    return fc_dataframe
+    if isinstance(input_fields, str):
+        input_fields = [input_fields]
+    return read_table(in_table, input_fields=input_fields, where_clause=where_clause, categorical_fields=categorical_fields)
+
+
+def validate_domains(gdb, arcpy_workspace, report_table=None, report_json=None):
+    """
+    Validates the values in every field with a coded domain, for every feature class in the workspace. Results
+    are reported in feature class / field order once all feature classes have been checked.
 
+    Optionally writes a detailed report with one record per failing feature (object ID, field, value, rule and
+    severity) as a GDB table and/or JSON file. The report is only written when problems are found - any
+    previous report at those paths is removed otherwise.
 
-def validate_domains(gdb, arcpy_workspace):
+    Args:
+        gdb: Path to ESRI Geodatabase (used to look up the domains)
+        arcpy_workspace: Workspace containing the feature classes to validate
+        report_table: Path to write the report table to, or None
+        report_json: Path to write the report JSON to, or None
+
+    Returns:
+        bool: True if errors were found, False otherwise
+    """
     errors = False  #  Global reporter of errors. False (no errors found) by default
 
     arcpy.AddMessage('\n----- Validating values for all features... (Layers & Fields will only be reported if nulls or errors found)')
 
     domain_dict = get_coded_domain_name_values(gdb)
-    arcpy.env.workspace = arcpy_workspace
+    feature_classes = list_feature_classes(arcpy_workspace)
 
-    # this code involving datasets will allow all feature classes in a workspace to be iterated through, even if they are within datasets 
-    datasets = arcpy.ListDatasets(feature_type='feature')           
-    datasets = [''] + datasets if datasets is not None else []          
+    results = [validate_feature_class(fc, domain_dict) for fc in feature_classes]
 
-    for ds in datasets:
-        for fc in arcpy.ListFeatureClasses(feature_dataset=ds):
-            fields_with_domain = []             # create a list to store the fields which have a domain
-            
-            fields = arcpy.ListFields(fc)
-            for field in fields:
-                if field.domain:
-                    fields_with_domain.append(field)
+    for result in sorted(results, key=lambda result: result['feature_class']):
+        if result['errors']:
+            errors = True
 
-            if fields_with_domain:      # if there are fields which have a domain in this feature
-                df = table_to_data_frame(fc, input_fields=[f.name for f in fields_with_domain])     # convert the table to a pandas dataframe. DFs are easy to work with and the syntax hasn't changed so moving code to Python3/ArcPro should go smoothly
+        for field_result in sorted(result['fields'], key=lambda field_result: field_result['field']):
+            arcpy.AddMessage(result['feature_class']+' : '+field_result['field'])
+            arcpy.AddMessage('\tRecords: {}'.format(result['records']))
+            arcpy.AddMessage('\tNull: {}'.format(field_result['null_count']))
+            arcpy.AddWarning('\tDomain Errors: {}'.format(field_result['err_count']))
 
-                if 'IS_INSET_POINT' in df.columns.values.tolist():     # The domain values for 'IS_INSET_POINT' are ['Yes', 'No'], but values written into fields are commonly ['yes', 'no'] so we must covert the casing to match the domains in order to do checks
-                    df = convert_pandas_case(df, 'IS_INSET_POINT')
+            for message in field_result['messages']:
+                arcpy.AddWarning(message)
 
-                for field in fields_with_domain: 
-                    error_messages = []     # create a list to store 'special case' error messages that will be printed
+    report = [record for result in results for record in result['report']]
+    write_report(report, report_table, report_json)
 
-                    error_df = df[field.name].isin(domain_dict[field.domain])   # searching field columns for proper domain values. 'True' where domain value is present, 'False' where domain value is not present or value is null
-                    err_count = (~error_df).sum()       # Make it 'False' where domain values are present and 'True' where not present. Sum the number of 'True' values
+    if errors:
+        arcpy.AddError('\n\nERROR: Problems found while validating field values. Please move the TFL back to working and correct errors.')
 
-                    null_df = df[field.name].isnull()   # count the number of values where the field is null
-                    null_count = null_df.sum()
+    return errors
 
-                    if field.isNullable:        # nulls were included in the error count before. If schema allows for nulls, lets remove them from the error count
-                        err_count = err_count - null_count
-                        if err_count > 0:       # if after removing allowed null values there are still errors, set errors to True
-                            errors = True
 
-                    if field.name == 'Poly_Type':       # special check that wouldn't be caught by schema/domain checks, will add to error messages if problems found
-                        poly_type_errors = check_poly_types(df)
-                        error_messages.append(poly_type_errors)
+def write_report(report, report_table=None, report_json=None):
+    """
+    Writes the detailed validation report to a GDB table and/or JSON file. If the report is empty, any
+    previous report is deleted instead so a clean TFL doesn't carry a stale report forward.
 
-                    if field.name == 'Legislative_Tool':    # special check that wouldn't be caught by schema/domain checks, will add to error messages if problems found
-                        leg_tool_errors = check_legislative_tool(df)
-                        error_messages.append(leg_tool_errors)
+    Args:
+        report: list of report records (see utils.validation_report.build_records)
+        report_table: Path to the report table, or None
+        report_json: Path to the report JSON file, or None
+    """
+    if report_table:
+        if report:
+            validation_report.write_table(report, report_table)
+            arcpy.AddWarning('Validation report with {} records saved to {}'.format(len(report), report_table))
+        elif arcpy.Exists(report_table):
+            arcpy.Delete_management(report_table)
 
-                    if any(error_messages):     # if there are any error message, set errors to True
-                        errors = True
+    if report_json:
+        if report:
+            validation_report.write_json(report, report_json)
+        elif os.path.exists(report_json):
+            os.remove(report_json)
 
-                    # if (null_count > 0 or err_count > 0 or any(error_messages)) and field.name not in IGNORE_FIELDS:
-                    #     print(fc+' : '+field.name)
-                    #     print('\tRecords: {}'.format(len(df)))
-                    #     print('\tErrors: {}'.format(err_count))
-                    #     print('\tNull: {}'.format(null_count))
 
-                    #     for message in error_messages:
-                    #         print('\n'.join(message))
+def list_feature_classes(arcpy_workspace):
+    """
+    Lists the full path of every feature class in a workspace, including those within feature datasets.
 
-                    if (null_count > 0 or err_count > 0 or any(error_messages)) and field.name not in IGNORE_FIELDS:    # print out all results if nulls, domain errors, or error messages found as long as the field is not in the ignored_fields list
-                        arcpy.AddMessage(fc+' : '+field.name)
-                        arcpy.AddMessage('\tRecords: {}'.format(len(df)))
-                        arcpy.AddMessage('\tNull: {}'.format(null_count))
-                        arcpy.AddWarning('\tDomain Errors: {}'.format(err_count))
+    Args:
+        arcpy_workspace: Path to a geodatabase or feature dataset
 
-                        for message in error_messages:
-                            arcpy.AddWarning('\n'.join(message))
+    Returns:
+        list of feature class paths
+    """
+    arcpy.env.workspace = arcpy_workspace
 
-    if errors:
-        arcpy.AddError('\n\nERROR: Problems found while validating field values. Please move the TFL back to working and correct errors.')
+    # this code involving datasets will allow all feature classes in a workspace to be iterated through, even if they are within datasets 
+    datasets = arcpy.ListDatasets(feature_type='feature')           
+    datasets = [''] + datasets if datasets is not None else []          
 
-    return errors
+    feature_classes = []
+    for ds in datasets:
+        for fc in arcpy.ListFeatureClasses(feature_dataset=ds):
+            feature_classes.append(os.path.join(arcpy_workspace, ds, fc) if ds else os.path.join(arcpy_workspace, fc))
+    return feature_classes
 
 
-def check_poly_types(df):
-    """ 
-    Special checks to ensure the Poly_Types field adheres to what we want apart
-    from domain/schema checks. 
+def validate_feature_class(fc_path, domain_dict):
+    """
+    Validates the domain fields of a single feature class. The table is read once and every rule (domain
+    checks plus the special rules in attribute_rules.BOUNDARY_RULES) is evaluated against that single read.
+    Nothing is reported to arcpy from here - results are returned so validate_domains can report them in order.
 
     Args:
-        df: Pandas dataframe of feature class table containing the field 'Poly_Type'
+        fc_path: Path to the feature class
+        domain_dict: Domain dictionary from get_coded_domain_name_values
 
     Returns:
-        errors: list of error message strings to print to the console
+        Dictionary with the feature class name, record count, overall errors flag, a list of
+        results for each field that should be reported and the detailed report records
     """
-    errors = []
+    result = {'feature_class': os.path.basename(fc_path), 'records': 0, 'errors': False, 'fields': [], 'report': []}
 
-    poly_types = df['Poly_Type'].unique().tolist()      # If the change is a Replacement, check to make sure all Poly_Types are Replacement
-    if ('Replacement' in poly_types) and (len(poly_types) > 1):
-        errors.append('\tWARNING: The Poly_Type field contains "Replacement" along with other Poly_Types. This is not allowed')
+    fields_with_domain = [field for field in arcpy.ListFields(fc_path) if field.domain]
+    if not fields_with_domain:      # nothing to check if there are no fields which have a domain in this feature
+        return result
 
-    null_count = df['Poly_Type'].isnull().sum()     # Poly_Types is allowed to be null according to schema, but we don't want it to be at this stage
-    if null_count > 0:
-        message = '\tWARNING: {} features are missing a Poly_Type'.format(null_count)
-        errors.append(message)
+    domain_field_names = [f.name for f in fields_with_domain]
+    df = table_to_data_frame(fc_path, input_fields=domain_field_names, categorical_fields=domain_field_names)     # convert the table to a pandas dataframe. Domain fields only hold a few distinct values so they are stored as categoricals
+    result['records'] = len(df)
 
-    return errors
+    rules = attribute_rules.domain_rules(fields_with_domain) + attribute_rules.applicable_rules(attribute_rules.BOUNDARY_RULES, df.columns)
+    rule_results = attribute_rules.evaluate_rules(df, rules, domain_dict)
 
+    if attribute_rules.failed(rule_results, attribute_rules.ERROR):
+        result['errors'] = True
 
-def check_legislative_tool(df):
-    """
-    Special checks to ensure the Legislative_Tool field adheres to what we want apart
-    from domain/schema checks.
-    """
-    errors = []
-
-    # Legislative tool should really only be null where the Poly_type is Current View. Find the places where that isn't true
-    leg_issues_index = np.where((df['Legislative_Tool'].isnull()) & (df['Poly_Type'] != 'Current_View'))
-    num_leg_issues = len(leg_issues_index[0]) # np.where returns a 2d array, with the results we care about being in the first array
-
-    if num_leg_issues > 0:
-        message = '\tWARNING: There are {} instances where Legislative_Tool is null, but Poly_Type is not a "Current View"'.format(num_leg_issues)
-        errors.append(message)
-
-    return errors
+    # per-feature detail for the report comes from the same masks - no extra reads
+    result['report'] = validation_report.build_records(result['feature_class'], df, rule_results)
 
+    # group the failed rules by field so each field is reported once
+    for field_name in domain_field_names:
+        field_results = [r for r in attribute_rules.failed(rule_results) if r.rule.field == field_name]
+        if not field_results:
+            continue
+        counts = dict((r.rule.name, r.count) for r in field_results)
+        result['fields'].append({'field': field_name,
+                                 'null_count': counts.get('null', 0),
+                                 'err_count': counts.get('domain', 0),
+                                 'messages': ['\tWARNING: ' + attribute_rules.format_message(r) for r in field_results if r.rule.name not in ('null', 'domain')]})
 
-def convert_pandas_case(df, field):
-    df[field] = df[field].str.title()   # change the casing to Title casing. This was only made a function in case we run into this anywhere else.
-    return df
+    return result
 
 
 if __name__=='__main__':
@@ -0,0 +1,133 @@
+######################################################################
+## containment.py
+## Purpose: Check that polygons (e.g. Schedule A) are within a boundary
+##          in memory with Shapely, returning only the parts outside it, and
+##          find where polygons overlap others (e.g. neighbouring TFLs).
+##          Has no arcpy dependency so it can be run and tested anywhere
+###############################################################################
+import numpy as np
+import shapely
+
+# Parts outside the boundary smaller than this (square units of the data - m2 for BC Albers) are
+# treated as slivers from coincident edges that don't quite match, and are not reported
+DEFAULT_AREA_TOLERANCE = 1.0
+
+# Overlaps between polygons are all reported by default, as the Intersect this replaced did. Polygons that
+# only share an edge give line or point intersections, which are never reported
+OVERLAP_AREA_TOLERANCE = 0.0
+
+
+def find_outside(geometries, boundary_geometries, area_tolerance=DEFAULT_AREA_TOLERANCE):
+    """
+    Finds the parts of each polygon that fall outside a boundary - the in-memory equivalent of erasing
+    the polygons with the boundary. The merged boundary is prepared and tested against all polygons at
+    once, so when every polygon is inside (the usual case) no overlay is done at all. Only polygons
+    that are not covered are erased, and only against the boundary parts found near them with an STRtree.
+
+    Args:
+        geometries: Sequence of Shapely polygons to check
+        boundary_geometries: Sequence of Shapely polygons making up the boundary
+        area_tolerance: Outside parts with a smaller area than this are ignored
+
+    Returns:
+        list of (index into geometries, Shapely geometry of the part outside the boundary)
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    boundary_geometries = np.asarray(boundary_geometries, dtype=object)
+    present = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    boundary_parts = shapely.get_parts(boundary_geometries[~(shapely.is_missing(boundary_geometries) |
+                                                             shapely.is_empty(boundary_geometries))])
+
+    # no boundary - every polygon is entirely outside
+    if not len(boundary_parts):
+        return [(int(index), geometries[index]) for index in np.flatnonzero(present)
+                if shapely.area(geometries[index]) >= area_tolerance]
+
+    boundary = shapely.union_all(boundary_parts)
+    shapely.prepare(boundary)
+    candidates = np.flatnonzero(present)
+    candidates = candidates[~shapely.covers(boundary, geometries[candidates])]
+    if not len(candidates):
+        return []
+
+    tree = shapely.STRtree(boundary_parts)
+    outside = []
+    for index in candidates:
+        near = tree.query(geometries[index], predicate='intersects')
+        remainder = geometries[index]
+        if len(near):
+            remainder = shapely.difference(remainder, shapely.union_all(boundary_parts[near]))
+        if not remainder.is_empty and remainder.area >= area_tolerance:
+            outside.append((int(index), remainder))
+    return outside
+
+
+def find_overlaps(geometries, other_geometries, area_tolerance=OVERLAP_AREA_TOLERANCE):
+    """
+    Finds where polygons overlap other polygons - the in-memory equivalent of intersecting them. Pairs are
+    found with an STRtree, invalid geometries (e.g. self-intersecting rings from the warehouse) are repaired
+    first, and only area overlaps (not shared edges or corners) of at least area_tolerance are returned.
+
+    Args:
+        geometries: Sequence of Shapely polygons to check (e.g. the new boundary)
+        other_geometries: Sequence of Shapely polygons to check against (e.g. the other TFLs)
+        area_tolerance: Overlaps with a smaller area than this are ignored. By default every overlap is returned
+
+    Returns:
+        list of (index into geometries, index into other_geometries, Shapely geometry of the overlap)
+    """
+    geometries = _valid(geometries)
+    other_geometries = _valid(other_geometries)
+    if not len(geometries) or not len(other_geometries):
+        return []
+
+    tree = shapely.STRtree(other_geometries)
+    index, other_index = tree.query(geometries, predicate='intersects')
+    overlaps = []
+    for a, b in zip(index, other_index):
+        parts = [part for part in shapely.get_parts(shapely.intersection(geometries[a], other_geometries[b]))
+                 if part.geom_type == 'Polygon']
+        if not parts:
+            continue
+        overlap = shapely.union_all(parts)
+        if overlap.area > 0 and overlap.area >= area_tolerance:
+            overlaps.append((int(a), int(b), overlap))
+    return overlaps
+
+
+def interior_points_within(geometries, boundary_geometries):
+    """
+    Finds the polygons whose interior point (a point guaranteed to be inside the polygon, as from
+    FeatureToPoint INSIDE) falls in the boundary. Using an interior point means polygons that only share an
+    edge or overlap the boundary slightly are not matched.
+
+    Args:
+        geometries: Sequence of Shapely polygons to test (e.g. candidates pre-filtered to the boundary envelope)
+        boundary_geometries: Sequence of Shapely polygons making up the boundary
+
+    Returns:
+        boolean array, True for each polygon whose interior point is in the boundary
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    boundary_geometries = np.asarray(boundary_geometries, dtype=object)
+    within = np.zeros(len(geometries), dtype=bool)
+    present = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    boundary_geometries = boundary_geometries[~(shapely.is_missing(boundary_geometries) | shapely.is_empty(boundary_geometries))]
+    if not present.any() or not len(boundary_geometries):
+        return within
+
+    boundary = shapely.union_all(boundary_geometries)
+    shapely.prepare(boundary)
+    within[present] = shapely.intersects(boundary, shapely.point_on_surface(geometries[present]))
+    return within
+
+
+def _valid(geometries):
+    """Returns the geometries as an array with invalid ones repaired (missing geometries are left as None)"""
+    geometries = np.asarray(geometries, dtype=object).copy()
+    present = ~shapely.is_missing(geometries)
+    invalid = present.copy()
+    invalid[present] = ~shapely.is_valid(geometries[present])
+    if invalid.any():
+        geometries[invalid] = shapely.make_valid(geometries[invalid])
+    return geometries
@@ -0,0 +1,126 @@
+######################################################################
+## field_mappings.py
+## Purpose: Declare how TFL data is written to each staging feature class
+##          (which source field goes to which staging field, and which
+##          staging fields are set to a constant or a run value such as the
+##          submission time) once, as data. A mapping is compiled to the
+##          cursor field lists for a source and target from their current
+##          schemas, so rows are written with all their attributes in a
+##          single insert
+###############################################################################
+from collections import namedtuple
+
+import arcpy
+
+# Field types that are written through their own token (geometry) or maintained by the geodatabase
+SKIP_TYPES = ['OID', 'Geometry', 'GlobalID']
+
+
+def field(source_field, target_field):
+    """Mapping entry - copy source_field to target_field"""
+    return ('field', target_field, source_field)
+
+
+def constant(target_field, value):
+    """Mapping entry - set target_field to value on every row"""
+    return ('constant', target_field, value)
+
+
+def parameter(target_field, name):
+    """Mapping entry - set target_field to the run parameter called name (e.g. the submission time) on every row"""
+    return ('parameter', target_field, name)
+
+
+# Mappings by staging feature class name. With match_names, fields with the same name in the source and the
+# staging feature class are also copied (as Append does with NO_TEST)
+STAGING_MAPPINGS = {
+    'TFL_Overview': {'match_names': True, 'fields': [
+        parameter('LICENCEE', 'licensee'),
+        constant('TFL_TYPE', 'See Licence'),
+        constant('FEATURE_CLASS_SKEY', 830),
+        parameter('WHEN_UPDATED', 'submitted_timestamp')]},
+    'FADM_TFL': {'match_names': True, 'fields': [
+        parameter('EFFECTIVE_DATE', 'effective_date'),
+        constant('FEATURE_CLASS_SKEY', 830),
+        parameter('WHEN_UPDATED', 'submitted_timestamp')]},
+    'FADM_TFL_ADDITION': {'match_names': False, 'fields': [
+        field('Legislative_Tool', 'Legislative_Tool'),
+        field('Document_Number', 'DOCUMENT_NUMBER'),
+        field('Description', 'Description'),
+        field('FOREST_FILE_ID', 'FOREST_FILE_ID'),
+        field('FEATURE_CLASS_SKEY', 'FEATURE_CLASS_SKEY'),
+        field('EFFECTIVE_DATE', 'EFFECTIVE_DATE'),
+        parameter('WHEN_UPDATED', 'submitted_timestamp')]},
+    'FADM_TFL_DELETION': {'match_names': False, 'fields': [
+        field('Legislative_Tool', 'DOCUMENT_TYPE'),
+        field('Document_Number', 'INS_AMD_ID'),
+        field('Description', 'COMMENTS'),
+        field('FOREST_FILE_ID', 'FOREST_FILE_ID'),
+        field('FEATURE_CLASS_SKEY', 'FEATURE_CLASS_SKEY'),
+        field('EFFECTIVE_DATE', 'EFFECTIVE_DATE'),
+        parameter('WHEN_UPDATED', 'submitted_timestamp')]},
+    'FADM_TFL_SCHED_A': {'match_names': True, 'fields': [
+        parameter('WHEN_UPDATED', 'submitted_timestamp'),
+        constant('FEATURE_CLASS_SKEY', 837)]},
+}
+
+# A compiled mapping - cursor fields to read from the source, cursor fields to insert into the target (the
+# copied fields followed by the constant and parameter fields), the constant values, the run parameter names
+# and any entries dropped because the field doesn't exist
+Projection = namedtuple('Projection', ['source_fields', 'target_fields', 'constants', 'parameters', 'dropped'])
+
+
+def compile_mapping(name, source, target):
+    """
+    Compiles a mapping for a source and staging feature class into cursor field lists, from their current
+    schemas. Entries whose source or target field doesn't exist are listed in dropped - the rows can't be
+    written as declared, so callers should not write them.
+
+    Args:
+        name: Name of the mapping in STAGING_MAPPINGS (the staging feature class name)
+        source: Feature class the rows come from
+        target: Staging feature class
+
+    Returns:
+        Projection
+    """
+    mapping = STAGING_MAPPINGS[name]
+    target_fields = _field_names(target)
+    source_fields = _field_names(source)
+    declared = [target_field.lower() for _, target_field, _ in mapping['fields']]
+
+    pairs = [('SHAPE@', 'SHAPE@')]
+    if mapping['match_names']:
+        pairs += [(source_fields[lower], target_fields[lower]) for lower in target_fields
+                  if lower in source_fields and lower not in declared]
+    constants, parameters, dropped = [], [], []
+    for kind, target_field, value in mapping['fields']:
+        if target_field.lower() not in target_fields or (kind == 'field' and value.lower() not in source_fields):
+            dropped.append((kind, target_field, value))
+        elif kind == 'field':
+            pairs.append((source_fields[value.lower()], target_fields[target_field.lower()]))
+        elif kind == 'constant':
+            constants.append((target_fields[target_field.lower()], value))
+        else:
+            parameters.append((target_fields[target_field.lower()], value))
+
+    return Projection(source_fields=[source_field for source_field, _ in pairs],
+                      target_fields=[target_field for _, target_field in pairs] +
+                                    [target_field for target_field, _ in constants + parameters],
+                      constants=tuple(value for _, value in constants),
+                      parameters=tuple(value for _, value in parameters),
+                      dropped=dropped)
+
+
+def values(projection, run_parameters):
+    """Returns the values appended to each source row for the constant and parameter fields of a projection"""
+    return projection.constants + tuple(run_parameters[name] for name in projection.parameters)
+
+
+def _field_names(feature_class):
+    """Returns {lower case name: name} of the fields that can be written with a cursor"""
+    names = {}
+    for item in arcpy.ListFields(feature_class):
+        if item.editable and item.type not in SKIP_TYPES:
+            names[item.name.lower()] = item.name
+    return names
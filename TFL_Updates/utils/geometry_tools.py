@@ -0,0 +1,149 @@
+######################################################################
+## geometry_tools.py
+## Purpose: Move features between ESRI feature classes and in-memory
+##          Shapely geometries so spatial checks can run without writing
+##          scratch feature classes
+###############################################################################
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import arcpy
+
+# Running totals of the feature I/O done through this module. Tools reset them at the start of a run and report them at the end
+IO_STATS = {'datasets_read': 0, 'features_read': 0, 'bytes_read': 0,
+            'datasets_written': 0, 'features_written': 0, 'bytes_written': 0}
+
+
+def reset_io_stats():
+    """Sets the I/O totals in IO_STATS back to zero"""
+    for key in IO_STATS:
+        IO_STATS[key] = 0
+
+
+def io_summary():
+    """Returns a one line summary of the I/O totals in IO_STATS for tool messages"""
+    return ('Read {features_read:,} features ({bytes_read:,} bytes) in {datasets_read} reads, '
+            'wrote {features_written:,} features ({bytes_written:,} bytes) in {datasets_written} writes').format(**IO_STATS)
+
+
+def read_features(in_fc, fields=None, where_clause=None, spatial_filter=None, spatial_reference=None):
+    """
+    Reads features into a pandas dataframe indexed by object ID, with the Shapely geometry in a 'geometry'
+    column. The number of geometry bytes read is stored in df.attrs['bytes_read'].
+
+    Args:
+        in_fc: Path to ESRI feature class (local or BCGW)
+        fields: List of attribute field names to read along with the geometry
+        where_clause: where_clause as per arcpy.da.SearchCursor documentation
+        spatial_filter: arcpy Geometry - only features intersecting it are read. The selection is done
+                        by the data source, so features outside it are never transferred
+        spatial_reference: arcpy SpatialReference to project the geometries to while reading
+
+    Returns:
+        Pandas dataframe
+    """
+    fields = list(fields or [])
+    source = in_fc
+    if spatial_filter is not None:
+        source = arcpy.MakeFeatureLayer_management(in_fc, unique_name('read_fl'), where_clause).getOutput(0)
+        arcpy.SelectLayerByLocation_management(source, 'INTERSECT', spatial_filter)
+        where_clause = None
+
+    oids, wkbs, rows = [], [], []
+    with arcpy.da.SearchCursor(source, ['OID@', 'SHAPE@WKB'] + fields, where_clause, spatial_reference) as cursor:
+        for row in cursor:
+            oids.append(row[0])
+            wkbs.append(bytes(row[1]) if row[1] else None)
+            rows.append(row[2:])
+
+    if spatial_filter is not None:
+        arcpy.Delete_management(source)
+
+    df = pd.DataFrame(rows, columns=fields, index=pd.Index(oids, name='OBJECTID'))
+    df['geometry'] = shapely.from_wkb(np.array(wkbs, dtype=object))
+    df.attrs['bytes_read'] = sum(len(wkb) for wkb in wkbs if wkb)
+    IO_STATS['datasets_read'] += 1
+    IO_STATS['features_read'] += len(df)
+    IO_STATS['bytes_read'] += df.attrs['bytes_read']
+    return df
+
+
+def write_features(out_fc, df, geometry_type, spatial_reference, fields=None):
+    """
+    Creates a new feature class (replacing any existing one) and inserts the rows of a dataframe with a
+    Shapely 'geometry' column in a single insert cursor.
+
+    Args:
+        out_fc: Path to the output feature class
+        df: Pandas dataframe with a 'geometry' column
+        geometry_type: 'POLYGON', 'POLYLINE' or 'POINT'
+        spatial_reference: arcpy SpatialReference for the output
+        fields: list of (field name, field type, length) tuples to add and populate from df columns
+
+    Returns:
+        int number of bytes of geometry written
+    """
+    fields = list(fields or [])
+    if arcpy.Exists(out_fc):
+        arcpy.Delete_management(out_fc)
+    arcpy.CreateFeatureclass_management(os.path.dirname(out_fc), os.path.basename(out_fc), geometry_type,
+                                        spatial_reference=spatial_reference)
+    for name, field_type, length in fields:
+        arcpy.AddField_management(out_fc, name, field_type, field_length=length)
+
+    return insert_features(out_fc, df, [name for name, _, _ in fields], spatial_reference)
+
+
+def insert_features(out_fc, df, fields, spatial_reference):
+    """
+    Inserts the rows of a dataframe with a Shapely 'geometry' column into an existing feature class.
+
+    Args:
+        out_fc: Path to an existing feature class
+        df: Pandas dataframe with a 'geometry' column and a column for each field
+        fields: list of field names to populate from df columns of the same name
+        spatial_reference: arcpy SpatialReference of the geometries
+
+    Returns:
+        int number of bytes of geometry written
+    """
+    bytes_written = 0
+    with arcpy.da.InsertCursor(out_fc, ['SHAPE@'] + list(fields)) as cursor:
+        for values in zip(df['geometry'], *[df[field] for field in fields]):
+            geometry = to_arcpy(values[0], spatial_reference)
+            bytes_written += len(values[0].wkb) if values[0] is not None else 0
+            cursor.insertRow((geometry,) + tuple(_python_value(value) for value in values[1:]))
+    IO_STATS['datasets_written'] += 1
+    IO_STATS['features_written'] += len(df)
+    IO_STATS['bytes_written'] += bytes_written
+    return bytes_written
+
+
+def to_arcpy(geometry, spatial_reference):
+    """Converts a Shapely geometry to an arcpy Geometry (None stays None)"""
+    if geometry is None:
+        return None
+    return arcpy.FromWKB(bytearray(geometry.wkb), spatial_reference)
+
+
+def envelope(geometries, spatial_reference):
+    """Returns the combined bounding box of the geometries as an arcpy Polygon, for use as a spatial filter"""
+    return to_arcpy(shapely.box(*shapely.total_bounds(np.asarray(geometries, dtype=object))), spatial_reference)
+
+
+def unique_name(prefix):
+    """Returns a unique name for a feature layer, so concurrent reads don't collide"""
+    return '{}_{}'.format(prefix, uuid.uuid4().hex[:8])
+
+
+def _python_value(value):
+    """Converts pandas/numpy scalars to plain python values for arcpy cursors"""
+    if value is None or (not isinstance(value, str) and pd.isnull(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,161 @@
+######################################################################
+## instrumentation.py
+## Purpose: Time the stages of a TFL tool run (BCGW connect, copies,
+##          compacts, topology, symdiffs, appends...) and record the
+##          features read/written and bytes copied by each stage. Each run
+##          is appended to a JSONL log and summarized in the tool messages
+###############################################################################
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import arcpy
+
+# Name of the stage log - written next to tool_errors.log. One JSON object per stage, plus one per run
+LOG_NAME = 'tool_timings.jsonl'
+
+# The current tool run - set by run()
+_RUN = {}
+
+# Stages that are currently open, outermost first
+_OPEN_STAGES = []
+
+
+@contextmanager
+def run(tool_name, log_folder):
+    """
+    Context manager around a whole tool run. Stages recorded inside it are appended to LOG_NAME in
+    log_folder when the run ends (even if it fails) and a summary is printed with arcpy.AddMessage.
+
+    Args:
+        tool_name: Name of the tool, e.g. 'TFL_Check_Edits'
+        log_folder: Folder to write the stage log to
+    """
+    _RUN.clear()
+    _RUN.update({'run_id': uuid.uuid4().hex, 'tool': tool_name, 'started': datetime.now().isoformat(),
+                 'log_file': os.path.join(log_folder, LOG_NAME), 'stages': []})
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        yield _RUN
+        status = 'ok'
+    finally:
+        _RUN['seconds'] = round(time.perf_counter() - start, 3)
+        _RUN['status'] = status
+        try:
+            write_log()
+        except (IOError, OSError) as e:
+            arcpy.AddWarning('Unable to write stage timings to ' + _RUN['log_file'] + ': ' + str(e))
+        arcpy.AddMessage(summary())
+        _RUN.clear()
+
+
+@contextmanager
+def stage(name):
+    """
+    Context manager that times one stage of a tool run. Yields the stage record so amounts can be added
+    directly, or use count() from code further down. Geometry I/O done through utils.geometry_tools
+    during the stage is added automatically. Stages outside of run() are timed but not logged.
+
+    Args:
+        name: Short description of the stage, e.g. 'BCGW connect' or 'copy final gdb'
+    """
+    record = {'stage': name, 'seconds': None, 'status': 'error', 'nested': bool(_OPEN_STAGES),
+              'features_read': 0, 'features_written': 0, 'bytes_copied': 0}
+    if _RUN:
+        _RUN['stages'].append(record)     # added now so stages are listed in the order they started
+    io_before = _geometry_io()
+    _OPEN_STAGES.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+        record['status'] = 'ok'
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 3)
+        _OPEN_STAGES.remove(record)
+        io_after = _geometry_io()
+        record['features_read'] += io_after.get('features_read', 0) - io_before.get('features_read', 0)
+        record['features_written'] += io_after.get('features_written', 0) - io_before.get('features_written', 0)
+
+
+def timed(name):
+    """Decorator that runs a function as a stage - e.g. @instrumentation.timed('create topology')"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(features_read=0, features_written=0, bytes_copied=0):
+    """Adds amounts to every open stage (a stage includes the amounts of the stages inside it). Does nothing if no stage is open"""
+    for record in _OPEN_STAGES:
+        record['features_read'] += features_read
+        record['features_written'] += features_written
+        record['bytes_copied'] += bytes_copied
+
+
+def feature_count(dataset):
+    """Returns the number of rows in a feature class or table, for use with count()"""
+    return int(arcpy.GetCount_management(dataset)[0])
+
+
+def dataset_size(path):
+    """Returns the size in bytes of a file, or of everything in a folder (e.g. a file geodatabase). 0 if missing"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass    # lock files can disappear while walking
+    return total
+
+
+def write_log():
+    """Appends the stages of the current run, then the run itself, to the stage log as JSON lines"""
+    run_fields = dict((key, _RUN[key]) for key in ('run_id', 'tool', 'started'))
+    with open(_RUN['log_file'], 'a') as f:
+        for record in _RUN['stages']:
+            f.write(json.dumps(dict(run_fields, **record)) + '\n')
+        totals = _totals()
+        f.write(json.dumps(dict(run_fields, stage='TOTAL', seconds=_RUN['seconds'], status=_RUN['status'], **totals)) + '\n')
+
+
+def summary():
+    """Returns the stage timings of the current run as a block of text for the tool messages"""
+    lines = ['\nStage timings ({} run {}):'.format(_RUN['tool'], _RUN['run_id'][:8])]
+    for record in _RUN['stages']:
+        lines.append('  {:<40} {:>8.1f}s  read {:>8,}  written {:>8,}  copied {:>14,} bytes{}'.format(
+            ('  ' if record['nested'] else '') + record['stage'][:38], record['seconds'], record['features_read'], record['features_written'],
+            record['bytes_copied'], '' if record['status'] == 'ok' else '  (' + record['status'] + ')'))
+    totals = _totals()
+    lines.append('  {:<40} {:>8.1f}s  read {:>8,}  written {:>8,}  copied {:>14,} bytes'.format(
+        'TOTAL', _RUN['seconds'], totals['features_read'], totals['features_written'], totals['bytes_copied']))
+    return '\n'.join(lines)
+
+
+def _totals():
+    """Sums the amounts over the stages of the current run. Nested stages are only counted once, in the outer stage"""
+    totals = {'features_read': 0, 'features_written': 0, 'bytes_copied': 0}
+    for record in _RUN['stages']:
+        if record['nested']:
+            continue
+        for key in totals:
+            totals[key] += record[key]
+    return totals
+
+
+def _geometry_io():
+    """Returns a copy of the geometry_tools I/O totals, or nothing if the tool doesn't use geometry_tools"""
+    geometry_tools = sys.modules.get('utils.geometry_tools')
+    return dict(geometry_tools.IO_STATS) if geometry_tools else {}
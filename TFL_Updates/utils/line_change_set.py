@@ -0,0 +1,107 @@
+######################################################################
+## line_change_set.py
+## Purpose: Build the set of TFL lines edited since check out (the
+##          <TFL>_Line_Changes feature class) once per edit cycle. The
+##          change set has a manifest beside the gdb recording what it was
+##          built from, so review packaging and submission reuse it while
+##          the lines are unchanged instead of re-querying them
+###############################################################################
+import json
+import os
+from datetime import datetime
+
+import arcpy
+
+EDIT_DATE_FIELD = 'last_edited_date'
+EDIT_DATE_INDEX = 'last_edited_date_idx'
+
+# Format used for dates in the manifest and in FileGDB date queries
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def add_edit_date_index(tfl_lines):
+    """
+    Adds an attribute index on the editor tracking edit date of the lines (if there isn't one already),
+    so the changed lines can be found without scanning every line. Run when editor tracking is turned on.
+
+    Args:
+        tfl_lines: Path to the TFL line feature class
+
+    Returns:
+        True if the index was added, False if it already existed
+    """
+    for index in arcpy.ListIndexes(tfl_lines):
+        if [field.name.lower() for field in index.fields] == [EDIT_DATE_FIELD]:
+            return(False)
+    arcpy.AddIndex_management(tfl_lines, [EDIT_DATE_FIELD], EDIT_DATE_INDEX)
+    return(True)
+
+
+def manifest_path(input_gdb):
+    """Returns the path of the change set manifest kept beside the gdb (so it moves with the TFL folder)"""
+    return os.path.splitext(input_gdb)[0] + '_line_changes.json'
+
+
+def read_manifest(input_gdb):
+    """Returns the change set manifest, or {} if there isn't one"""
+    try:
+        with open(manifest_path(input_gdb)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def line_state(tfl_lines):
+    """
+    Returns what the change set depends on - the number of lines and the latest edit date - read from the
+    row count and the first row of the edit date index, so no lines are scanned.
+
+    Returns:
+        {'line_count': int, 'last_edited': date string or None}
+    """
+    last_edited = None
+    with arcpy.da.SearchCursor(tfl_lines, [EDIT_DATE_FIELD], EDIT_DATE_FIELD + ' IS NOT NULL',
+                               sql_clause=(None, 'ORDER BY ' + EDIT_DATE_FIELD + ' DESC')) as cursor:
+        for row in cursor:
+            last_edited = row[0].strftime(DATE_FORMAT)
+            break
+    return {'line_count': int(arcpy.GetCount_management(tfl_lines)[0]), 'last_edited': last_edited}
+
+
+def get_change_set(input_gdb, tfl_lines, out_fc, check_out_date):
+    """
+    Returns the feature class of lines edited since check out. It is reused if its manifest shows it was built
+    for the same check out date from the lines as they are now, otherwise it is rebuilt and the manifest written.
+
+    Args:
+        input_gdb: Path to the TFL gdb (the manifest is kept beside it)
+        tfl_lines: Path to the TFL line feature class
+        out_fc: Path to the change set feature class (e.g. <gdb>/<TFL>_Line_Changes)
+        check_out_date: datetime the TFL was checked out (Date_Extracted from the change history)
+
+    Returns:
+        out_fc
+    """
+    check_out = check_out_date.strftime(DATE_FORMAT)
+    state = line_state(tfl_lines)
+    manifest = read_manifest(input_gdb)
+    if (manifest.get('check_out_date') == check_out and manifest.get('line_count') == state['line_count']
+            and manifest.get('last_edited') == state['last_edited'] and arcpy.Exists(out_fc)):
+        arcpy.AddMessage('Line changes are up to date ({} changed lines) - reusing them'.format(manifest.get('changed_count')))
+        return out_fc
+
+    if arcpy.Exists(out_fc):
+        arcpy.Delete_management(out_fc)
+    changed_lines = arcpy.MakeFeatureLayer_management(tfl_lines, 'line_changes_fl', EDIT_DATE_FIELD + " > date '" + check_out + "'")
+    arcpy.CopyFeatures_management(changed_lines, out_fc)
+    arcpy.Delete_management(changed_lines)
+
+    manifest = {'check_out_date': check_out,
+                'line_count': state['line_count'],
+                'last_edited': state['last_edited'],
+                'changed_count': int(arcpy.GetCount_management(out_fc)[0]),
+                'built': datetime.now().strftime(DATE_FORMAT)}
+    with open(manifest_path(input_gdb), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    arcpy.AddMessage('Saved {} changed lines'.format(manifest['changed_count']))
+    return out_fc
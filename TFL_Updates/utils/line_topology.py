@@ -0,0 +1,269 @@
+######################################################################
+## line_topology.py
+## Purpose: Check the TFL line topology rules directly from line geometries
+##          with Shapely/NumPy, without building a geodatabase topology.
+##          Has no arcpy dependency so it can be run and tested anywhere
+###############################################################################
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+# Rule descriptions match those written to RuleDescription by a geodatabase topology
+MUST_NOT_OVERLAP = 'Must Not Overlap'
+MUST_NOT_INTERSECT = 'Must Not Intersect'
+MUST_NOT_HAVE_DANGLES = 'Must Not Have Dangles'
+MUST_NOT_SELF_OVERLAP = 'Must Not Self-Overlap'
+MUST_NOT_SELF_INTERSECT = 'Must Not Self-Intersect'
+MUST_BE_SINGLE_PART = 'Must Be Single Part'
+
+LINE_RULES = [MUST_NOT_OVERLAP, MUST_NOT_INTERSECT, MUST_NOT_HAVE_DANGLES,
+              MUST_NOT_SELF_OVERLAP, MUST_NOT_SELF_INTERSECT, MUST_BE_SINGLE_PART]
+
+# Same cluster tolerance as the geodatabase topology used previously
+DEFAULT_TOLERANCE = 0.0001
+
+# rule: one of LINE_RULES, oids: tuple of the line object IDs involved, geometry: Shapely point or line showing the error
+TopologyError = namedtuple('TopologyError', ['rule', 'oids', 'geometry'])
+
+
+def validate_line_topology(oids, geometries, tolerance=DEFAULT_TOLERANCE, rules=None, seed_oids=None, seed_extents=None):
+    """
+    Checks lines against the line topology rules and returns the errors found.
+
+    If seed_oids is given, only those lines and their spatial neighbours (lines within the tolerance) are
+    checked, and only errors involving a seed line are returned. Every line touching a seed line is in
+    the neighbourhood, so the errors for the seed lines are the same as a full check would find. When an
+    edited line has moved, the lines it used to touch can be left with errors (e.g. dangles) away from
+    its new geometry - pass its previous extent in seed_extents so the lines there are seeds as well.
+
+    Args:
+        oids: Sequence of object IDs, one for each line
+        geometries: Sequence of Shapely LineStrings/MultiLineStrings
+        tolerance: Distance within which points are considered coincident
+        rules: list of rules to check. Defaults to all of LINE_RULES
+        seed_oids: Optional sequence of object IDs (e.g. edited lines) to limit the check to
+        seed_extents: Optional sequence of (xmin, ymin, xmax, ymax) - lines within these are also seeds. Only
+                      used with seed_oids
+
+    Returns:
+        list of TopologyErrors, sorted by rule and object IDs
+    """
+    rules = rules or LINE_RULES
+    oids = np.asarray(oids)
+    geometries = np.asarray(geometries, dtype=object)
+    valid = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    oids, geometries = oids[valid], geometries[valid]
+
+    if seed_oids is not None:
+        seed_mask = np.isin(oids, [int(oid) for oid in seed_oids])
+        if seed_extents is not None and len(seed_extents) and len(geometries):
+            areas = shapely.box(*np.asarray(seed_extents, dtype=float).reshape(-1, 4).T)
+            _, in_areas = shapely.STRtree(geometries).query(areas, predicate='dwithin', distance=tolerance)
+            seed_mask[in_areas] = True
+        seed_oids = set(int(oid) for oid in oids[seed_mask])
+        in_neighbourhood = neighbourhood(geometries, seed_mask, tolerance)
+        errors = validate_line_topology(oids[in_neighbourhood], geometries[in_neighbourhood], tolerance, rules)
+        return [error for error in errors if seed_oids.intersection(error.oids)]
+
+    errors = []
+    if MUST_BE_SINGLE_PART in rules:
+        errors.extend(check_single_part(oids, geometries))
+    if MUST_NOT_SELF_OVERLAP in rules or MUST_NOT_SELF_INTERSECT in rules:
+        errors.extend(check_self(oids, geometries, tolerance, rules))
+    if MUST_NOT_OVERLAP in rules or MUST_NOT_INTERSECT in rules:
+        errors.extend(check_pairs(oids, geometries, tolerance, rules))
+    if MUST_NOT_HAVE_DANGLES in rules:
+        errors.extend(check_dangles(oids, geometries, tolerance))
+
+    return sorted(errors, key=lambda error: (error.rule, error.oids))
+
+
+def extents(oids, geometries):
+    """Returns {object ID: [xmin, ymin, xmax, ymax]} of each line, e.g. to save with a passing check for seed_extents"""
+    bounds = shapely.bounds(np.asarray(geometries, dtype=object))
+    return dict((int(oid), [float(value) for value in line_bounds]) for oid, line_bounds in zip(oids, bounds)
+                if not np.isnan(line_bounds).any())
+
+
+def neighbourhood(geometries, seed_mask, tolerance=DEFAULT_TOLERANCE):
+    """
+    Expands a set of lines to include every line within the tolerance of them, using an STRtree.
+
+    Args:
+        geometries: array of Shapely lines
+        seed_mask: boolean array, True for the starting lines
+        tolerance: Distance within which lines are considered to touch
+
+    Returns:
+        boolean array, True for the seed lines and their neighbours
+    """
+    seed_mask = np.asarray(seed_mask, dtype=bool)
+    in_neighbourhood = seed_mask.copy()
+    if seed_mask.any():
+        tree = shapely.STRtree(geometries)
+        _, neighbours = tree.query(geometries[seed_mask], predicate='dwithin', distance=tolerance)
+        in_neighbourhood[neighbours] = True
+    return in_neighbourhood
+
+
+def check_single_part(oids, geometries):
+    """Multipart lines break the Must Be Single Part rule"""
+    counts = shapely.get_num_geometries(geometries)
+    multipart = shapely.get_type_id(geometries) == shapely.GeometryType.MULTILINESTRING
+    return [TopologyError(MUST_BE_SINGLE_PART, (int(oid),), geometry)
+            for oid, geometry in zip(oids[multipart & (counts > 1)], geometries[multipart & (counts > 1)])]
+
+
+def check_self(oids, geometries, tolerance, rules=LINE_RULES):
+    """
+    Finds lines that overlap or cross themselves. Only non-simple lines are examined: each is split into its
+    segments, and the segments that meet (found with an STRtree) are compared in pairs. Segments sharing a
+    stretch of line are self-overlaps - including consecutive segments where the line doubles back. Other
+    segments meeting at a point (not a vertex they share, or an original end point) are self-intersections.
+    Segments are compared before any noding, since noding merges the repeated pieces of a self-overlap.
+    """
+    errors = []
+    non_simple = ~shapely.is_simple(geometries)
+    for oid, geometry in zip(oids[non_simple], geometries[non_simple]):
+        segments, part, position = _segments(geometry)
+        tree = shapely.STRtree(segments)
+        left, right = tree.query(segments, predicate='intersects')
+        pairs = left < right        # each pair once, and not a segment with itself
+        left, right = left[pairs], right[pairs]
+        consecutive = (part[left] == part[right]) & (position[right] - position[left] == 1)
+
+        overlaps, points = [], []
+        for a, b, is_consecutive in zip(left, right, consecutive):
+            pieces = shapely.get_parts(shapely.intersection(segments[a], segments[b]))
+            lines = [piece for piece in pieces if piece.geom_type == 'LineString' and piece.length > tolerance]
+            if lines:
+                overlaps.extend(lines)
+            elif not is_consecutive:
+                points.extend(piece for piece in pieces if piece.geom_type == 'Point')
+
+        if overlaps and MUST_NOT_SELF_OVERLAP in rules:
+            errors.append(TopologyError(MUST_NOT_SELF_OVERLAP, (int(oid),), shapely.line_merge(shapely.union_all(overlaps))))
+
+        if points and MUST_NOT_SELF_INTERSECT in rules:
+            original_keys = set(map(tuple, _snap_keys(_end_points(shapely.get_parts(geometry)), tolerance)))
+            overlap = shapely.union_all(overlaps) if overlaps else None
+            nodes = set()
+            for point in points:
+                key = tuple(_snap_keys(shapely.get_coordinates(point), tolerance)[0])
+                # where the line meets a stretch it overlaps, the overlap is the error
+                if key not in original_keys and (overlap is None or not shapely.dwithin(overlap, point, tolerance)):
+                    nodes.add(key)
+            for key in sorted(nodes):
+                point = shapely.points(np.asarray(key, dtype=float) * tolerance)
+                errors.append(TopologyError(MUST_NOT_SELF_INTERSECT, (int(oid),), point))
+    return errors
+
+
+def check_pairs(oids, geometries, tolerance, rules=LINE_RULES):
+    """
+    Compares each pair of lines whose envelopes meet (found with an STRtree). Shared line segments break
+    Must Not Overlap, and meeting anywhere other than a shared end point breaks Must Not Intersect.
+    """
+    errors = []
+    if len(geometries) < 2:
+        return errors
+
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate='dwithin', distance=tolerance)
+    pairs = left < right        # each pair once, and not a line with itself
+    left, right = left[pairs], right[pairs]
+
+    for a, b in zip(left, right):
+        pair_oids = tuple(sorted((int(oids[a]), int(oids[b]))))
+        intersection = shapely.intersection(geometries[a], geometries[b], grid_size=None)
+        if intersection.is_empty:
+            # within tolerance but not touching - treat the closest point as where they meet
+            intersection = shapely.shortest_line(geometries[a], geometries[b]).interpolate(0.5, normalized=True)
+
+        parts = shapely.get_parts(intersection)
+        lines = [part for part in parts if part.geom_type in ('LineString', 'MultiLineString') and part.length > tolerance]
+        points = [part for part in parts if part.geom_type == 'Point']
+
+        if lines and MUST_NOT_OVERLAP in rules:
+            errors.append(TopologyError(MUST_NOT_OVERLAP, pair_oids, shapely.line_merge(shapely.union_all(lines))))
+
+        if points and MUST_NOT_INTERSECT in rules:
+            ends_a = shapely.points(_end_points(shapely.get_parts(geometries[a])))
+            ends_b = shapely.points(_end_points(shapely.get_parts(geometries[b])))
+            for point in points:
+                at_end_a = shapely.dwithin(ends_a, point, tolerance).any()
+                at_end_b = shapely.dwithin(ends_b, point, tolerance).any()
+                if not (at_end_a and at_end_b):
+                    errors.append(TopologyError(MUST_NOT_INTERSECT, pair_oids, point))
+    return errors
+
+
+def check_dangles(oids, geometries, tolerance):
+    """
+    Finds end points that don't touch any other line. End points are snapped to the tolerance and counted -
+    a node used by only one end point is a dangle unless it touches the interior of another line.
+    """
+    part_index = []
+    parts = []
+    for index, geometry in enumerate(geometries):
+        for part in shapely.get_parts(geometry):
+            part_index.append(index)
+            parts.append(part)
+    if not parts:
+        return []
+    part_index = np.repeat(np.asarray(part_index), 2)
+    ends = _end_points(parts)
+
+    keys = _snap_keys(ends, tolerance)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    candidates = np.flatnonzero(counts[inverse.ravel()] == 1)
+    if not len(candidates):
+        return []
+
+    # an end point touching another line's interior (a T junction) is not a dangle
+    tree = shapely.STRtree(geometries)
+    points = shapely.points(ends[candidates])
+    point_index, line_index = tree.query(points, predicate='dwithin', distance=tolerance)
+    touches_other = np.zeros(len(candidates), dtype=bool)
+    other = line_index != part_index[candidates][point_index]
+    touches_other[point_index[other]] = True
+
+    return [TopologyError(MUST_NOT_HAVE_DANGLES, (int(oids[part_index[candidate]]),), point)
+            for candidate, point, touches in zip(candidates, points, touches_other) if not touches]
+
+
+def _end_points(lines):
+    """Returns an (n * 2, 2) array of the first and last coordinate of each line"""
+    ends = []
+    for line in lines:
+        coords = shapely.get_coordinates(line)
+        ends.append(coords[0])
+        ends.append(coords[-1])
+    return np.asarray(ends, dtype=float).reshape(-1, 2)
+
+
+def _segments(geometry):
+    """
+    Splits a line into its two point segments, dropping repeated vertices.
+
+    Returns:
+        (array of Shapely segments, part number of each segment, position of each segment within its part)
+    """
+    segments, part, position = [], [], []
+    for part_number, line in enumerate(shapely.get_parts(geometry)):
+        coords = shapely.get_coordinates(line)
+        coords = coords[np.r_[True, np.any(np.diff(coords, axis=0) != 0, axis=1)]]
+        if len(coords) < 2:
+            continue
+        segments.append(shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1)))
+        part.append(np.full(len(coords) - 1, part_number))
+        position.append(np.arange(len(coords) - 1))
+    if not segments:
+        return np.array([], dtype=object), np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(segments), np.concatenate(part), np.concatenate(position)
+
+
+def _snap_keys(coordinates, tolerance):
+    """Snaps coordinates to a grid the size of the tolerance so coincident points share an integer key"""
+    return np.round(np.asarray(coordinates, dtype=float).reshape(-1, 2) / tolerance).astype(np.int64)
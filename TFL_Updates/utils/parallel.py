@@ -0,0 +1,57 @@
+######################################################################
+## parallel.py
+## Purpose: Run independent pieces of TFL tool work in a process pool from
+##          within an ArcGIS script tool
+###############################################################################
+import multiprocessing
+import os
+import sys
+
+
+def uses_processes(item_count, processes=None):
+    """Returns True if map_in_processes would run this many items in worker processes, False if it would run
+    them in this process (one item or one core). Work done in workers isn't seen by this process's counters"""
+    return min(processes or multiprocessing.cpu_count(), item_count) > 1
+
+
+def map_in_processes(function, items, processes=None):
+    """
+    Calls function once for each item in a pool of worker processes and returns the results in the same
+    order as items. Falls back to running in this process when there is only one item or one process.
+
+    function must live in an importable module (e.g. utils.*), not in a tool script - the workers import it
+    by name. Tool scripts read their parameters at module level, so the calling script is hidden from the
+    workers while the pool runs to stop them re-running it.
+
+    Args:
+        function: Module level function taking a single argument
+        items: List of arguments, one per call
+        processes: Number of worker processes. Defaults to the number of cores (capped at the number of items)
+
+    Returns:
+        list of results, ordered as items
+    """
+    items = list(items)
+    if not uses_processes(len(items), processes):
+        return [function(item) for item in items]
+    processes = min(processes or multiprocessing.cpu_count(), len(items))
+
+    # Inside ArcMap/ArcGIS Pro sys.executable is the application, not python - point workers at python
+    python_exe = os.path.join(sys.exec_prefix, 'python.exe')
+    if os.path.exists(python_exe):
+        multiprocessing.set_executable(python_exe)
+
+    main_module = sys.modules['__main__']
+    main_file = getattr(main_module, '__file__', None)
+    if main_file:
+        del main_module.__file__
+    try:
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        if main_file:
+            main_module.__file__ = main_file
@@ -0,0 +1,113 @@
+######################################################################
+## polygon_build.py
+## Purpose: Build TFL boundary polygons from lines in memory and carry the
+##          attributes of the previous boundary polygons over to them.
+##          Has no arcpy dependency so it can be run and tested anywhere
+###############################################################################
+import numpy as np
+import pandas as pd
+import shapely
+
+from utils.line_topology import DEFAULT_TOLERANCE
+
+
+def build_polygons(lines, labels=None, label_fields=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Snaps lines together within the cluster tolerance (see snap_lines), nodes and polygonizes them, then transfers attributes from label polygons (the previous boundary) to
+    the new polygons using a point inside each label polygon - the in-memory equivalent of FeatureToPoint
+    (INSIDE) followed by FeatureToPolygon with label features.
+
+    When labels are given, new polygons that don't contain a label point are dropped. When several label
+    points fall in one polygon, the first (lowest object ID) is used.
+
+    Args:
+        lines: Sequence of Shapely lines
+        labels: Optional pandas dataframe of label polygons, with a 'geometry' column and attribute columns
+        label_fields: list of attribute columns to carry over from labels. Defaults to all non-geometry columns
+        tolerance: Cluster tolerance - the same as the topology check, so lines that pass it close their rings
+
+    Returns:
+        Pandas dataframe with a 'geometry' column of Polygons and a column for each label field
+    """
+    lines = np.asarray(lines, dtype=object)
+    lines = lines[~(shapely.is_missing(lines) | shapely.is_empty(lines))]
+    if labels is not None:
+        label_fields = list(label_fields if label_fields is not None else [c for c in labels.columns if c != 'geometry'])
+    else:
+        label_fields = list(label_fields or [])
+
+    if not len(lines):
+        return pd.DataFrame(columns=label_fields + ['geometry'])
+
+    # union nodes the lines at every intersection so polygonize can find all the rings
+    noded = shapely.get_parts(shapely.union_all(snap_lines(lines, tolerance)))
+    polygons = shapely.get_parts(shapely.polygonize(noded))
+    polygons_df = pd.DataFrame({'geometry': polygons})
+
+    if labels is None or not len(labels):
+        for field in label_fields:
+            polygons_df[field] = None
+        return polygons_df[label_fields + ['geometry']]
+
+    labels = labels.sort_index()
+    label_points = shapely.point_on_surface(labels['geometry'].values)
+    tree = shapely.STRtree(polygons)
+    point_index, polygon_index = tree.query(label_points, predicate='within')
+
+    # first label point for each polygon - point_index is in object ID order after the sort above
+    order = np.lexsort((point_index, polygon_index))
+    polygon_index, point_index = polygon_index[order], point_index[order]
+    first = np.unique(polygon_index, return_index=True)[1]
+    polygon_index, point_index = polygon_index[first], point_index[first]
+
+    result = labels.iloc[point_index][label_fields].reset_index(drop=True)
+    result['geometry'] = polygons[polygon_index]
+    return result[label_fields + ['geometry']]
+
+
+def snap_lines(lines, tolerance=DEFAULT_TOLERANCE):
+    """
+    Closes the gaps within the cluster tolerance that FeatureToPolygon would close, so rings that pass the
+    topology check aren't lost when noding exactly. End points within the tolerance of each other are moved
+    to one point (the first of each cluster), then each line is snapped to the end points within the
+    tolerance of it, which adds a vertex where another line ends just short of or past it.
+
+    Args:
+        lines: Sequence of Shapely lines
+        tolerance: Cluster tolerance
+
+    Returns:
+        numpy array of single part Shapely lines
+    """
+    lines = shapely.get_parts(np.asarray(lines, dtype=object))
+    lines = lines[~shapely.is_empty(lines)]
+    if not len(lines):
+        return lines
+    coordinates = [shapely.get_coordinates(line) for line in lines]
+    ends = np.asarray([(coords[0], coords[-1]) for coords in coordinates], dtype=float).reshape(-1, 2)
+
+    # cluster the end points - each end point takes the position of the lowest numbered end point it is joined to
+    tree = shapely.STRtree(shapely.points(ends))
+    left, right = tree.query(shapely.points(ends), predicate='dwithin', distance=tolerance)
+    cluster = np.arange(len(ends))
+    changed = True
+    while changed:
+        lowest = np.minimum(cluster[left], cluster[right])
+        changed = bool((lowest < cluster[left]).any())
+        np.minimum.at(cluster, left, lowest)
+    ends = ends[cluster]
+
+    snapped = []
+    for index, coords in enumerate(coordinates):
+        coords = coords.copy()
+        coords[0], coords[-1] = ends[2 * index], ends[2 * index + 1]
+        snapped.append(shapely.linestrings(coords))
+    snapped = np.asarray(snapped, dtype=object)
+
+    # snap lines to the end points of other lines that stop within the tolerance of them
+    points = shapely.points(np.unique(ends, axis=0))
+    tree = shapely.STRtree(points)
+    line_index, point_index = tree.query(snapped, predicate='dwithin', distance=tolerance)
+    for index in np.unique(line_index):
+        snapped[index] = shapely.snap(snapped[index], shapely.multipoints(points[point_index[line_index == index]]), tolerance)
+    return snapped
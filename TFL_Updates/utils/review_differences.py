@@ -0,0 +1,108 @@
+######################################################################
+## review_differences.py
+## Purpose: Build the review package difference layers (working vs final,
+##          final vs BCGW) at the same time, one worker process per
+##          comparison. Each worker reads its own layers and writes to its
+##          own scratch gdb, and the results are then merged into the
+##          working gdb, so packaging takes as long as the slowest comparison
+###############################################################################
+import os
+import shutil
+import time
+import uuid
+
+import arcpy
+
+from utils import change_detection, geometry_tools, instrumentation
+from utils.parallel import map_in_processes, uses_processes
+
+
+def comparison(name, left, right, left_label, right_label):
+    """
+    Describes one comparison for build_differences.
+
+    Args:
+        name: Name of the difference feature class to create, e.g. 'TFL_01_Boundary_Difference'
+        left: (path, where clause) of the first layer - where clause can be None
+        right: (path, where clause) of the second layer
+        left_label: SOURCE value for areas only in the left layer, e.g. 'Working'
+        right_label: SOURCE value for areas only in the right layer, e.g. 'Final'
+
+    Returns:
+        dict
+    """
+    return {'name': name, 'left': left, 'right': right, 'left_label': left_label, 'right_label': right_label}
+
+
+def compare(job):
+    """
+    Worker for build_differences - reads both layers of one comparison, finds the differences and, if there are
+    any, writes them with a SOURCE field to job['scratch_gdb']. Runs in a worker process, so the job holds only
+    plain values (the spatial reference is passed as a string).
+
+    Returns:
+        dict with the name, the scratch feature class (None if no differences), features read and seconds taken
+    """
+    started = time.time()
+    spatial_reference = arcpy.SpatialReference()
+    spatial_reference.loadFromString(job['spatial_reference'])
+
+    left = geometry_tools.read_features(job['left'][0], where_clause=job['left'][1], spatial_reference=spatial_reference)
+    right = geometry_tools.read_features(job['right'][0], where_clause=job['right'][1], spatial_reference=spatial_reference)
+    differences = change_detection.difference_frame(left['geometry'].values, right['geometry'].values, job['left_label'], job['right_label'])
+
+    out_fc = None
+    if len(differences):
+        arcpy.CreateFileGDB_management(os.path.dirname(job['scratch_gdb']), os.path.basename(job['scratch_gdb']))
+        out_fc = os.path.join(job['scratch_gdb'], job['name'])
+        geometry_tools.write_features(out_fc, differences, 'POLYGON', spatial_reference, change_detection.DIFFERENCE_FIELDS)
+
+    return {'name': job['name'], 'scratch_fc': out_fc, 'features_read': len(left) + len(right),
+            'seconds': time.time() - started}
+
+
+def build_differences(comparisons, out_gdb, spatial_reference, parallel=True, processes=None):
+    """
+    Runs the comparisons (from comparison()) in worker processes and merges the results into out_gdb. A
+    difference feature class is only created when there are differences - any previous one is removed.
+
+    Args:
+        comparisons: list of comparison dicts
+        out_gdb: gdb to save the difference layers in
+        spatial_reference: arcpy SpatialReference the layers are compared (and saved) in
+        parallel: If False, the comparisons run one after another in this process
+        processes: Number of worker processes. Defaults to one per comparison (capped at the number of cores)
+
+    Returns:
+        dict of {name: True if differences were saved}
+    """
+    scratch_folder = os.path.join(arcpy.env.scratchFolder or out_gdb + '_scratch', 'differences_' + uuid.uuid4().hex[:8])
+    os.makedirs(scratch_folder)
+    jobs = [dict(job, spatial_reference=spatial_reference.exportToString(),
+                 scratch_gdb=os.path.join(scratch_folder, job['name'] + '.gdb')) for job in comparisons]
+
+    #reads in this process are already counted by read_features - only reads in worker processes are added below
+    in_workers = parallel and uses_processes(len(jobs), processes)
+    try:
+        if parallel:
+            results = map_in_processes(compare, jobs, processes)
+        else:
+            results = [compare(job) for job in jobs]
+
+        #merge - worker reads aren't seen by this process's counters, so they are added to the open stages here
+        found = {}
+        with instrumentation.stage('merge differences'):
+            for result in results:
+                out_fc = os.path.join(out_gdb, result['name'])
+                if arcpy.Exists(out_fc):
+                    arcpy.Delete_management(out_fc)
+                if result['scratch_fc']:
+                    arcpy.FeatureClassToFeatureClass_conversion(result['scratch_fc'], out_gdb, result['name'])
+                    instrumentation.count(features_written=int(arcpy.GetCount_management(out_fc)[0]))
+                if in_workers:
+                    instrumentation.count(features_read=result['features_read'])
+                arcpy.AddMessage('Compared {} in {:.1f}s'.format(result['name'], result['seconds']))
+                found[result['name']] = bool(result['scratch_fc'])
+        return found
+    finally:
+        shutil.rmtree(scratch_folder, ignore_errors=True)
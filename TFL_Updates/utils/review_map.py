@@ -0,0 +1,132 @@
+######################################################################
+## review_map.py
+## Purpose: Build the review map for a TFL review package from the review
+##          template - an ArcMap .mxd or an ArcGIS Pro .aprx. Layer data
+##          sources are pointed at the review package gdb using a single
+##          listing of the gdb, and a local copy of the template is kept on
+##          disk so it is only copied from the network when it changes
+###############################################################################
+import hashlib
+import os
+import shutil
+import tempfile
+
+import arcpy
+
+# Template layers (by dataset name) that are pointed at the review gdb, or removed from the map if they weren't created
+DERIVED_LAYERS = ['TFL_XX_Line_Changes', 'TFL_XX_Boundary_BCGW_Difference', 'TFL_XX_Boundary_Difference',
+                  'TFL_XX_Sched_A_BCGW_Difference', 'TFL_XX_Schedule_A_Difference']
+# Template layers that are pointed at the review gdb, and left as they are if the gdb doesn't have them
+BASE_LAYERS = ['TFL_XX_Line', 'TFL_XX_Boundary', 'TFL_XX_Schedule_A']
+
+# Folder the local copies of templates are kept in - the same for every tool run, so the copy outlives the process
+TEMPLATE_CACHE_FOLDER = os.path.join(tempfile.gettempdir(), 'TFL_review_templates')
+
+
+def list_datasets(gdb):
+    """Returns {lower case name: name} of every feature class in the gdb (including in feature datasets) from one listing"""
+    datasets = {}
+    for _, _, filenames in arcpy.da.Walk(gdb, datatype='FeatureClass'):
+        for filename in filenames:
+            datasets[filename.lower()] = filename
+    return datasets
+
+
+def source_action(template_dataset, datasets, input_tfl):
+    """
+    Decides what to do with a template layer.
+
+    Args:
+        template_dataset: Dataset name of the layer in the template, e.g. 'TFL_XX_Line'
+        datasets: Feature classes in the review gdb, from list_datasets
+        input_tfl: TFL name replacing TFL_XX, e.g. 'TFL_01'
+
+    Returns:
+        ('replace', dataset name), ('remove', None) or (None, None) to leave the layer as it is
+    """
+    if template_dataset not in DERIVED_LAYERS and template_dataset not in BASE_LAYERS:
+        return None, None
+    dataset = datasets.get(template_dataset.replace('TFL_XX', input_tfl).lower())
+    if dataset:
+        return 'replace', dataset
+    if template_dataset in DERIVED_LAYERS:
+        return 'remove', None
+    return None, None
+
+
+def cached_template(template):
+    """Returns a local copy of the template, copied again only when the template's modified time or size no longer
+    match the copy's (shutil.copy2 gives the copy the template's modified time)"""
+    local_template = os.path.join(TEMPLATE_CACHE_FOLDER, 'review_template_' + hashlib.sha1(template.encode('utf-8')).hexdigest()[:8] +
+                                  os.path.splitext(template)[1])
+    template_stat = os.stat(template)
+    try:
+        local_stat = os.stat(local_template)
+        if local_stat.st_mtime == template_stat.st_mtime and local_stat.st_size == template_stat.st_size:
+            return local_template
+    except OSError:
+        pass    # not copied yet
+
+    if not os.path.isdir(TEMPLATE_CACHE_FOLDER):
+        os.makedirs(TEMPLATE_CACHE_FOLDER)
+    shutil.copy2(template, local_template)
+    return local_template
+
+
+def build_review_map(template, gdb, input_tfl, review_map):
+    """
+    Saves a copy of the review template with its layers pointed at the review package gdb. Derived layers
+    (line changes, difference layers) not in the gdb are removed from the map.
+
+    Args:
+        template: Path to the review template - .mxd (ArcMap) or .aprx (ArcGIS Pro)
+        gdb: Path to the review package gdb
+        input_tfl: TFL name replacing TFL_XX in the template dataset names, e.g. 'TFL_01'
+        review_map: Path to save the review map to (replaced if it exists)
+    """
+    datasets = list_datasets(gdb)
+    local_template = cached_template(template)
+    if os.path.exists(review_map):
+        os.remove(review_map)
+
+    if os.path.splitext(template)[1].lower() == '.aprx':
+        _build_aprx(local_template, gdb, input_tfl, review_map, datasets)
+    else:
+        _build_mxd(local_template, gdb, input_tfl, review_map, datasets)
+
+
+def _build_mxd(template, gdb, input_tfl, review_map, datasets):
+    """Points the layers of an ArcMap template at the gdb and saves a copy - the template itself isn't changed"""
+    mxd = arcpy.mapping.MapDocument(template)
+    for data_frame in arcpy.mapping.ListDataFrames(mxd):
+        for layer in arcpy.mapping.ListLayers(mxd, data_frame=data_frame):
+            if not layer.supports('DATASOURCE'):
+                continue
+            action, dataset = source_action(layer.datasetName, datasets, input_tfl)
+            if action == 'replace':
+                layer.replaceDataSource(gdb, 'FILEGDB_WORKSPACE', dataset)
+                layer.name = dataset
+            elif action == 'remove':
+                arcpy.mapping.RemoveLayer(data_frame, layer)
+    mxd.saveACopy(review_map)
+    del mxd
+
+
+def _build_aprx(template, gdb, input_tfl, review_map, datasets):
+    """Points the layers of an ArcGIS Pro template at the gdb and saves a copy - the template itself isn't changed"""
+    aprx = arcpy.mp.ArcGISProject(template)
+    for map_object in aprx.listMaps():
+        for layer in map_object.listLayers():
+            if not layer.supports('DATASOURCE'):
+                continue
+            connection = layer.connectionProperties
+            action, dataset = source_action(connection.get('dataset', ''), datasets, input_tfl)
+            if action == 'replace':
+                layer.updateConnectionProperties(connection, {'connection_info': {'database': gdb},
+                                                              'dataset': dataset,
+                                                              'workspace_factory': 'File Geodatabase'})
+                layer.name = dataset
+            elif action == 'remove':
+                map_object.removeLayer(layer)
+    aprx.saveACopy(review_map)
+    del aprx
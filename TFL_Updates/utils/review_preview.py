@@ -0,0 +1,178 @@
+######################################################################
+## review_preview.py
+## Purpose: Draw static PNG/PDF previews of a TFL review package (the
+##          boundary, line changes and difference layers) with matplotlib,
+##          so reviewers can see what changed without opening the review
+##          map. Geometries are simplified to the resolution of each image
+##          so large boundaries draw quickly. Has no arcpy dependency
+###############################################################################
+import numpy as np
+import shapely
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')   # draw to files only - no display needed
+    from matplotlib import pyplot
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.collections import LineCollection
+    from matplotlib.patches import Patch, PathPatch
+    from matplotlib.path import Path
+except ImportError:     # previews are skipped
+    matplotlib = None
+
+# Image size in inches and resolution - together they set how far geometries are simplified
+FIGURE_SIZE = (11, 8.5)
+DPI = 150
+
+# The extent is split into TILE_ROWS x TILE_COLUMNS tiles - only tiles with changes are drawn
+TILE_ROWS = 3
+TILE_COLUMNS = 3
+
+
+def available():
+    """Returns True if matplotlib is installed and previews can be drawn"""
+    return matplotlib is not None
+
+
+def simplify(geometries, extent, pixels):
+    """
+    Simplifies geometries to the resolution they will be drawn at - vertices closer together than a pixel
+    can't be seen, so they are dropped.
+
+    Args:
+        geometries: Sequence of Shapely geometries
+        extent: (xmin, ymin, xmax, ymax) of the image
+        pixels: Width of the image in pixels
+
+    Returns:
+        numpy array of simplified Shapely geometries
+    """
+    tolerance = max(extent[2] - extent[0], extent[3] - extent[1]) / float(pixels)
+    return shapely.simplify(np.asarray(geometries, dtype=object), tolerance, preserve_topology=True)
+
+
+def tiles(extent, rows=TILE_ROWS, columns=TILE_COLUMNS):
+    """Returns (row, column, tile extent) for each tile of the extent, from the top left"""
+    width = (extent[2] - extent[0]) / float(columns)
+    height = (extent[3] - extent[1]) / float(rows)
+    return [(row + 1, column + 1, (extent[0] + column * width, extent[3] - (row + 1) * height,
+                                   extent[0] + (column + 1) * width, extent[3] - row * height))
+            for row in range(rows) for column in range(columns)]
+
+
+def render_previews(layers, title, out_base, formats=('png', 'pdf')):
+    """
+    Draws an overview of the whole extent and a close-up of each tile that has changes, saved as PNG files
+    and/or one PDF with a page per image.
+
+    Args:
+        layers: list of dicts, in drawing order, with
+                'label': legend label
+                'geometries': Shapely polygons or lines
+                'color': matplotlib colour
+                'fill': True to fill polygons, False to draw outlines
+                'change': True if the layer shows changes (tiles are only drawn where there are changes)
+        title: Title drawn on each image, e.g. 'TFL 01 review'
+        out_base: Path and name prefix of the files, e.g. <documents folder>/TFL_01_preview
+        formats: 'png' and/or 'pdf'
+
+    Returns:
+        list of the files written
+    """
+    if not available():
+        return []
+
+    layers = [dict(layer, geometries=_present(layer['geometries'])) for layer in layers]
+    all_geometries = np.concatenate([layer['geometries'] for layer in layers])
+    if not len(all_geometries):
+        return []
+    extent = _square(shapely.total_bounds(all_geometries))
+    changes = np.concatenate([layer['geometries'] for layer in layers if layer.get('change')] or [np.array([], dtype=object)])
+    change_tree = shapely.STRtree(changes)
+
+    pages = [('', extent)]
+    for row, column, tile_extent in tiles(extent):
+        if len(change_tree.query(shapely.box(*tile_extent), predicate='intersects')):
+            pages.append(('_tile_r{}_c{}'.format(row, column), tile_extent))
+
+    written = []
+    pdf = PdfPages(out_base + '.pdf') if 'pdf' in formats else None
+    try:
+        for suffix, page_extent in pages:
+            figure = _draw(layers, page_extent, title + (' - tile ' + suffix[6:].replace('_', ' ') if suffix else ''))
+            if 'png' in formats:
+                figure.savefig(out_base + suffix + '.png', dpi=DPI)
+                written.append(out_base + suffix + '.png')
+            if pdf:
+                pdf.savefig(figure)
+            pyplot.close(figure)
+    finally:
+        if pdf:
+            pdf.close()
+            written.append(out_base + '.pdf')
+    return written
+
+
+def _draw(layers, extent, title):
+    """Draws the layers clipped to the extent on a new figure and returns it"""
+    figure, axes = pyplot.subplots(figsize=FIGURE_SIZE)
+    clip_box = shapely.box(*extent)
+    handles = []
+    for layer in layers:
+        geometries = layer['geometries']
+        geometries = geometries[shapely.intersects(geometries, clip_box)]
+        if not len(geometries):
+            continue
+        geometries = simplify(geometries, extent, FIGURE_SIZE[0] * DPI)
+        polygons = [part for part in shapely.get_parts(geometries) if part.geom_type == 'Polygon']
+        lines = [part for part in shapely.get_parts(geometries) if part.geom_type == 'LineString']
+        if polygons:
+            axes.add_patch(PathPatch(_polygon_path(polygons), facecolor=layer['color'] if layer.get('fill') else 'none',
+                                     edgecolor=layer['color'], alpha=0.6 if layer.get('fill') else 1.0, linewidth=0.8))
+        if lines:
+            axes.add_collection(LineCollection([shapely.get_coordinates(line) for line in lines],
+                                               colors=layer['color'], linewidths=1.2 if layer.get('change') else 0.6))
+        handles.append(Patch(facecolor=layer['color'] if layer.get('fill') else 'none', edgecolor=layer['color'], label=layer['label']))
+
+    axes.set_xlim(extent[0], extent[2])
+    axes.set_ylim(extent[1], extent[3])
+    axes.set_aspect('equal')
+    axes.set_xticks([])
+    axes.set_yticks([])
+    axes.set_title(title)
+    if handles:
+        axes.legend(handles=handles, loc='lower right', fontsize='small')
+    figure.tight_layout()
+    return figure
+
+
+def _polygon_path(polygons):
+    """Returns one compound matplotlib Path for all the polygons (holes included), so a layer is a single patch"""
+    vertices, codes = [], []
+    for polygon in polygons:
+        for ring in [polygon.exterior] + list(polygon.interiors):
+            coordinates = shapely.get_coordinates(ring)
+            vertices.append(coordinates)
+            codes.append([Path.MOVETO] + [Path.LINETO] * (len(coordinates) - 2) + [Path.CLOSEPOLY])
+    return Path(np.concatenate(vertices), np.concatenate(codes))
+
+
+def _present(geometries):
+    """Returns the geometries as an array without missing or empty ones"""
+    geometries = np.asarray(geometries, dtype=object)
+    return geometries[~(shapely.is_missing(geometries) | shapely.is_empty(geometries))]
+
+
+def _square(bounds):
+    """Pads the bounds to the shape of the figure (with a small margin) so tiles and the overview aren't stretched"""
+    xmin, ymin, xmax, ymax = bounds
+    width = max(xmax - xmin, 1.0)
+    height = max(ymax - ymin, 1.0)
+    ratio = FIGURE_SIZE[0] / float(FIGURE_SIZE[1])
+    if width / height < ratio:
+        width = height * ratio
+    else:
+        height = width / ratio
+    x, y = (xmin + xmax) / 2.0, (ymin + ymax) / 2.0
+    width, height = width * 1.05, height * 1.05
+    return (x - width / 2.0, y - height / 2.0, x + width / 2.0, y + height / 2.0)
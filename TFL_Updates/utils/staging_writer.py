@@ -0,0 +1,316 @@
+######################################################################
+## staging_writer.py
+## Purpose: Replace one TFL's rows in a province-wide staging feature
+##          class without backing up the whole feature class. Only the
+##          rows being replaced are saved to an undo feature class, the
+##          delete and insert are done in one edit session, and the last
+##          write to a feature class can be rolled back. StagingTransaction
+##          updates several staging feature classes all-or-nothing
+###############################################################################
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import arcpy
+
+from utils import field_mappings, instrumentation
+from utils.field_mappings import SKIP_TYPES
+from utils.parallel import map_in_processes
+
+UNDO_SUFFIX = '_UNDO'
+
+
+def undo_path(target):
+    """Returns the path of the undo feature class for a staging feature class (at the root of its gdb)"""
+    return os.path.join(_workspace(target), os.path.basename(target) + UNDO_SUFFIX)
+
+
+def manifest_path(target):
+    """Returns the path of the undo manifest kept beside the staging gdb"""
+    return os.path.splitext(_workspace(target))[0] + '_undo.json'
+
+
+def read_manifest(target):
+    """Returns the undo manifest of the target's gdb - {feature class name: last write} - or {} if there isn't one"""
+    try:
+        with open(manifest_path(target)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def matching_fields(source, target):
+    """Returns the (source field, target field) pairs to copy, matched by name (ignoring case) as Append does with
+    NO_TEST. Geometry is always copied"""
+    source_fields = dict((field.name.lower(), field.name) for field in arcpy.ListFields(source))
+    return [('SHAPE@', 'SHAPE@')] + [(source_fields[field.name.lower()], field.name) for field in arcpy.ListFields(target)
+                                     if field.editable and field.type not in SKIP_TYPES and field.name.lower() in source_fields]
+
+
+def replace_rows(target, delete_where, source, source_where=None):
+    """
+    Replaces the rows of a staging feature class matching delete_where (e.g. one FOREST_FILE_ID) with the rows of
+    source. The rows being replaced are first copied to the undo feature class (replacing the previous one),
+    then the delete and insert are done in one edit session, so either both happen or neither does. The
+    inserted object IDs are recorded in the undo manifest for rollback.
+
+    Args:
+        target: Staging feature class
+        delete_where: Where clause selecting the rows to replace, or None to only insert
+        source: Feature class or layer with the new rows
+        source_where: Optional where clause on source
+
+    Returns:
+        int number of rows inserted
+    """
+    workspace = _workspace(target)
+    undo_fc = undo_path(target)
+    _record(target, None)   # the previous undo is about to be replaced - it can't be rolled back any more
+    if arcpy.Exists(undo_fc):
+        arcpy.Delete_management(undo_fc)
+    arcpy.FeatureClassToFeatureClass_conversion(target, workspace, os.path.basename(undo_fc), delete_where or '1 = 0')
+
+    pairs = matching_fields(source, target)
+    with arcpy.da.SearchCursor(source, [source_field for source_field, _ in pairs], source_where) as cursor:
+        rows = [row for row in cursor]
+
+    deleted, inserted = _edit(workspace, target, delete_where, [target_field for _, target_field in pairs], rows)
+    _record(target, {'delete_where': delete_where, 'deleted': deleted, 'inserted_oids': inserted,
+                     'written': datetime.now().replace(microsecond=0).isoformat()})
+    return len(inserted)
+
+
+def rollback(target):
+    """
+    Undoes the last replace_rows on a staging feature class - removes the rows it inserted and restores the rows
+    it replaced from the undo feature class, in one edit session.
+
+    Returns:
+        True if rolled back, False if there was nothing to roll back
+    """
+    entry = read_manifest(target).get(os.path.basename(target))
+    undo_fc = undo_path(target)
+    if not entry or not arcpy.Exists(undo_fc):
+        arcpy.AddWarning('Nothing to roll back for ' + target)
+        return(False)
+
+    pairs = matching_fields(undo_fc, target)
+    with arcpy.da.SearchCursor(undo_fc, [source_field for source_field, _ in pairs]) as cursor:
+        rows = [row for row in cursor]
+
+    oid_field = arcpy.Describe(target).OIDFieldName
+    inserted_where = oid_field + ' IN (' + ','.join(str(oid) for oid in entry['inserted_oids']) + ')' if entry['inserted_oids'] else None
+    _edit(_workspace(target), target, inserted_where, [target_field for _, target_field in pairs], rows)
+
+    _record(target, None)
+    arcpy.Delete_management(undo_fc)
+    arcpy.AddMessage('Rolled back {}: removed {} rows, restored {}'.format(os.path.basename(target), len(entry['inserted_oids']), len(rows)))
+    return(True)
+
+
+class StagingTransaction(object):
+    """
+    Updates several staging feature classes all-or-nothing, in two phases:
+
+    prepare - the new rows for every target are written to scratch feature classes (made from the target
+              schema) in worker processes, with their attributes set by the target's mapping in
+              utils.field_mappings. Each target's staged rows must match the source rows counted when it
+              was added, and the number of rows the target expects (e.g. exactly one overview). Staging
+              isn't touched, so a failure here (including an error while staging) costs nothing.
+    commit  - each target's rows are replaced from its scratch feature class with replace_rows. If any target
+              fails, the targets already committed are rolled back from their undo feature classes.
+
+    Usage:
+        transaction = StagingTransaction()
+        transaction.add(staging_fc, "FOREST_FILE_ID = 'TFL 1'", source_fc, parameters={'submitted_timestamp': datetime.now()})
+        if transaction.run():
+            ...
+    """
+
+    def __init__(self, parallel=True, processes=None):
+        self.parallel = parallel
+        self.processes = processes
+        self.jobs = []
+        self.results = []
+        self.scratch_folder = None
+
+    def add(self, target, delete_where, source, source_where=None, mapping=None, parameters=None, label=None,
+            min_rows=0, max_rows=None):
+        """
+        Adds a target to the transaction.
+
+        Args:
+            target: Staging feature class
+            delete_where: Where clause selecting the rows to replace, or None to only insert
+            source: Feature class with the new rows (a path - layers can't be passed to worker processes)
+            source_where: Optional where clause on source
+            mapping: Name of the mapping in field_mappings.STAGING_MAPPINGS. Defaults to the target feature class name
+            parameters: {name: value} of the run parameters used by the mapping, e.g. the submission time
+            label: Name used in messages. Defaults to the target feature class name
+            min_rows: Fewest rows the target can be given, e.g. 1 so a TFL's rows aren't replaced with nothing
+            max_rows: Most rows the target can be given, or None for no limit
+        """
+        projection = field_mappings.compile_mapping(mapping or os.path.basename(target), source, target)
+        self.jobs.append({'target': target, 'delete_where': delete_where, 'source': source, 'source_where': source_where,
+                          'projection': projection, 'values': field_mappings.values(projection, parameters or {}),
+                          'label': label or os.path.basename(target), 'source_rows': _count(source, source_where),
+                          'min_rows': min_rows, 'max_rows': max_rows})
+
+    def prepare(self):
+        """Stages the new rows for every target and checks them. Returns True if every target is ready to commit"""
+        self.scratch_folder = os.path.join(arcpy.env.scratchFolder or os.environ.get('TEMP', '.'), 'staging_' + uuid.uuid4().hex[:8])
+        os.makedirs(self.scratch_folder)
+        jobs = [dict(job, scratch_gdb=os.path.join(self.scratch_folder, 'stage_{}.gdb'.format(index)))
+                for index, job in enumerate(self.jobs)]
+
+        try:
+            with instrumentation.stage('stage staging rows'):
+                if self.parallel:
+                    self.results = map_in_processes(stage_rows, jobs, self.processes)
+                else:
+                    self.results = [stage_rows(job) for job in jobs]
+        except Exception as e:
+            arcpy.AddError('Unable to stage the new rows: {}'.format(e))
+            return(False)
+
+        ready = True
+        for job, result in zip(self.jobs, self.results):
+            staged = int(arcpy.GetCount_management(result['staged_fc'])[0])
+            if staged != job['source_rows']:
+                arcpy.AddWarning('{}: staged {} of the {} source rows'.format(job['label'], staged, job['source_rows']))
+                ready = False
+            if staged < job['min_rows'] or (job['max_rows'] is not None and staged > job['max_rows']):
+                arcpy.AddWarning('{}: {} rows staged - expected at least {}{}'.format(
+                    job['label'], staged, job['min_rows'], '' if job['max_rows'] is None else ' and at most {}'.format(job['max_rows'])))
+                ready = False
+            for kind, target_field, value in job['projection'].dropped:
+                arcpy.AddWarning('{}: {} {} to {} can\'t be mapped - the field is missing'.format(job['label'], kind, value, target_field))
+                ready = False
+            arcpy.AddMessage('Staged {} rows for {} in {:.1f}s'.format(result['rows'], job['label'], result['seconds']))
+        return ready
+
+    def commit(self):
+        """Replaces the rows of every target from the staged rows. If any target fails, the targets already
+        committed are rolled back and False is returned"""
+        committed = []
+        with instrumentation.stage('commit staging'):
+            try:
+                for job, result in zip(self.jobs, self.results):
+                    appended = replace_rows(job['target'], job['delete_where'], result['staged_fc'])
+                    committed.append(job)
+                    instrumentation.count(features_written=appended)
+                    arcpy.AddMessage('Updated {} in Staging folder ({} rows)'.format(job['label'], appended))
+            except Exception as e:
+                arcpy.AddError('Unable to update {} in staging: {}'.format(job['label'], e))
+                for done in reversed(committed):
+                    rollback(done['target'])
+                arcpy.AddWarning('Rolled back the staging updates - staging is as it was before the submission')
+                return(False)
+        return(True)
+
+    def cleanup(self):
+        """Removes the scratch feature classes"""
+        if self.scratch_folder:
+            shutil.rmtree(self.scratch_folder, ignore_errors=True)
+            self.scratch_folder = None
+
+    def run(self):
+        """Prepares and, if every target is ready, commits. Returns True if staging was updated"""
+        try:
+            if not self.prepare():
+                arcpy.AddError('Staging rows failed their checks - staging has not been changed')
+                return(False)
+            return self.commit()
+        finally:
+            self.cleanup()
+
+
+def stage_rows(job):
+    """
+    Worker for StagingTransaction.prepare - creates a scratch feature class with the target's schema in
+    job['scratch_gdb'] and inserts the source rows through the compiled mapping (job['projection']), with the
+    constant and parameter values (job['values']) added to every row. Runs in a worker process, so the job
+    holds only plain values.
+
+    Returns:
+        dict with the staged feature class, rows read and seconds taken
+    """
+    started = time.time()
+    target = job['target']
+    description = arcpy.Describe(target)
+    arcpy.CreateFileGDB_management(os.path.dirname(job['scratch_gdb']), os.path.basename(job['scratch_gdb']))
+    staged_fc = os.path.join(job['scratch_gdb'], os.path.basename(target))
+    arcpy.CreateFeatureclass_management(job['scratch_gdb'], os.path.basename(target), description.shapeType.upper(),
+                                        template=target, spatial_reference=description.spatialReference)
+
+    projection = job['projection']
+    values = tuple(job['values'])
+    rows = 0
+    with arcpy.da.SearchCursor(job['source'], projection.source_fields, job['source_where']) as cursor:
+        with arcpy.da.InsertCursor(staged_fc, projection.target_fields) as insert:
+            for row in cursor:
+                insert.insertRow(tuple(row) + values)
+                rows += 1
+    return {'staged_fc': staged_fc, 'rows': rows, 'seconds': time.time() - started}
+
+
+def _count(source, where_clause=None):
+    """Returns the number of rows in source matching the where clause"""
+    with arcpy.da.SearchCursor(source, ['OID@'], where_clause) as cursor:
+        return sum(1 for _ in cursor)
+
+
+def _edit(workspace, target, delete_where, fields, rows):
+    """Deletes the rows matching delete_where and inserts rows in one edit session - aborted on any error.
+    Returns (number deleted, list of inserted object IDs)"""
+    edit = arcpy.da.Editor(workspace)
+    edit.startEditing(False, False)
+    edit.startOperation()
+    try:
+        deleted = 0
+        if delete_where:
+            with arcpy.da.UpdateCursor(target, ['OID@'], delete_where) as cursor:
+                for _ in cursor:
+                    cursor.deleteRow()
+                    deleted += 1
+        with arcpy.da.InsertCursor(target, fields) as cursor:
+            inserted = [cursor.insertRow(row) for row in rows]
+        edit.stopOperation()
+        edit.stopEditing(True)
+    except Exception:
+        edit.abortOperation()
+        edit.stopEditing(False)
+        raise
+    return deleted, inserted
+
+
+def _record(target, entry):
+    """Saves (or with None, removes) the undo manifest entry for the target"""
+    manifest = read_manifest(target)
+    if entry is None:
+        manifest.pop(os.path.basename(target), None)
+    else:
+        manifest[os.path.basename(target)] = entry
+    with open(manifest_path(target), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def _workspace(target):
+    """Returns the gdb a feature class is in (also when it is in a feature dataset)"""
+    workspace = os.path.dirname(target)
+    while workspace and not workspace.lower().endswith('.gdb'):
+        workspace = os.path.dirname(workspace)
+    return workspace or os.path.dirname(target)
+
+
+if __name__ == '__main__':
+    # Usage (run from the TFL_Updates folder) to undo the last submission to staging feature classes:
+    #   python -m utils.staging_writer rollback <staging feature class> [<staging feature class> ...]
+    if len(sys.argv) < 3 or sys.argv[1] != 'rollback':
+        sys.exit('Usage: python -m utils.staging_writer rollback <staging feature class> [...]')
+    for staging_fc in sys.argv[2:]:
+        rollback(staging_fc)
@@ -0,0 +1,260 @@
+######################################################################
+## table_reader.py
+## Purpose: Read geodatabase tables straight into columnar pandas dataframes
+##          using NumPy structured arrays (arcpy) or pyogrio when arcpy
+##          is not available (headless/Linux)
+###############################################################################
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import arcpy
+except ImportError:     # headless path - pyogrio is used instead
+    arcpy = None
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+# Stand-in values used for nulls while reading into NumPy. They are converted back to nulls in the dataframe.
+# Text uses a control character because NumPy strips trailing '\x00' and empty strings are valid values
+NULL_TEXT = u'\x01'
+NULL_INTEGERS = {
+    'SmallInteger': np.iinfo(np.int16).min,
+    'Integer': np.iinfo(np.int32).min,
+    'BigInteger': np.iinfo(np.int64).min,
+}
+# pandas nullable dtypes used for integer fields so nulls don't force a float or object column
+INTEGER_DTYPES = {'SmallInteger': 'Int16', 'Integer': 'Int32', 'BigInteger': 'Int64'}
+TEXT_TYPES = ['String', 'GUID', 'GlobalID']
+FLOAT_TYPES = ['Single', 'Double']
+# Field types that can't be read into a NumPy array
+SKIP_TYPES = ['OID', 'Geometry', 'Blob', 'Raster']
+
+
+def read_table(in_table, input_fields=None, where_clause=None, categorical_fields=None):
+    """
+    Reads an ESRI table or feature class into a pandas dataframe with an object ID index. Values are
+    read in a single pass into a NumPy structured array with explicit dtypes, rather than row by row.
+
+    Args:
+        in_table: Path to ESRI table or feature class
+        input_fields: List of field names to read. If None, all readable (non geometry/blob) fields are read
+        where_clause: where_clause as per arcpy.da.SearchCursor documentation
+        categorical_fields: List of field names to store as pandas categoricals (e.g. fields with coded
+                            domains, which only hold a handful of distinct values)
+
+    Returns:
+        Pandas dataframe
+    """
+    if arcpy is None:
+        return _read_with_pyogrio(in_table, input_fields, where_clause, categorical_fields)
+
+    oid_field, fields = _describe_fields(in_table, input_fields)
+    return _read_with_arcpy(in_table, oid_field, fields, where_clause, categorical_fields)
+
+
+def iter_table_chunks(in_table, input_fields=None, where_clause=None, categorical_fields=None, chunk_size=50000):
+    """
+    Same as read_table, but yields dataframes of at most chunk_size rows so very large tables can be
+    processed without holding the whole table in memory.
+
+    Args:
+        in_table: Path to ESRI table or feature class
+        input_fields: List of field names to read. If None, all readable fields are read
+        where_clause: where_clause as per arcpy.da.SearchCursor documentation
+        categorical_fields: List of field names to store as pandas categoricals
+        chunk_size: Maximum number of rows per dataframe
+
+    Yields:
+        Pandas dataframes
+    """
+    if arcpy is None:
+        offset = 0
+        while True:
+            chunk = _read_with_pyogrio(in_table, input_fields, where_clause, categorical_fields,
+                                       skip_features=offset, max_features=chunk_size)
+            if chunk.empty:
+                return
+            yield chunk
+            offset += len(chunk)
+
+    oid_field, fields = _describe_fields(in_table, input_fields)
+
+    # Read only the object IDs first (a single integer column), then read the rest in OID ranges
+    oids = arcpy.da.TableToNumPyArray(in_table, ['OID@'], where_clause)['OID@']
+    oids.sort()
+    oid_delimited = arcpy.AddFieldDelimiters(in_table, oid_field)
+
+    for start in range(0, len(oids), chunk_size):
+        chunk_oids = oids[start:start + chunk_size]
+        chunk_clause = '{0} >= {1} AND {0} <= {2}'.format(oid_delimited, chunk_oids[0], chunk_oids[-1])
+        if where_clause:
+            chunk_clause = '({}) AND {}'.format(where_clause, chunk_clause)
+        yield _read_with_arcpy(in_table, oid_field, fields, chunk_clause, categorical_fields)
+
+
+def split_gdb_path(in_table):
+    """
+    Splits a path to a table inside a file geodatabase into the gdb path and the table name, dropping
+    any feature dataset in between (OGR lists feature classes at the root of the gdb).
+
+    Args:
+        in_table: Path to a table or feature class within a .gdb
+
+    Returns:
+        tuple of (gdb path, table name)
+    """
+    parts = in_table.replace('\\', '/').split('/')
+    for index, part in enumerate(parts):
+        if part.lower().endswith('.gdb'):
+            return os.sep.join(parts[:index + 1]), parts[-1]
+    return os.path.dirname(in_table), os.path.basename(in_table)
+
+
+def _describe_fields(in_table, input_fields):
+    """Returns the OID field name and a list of (name, type) tuples for the fields to read"""
+    oid_field = arcpy.Describe(in_table).OIDFieldName
+    table_fields = dict((field.name, field.type) for field in arcpy.ListFields(in_table))
+    if input_fields:
+        fields = [(name, table_fields[name]) for name in input_fields]
+    else:
+        fields = [(name, field_type) for name, field_type in table_fields.items() if field_type not in SKIP_TYPES]
+    return oid_field, fields
+
+
+def _read_with_arcpy(in_table, oid_field, fields, where_clause, categorical_fields):
+    """Reads the fields into a NumPy structured array and converts it to a dataframe column by column"""
+    array_fields = [name for name, field_type in fields if field_type != 'Date']
+    null_values = {}
+    for name, field_type in fields:
+        if field_type in TEXT_TYPES:
+            null_values[name] = NULL_TEXT
+        elif field_type in NULL_INTEGERS:
+            null_values[name] = NULL_INTEGERS[field_type]
+        elif field_type in FLOAT_TYPES:
+            null_values[name] = np.nan
+
+    array = arcpy.da.TableToNumPyArray(in_table, ['OID@'] + array_fields, where_clause, null_value=null_values)
+
+    columns = {}
+    for name, field_type in fields:
+        if field_type == 'Date':
+            continue
+        columns[name] = _to_column(array[name], field_type, name in (categorical_fields or []))
+
+    index = pd.Index(array['OID@'], name=oid_field)
+    fc_dataframe = pd.DataFrame(dict((name, column) for name, column in columns.items()), index=index)
+
+    # Date fields can't be given a null stand-in in NumPy - read them with a cursor and align on the OID
+    date_fields = [name for name, field_type in fields if field_type == 'Date']
+    if date_fields:
+        with arcpy.da.SearchCursor(in_table, ['OID@'] + date_fields, where_clause) as cursor:
+            dates = pd.DataFrame([row for row in cursor], columns=[oid_field] + date_fields)
+        dates = dates.set_index(oid_field)
+        for name in date_fields:
+            fc_dataframe[name] = pd.to_datetime(dates[name]).reindex(index)
+
+    return fc_dataframe[[name for name, _ in fields]]
+
+
+def _to_column(values, field_type, categorical):
+    """Converts a NumPy column read with null stand-ins into a pandas array with real nulls"""
+    if field_type in TEXT_TYPES:
+        if categorical:
+            column = pd.Categorical(values)
+            if NULL_TEXT in column.categories:
+                column = column.remove_categories([NULL_TEXT])
+            return column
+        column = values.astype(object)
+        column[values == NULL_TEXT] = None
+        return column
+    if field_type in NULL_INTEGERS:
+        column = pd.array(values, dtype=INTEGER_DTYPES[field_type])
+        column[values == NULL_INTEGERS[field_type]] = pd.NA
+        if categorical:
+            return pd.Categorical(column)
+        return column
+    if categorical:
+        return pd.Categorical(values)
+    return values
+
+
+def _read_with_pyogrio(in_table, input_fields, where_clause, categorical_fields, skip_features=0, max_features=None):
+    """Headless reader used when arcpy isn't available"""
+    if pyogrio is None:
+        raise ImportError('Reading tables requires arcpy or pyogrio')
+
+    gdb, layer = split_gdb_path(in_table)
+    fc_dataframe = pyogrio.read_dataframe(gdb, layer=layer, columns=input_fields, where=where_clause,
+                                          read_geometry=False, fid_as_index=True,
+                                          skip_features=skip_features, max_features=max_features)
+    fc_dataframe.index.name = 'OBJECTID'
+    for name in (categorical_fields or []):
+        fc_dataframe[name] = fc_dataframe[name].astype('category')
+    return fc_dataframe
+
+
+def cursor_table_to_data_frame(in_table, input_fields=None, where_clause=None):
+    """Original row by row reader using an arcpy.da.SearchCursor - kept so read_table can be benchmarked
+    against it.
+
+    Args:
+        in_table: Path to ESRI feature class
+        input_fields: String or list of strings containing output field names. If None, all fields will be returned.
+        where_clause: where_clause as per arcpy.da.SearchCursor documentation
+
+    Returns:
+        Pandas dataframe
+    """
+    OIDFieldName = arcpy.Describe(in_table).OIDFieldName
+    if input_fields:
+        final_fields = [OIDFieldName] + input_fields
+    else:
+        final_fields = [field.name for field in arcpy.ListFields(in_table)]
+    data = [row for row in arcpy.da.SearchCursor(in_table, final_fields, where_clause=where_clause)]
+    fc_dataframe = pd.DataFrame(data, columns=final_fields)
+    fc_dataframe = fc_dataframe.set_index(OIDFieldName, drop=True)
+    return fc_dataframe
+
+
+def benchmark_readers(in_table, input_fields=None, repeat=3):
+    """
+    Times the cursor reader against read_table and compares the memory used by the resulting dataframes.
+
+    Args:
+        in_table: Path to ESRI table or feature class
+        input_fields: List of field names to read. If None, all readable fields are read
+        repeat: Number of times to run each reader. The fastest run is reported
+
+    Returns:
+        Dictionary of {reader name: (seconds, bytes)}
+    """
+    if not input_fields:
+        input_fields = _describe_fields(in_table, None)[1]
+        input_fields = [name for name, _ in input_fields]
+
+    readers = [('cursor', cursor_table_to_data_frame), ('columnar', read_table)]
+    results = {}
+    for name, reader in readers:
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            fc_dataframe = reader(in_table, input_fields=input_fields)
+            timings.append(time.time() - start)
+        results[name] = (min(timings), int(fc_dataframe.memory_usage(deep=True).sum()))
+
+    for name, (seconds, size) in sorted(results.items()):
+        print('{:<10} {:>8.3f} s {:>12,} bytes'.format(name, seconds, size))
+
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python table_reader.py <path to table or feature class>
+    benchmark_readers(sys.argv[1])
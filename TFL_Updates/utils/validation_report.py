@@ -0,0 +1,99 @@
+######################################################################
+## validation_report.py
+## Purpose: Build a machine-readable validation report (one record per
+##          failing feature/field/rule) from attribute rule results and
+##          write it as a GDB table and as JSON
+###############################################################################
+import json
+import os
+
+import arcpy
+import pandas as pd
+
+from utils.attribute_rules import ERROR, WARNING
+
+# Report table schema - (field name, field type, length). OBJECT_ID can be joined to the feature class named in FEATURE_CLASS
+REPORT_FIELDS = [
+    ('FEATURE_CLASS', 'TEXT', 100),
+    ('OBJECT_ID', 'LONG', None),
+    ('FIELD_NAME', 'TEXT', 50),
+    ('FIELD_VALUE', 'TEXT', 255),
+    ('RULE', 'TEXT', 50),
+    ('SEVERITY', 'TEXT', 10),
+    ('MESSAGE', 'TEXT', 255),
+]
+
+# Only these severities are written to a report - INFO results (e.g. null counts on nullable fields) describe a
+# passing feature class, so they are counted in the tool messages but would make every report non-empty
+REPORTED_SEVERITIES = (ERROR, WARNING)
+
+
+def build_records(feature_class, df, rule_results, severities=REPORTED_SEVERITIES):
+    """
+    Builds report records from rule results. The records come straight from the rule masks and the dataframe
+    the rules were evaluated against, so no further reads of the feature class are needed.
+
+    Args:
+        feature_class: Name of the feature class the dataframe was read from
+        df: Pandas dataframe (indexed by object ID) the rules were evaluated against
+        rule_results: list of attribute_rules.RuleResult
+        severities: Rule severities to include
+
+    Returns:
+        list of dictionaries, one for each failing row of each rule
+    """
+    records = []
+    for result in rule_results:
+        if not result.count or result.rule.severity not in severities:
+            continue
+        rule = result.rule
+        failing = df.loc[result.mask, rule.field]
+        message = rule.message.format(count=result.count, field=rule.field)
+        for object_id, value in zip(failing.index, failing.values):
+            records.append({'feature_class': feature_class,
+                            'object_id': int(object_id),
+                            'field': rule.field,
+                            'value': None if pd.isnull(value) else str(value),
+                            'rule': rule.name,
+                            'severity': rule.severity,
+                            'message': message})
+    return records
+
+
+def sort_records(records):
+    """Sorts records by feature class, field, rule and object ID so reports are deterministic"""
+    return sorted(records, key=lambda r: (r['feature_class'], r['field'], r['rule'], r['object_id']))
+
+
+def write_json(records, out_json):
+    """
+    Writes report records to a JSON file, overwriting any previous report.
+
+    Args:
+        records: list of report records from build_records
+        out_json: Path to the output .json file
+    """
+    with open(out_json, 'w') as f:
+        json.dump({'count': len(records), 'records': sort_records(records)}, f, indent=2)
+
+
+def write_table(records, out_table):
+    """
+    Writes report records to a geodatabase table, overwriting any previous report.
+
+    Args:
+        records: list of report records from build_records
+        out_table: Path to the output table
+    """
+    if arcpy.Exists(out_table):
+        arcpy.Delete_management(out_table)
+    arcpy.CreateTable_management(os.path.dirname(out_table), os.path.basename(out_table))
+    for name, field_type, length in REPORT_FIELDS:
+        arcpy.AddField_management(out_table, name, field_type, field_length=length)
+
+    keys = ['feature_class', 'object_id', 'field', 'value', 'rule', 'severity', 'message']
+    with arcpy.da.InsertCursor(out_table, [name for name, _, _ in REPORT_FIELDS]) as cursor:
+        for record in sort_records(records):
+            row = [record[key] for key in keys]
+            row[3] = row[3][:255] if row[3] else row[3]     # keep long values within the FIELD_VALUE length
+            cursor.insertRow(row)
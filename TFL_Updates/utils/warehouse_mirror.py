@@ -0,0 +1,179 @@
+######################################################################
+## warehouse_mirror.py
+## Purpose: Keep a local FileGDB mirror of the BCGW reference layers read
+##          by the TFL tools, with per-layer freshness metadata, so tool
+##          runs can read them locally instead of from the warehouse. Each
+##          sync writes a new copy of a layer and the manifest is switched
+##          to it once complete, so tools holding the old copy aren't
+##          disturbed and a failed sync leaves the old copy in use
+###############################################################################
+import json
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+import arcpy
+
+from utils.bcgw_connection import layer_path
+
+# Layers to mirror and how old (hours) the mirror copy can be before the tools go back to the BCGW
+MIRROR_LAYERS = {
+    'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP': 24,
+    'WHSE_ADMIN_BOUNDARIES.FADM_TFL_SCHED_A': 24,
+    'WHSE_FOREST_TENURE.FTEN_TIMBER_LICENCE_POLY_SVW': 24,
+    'WHSE_CADASTRE.PMBC_PARCEL_FABRIC_POLY_SVW': 24 * 7,
+    'WHSE_TANTALIS.TA_SURVEY_PARCELS_SVW': 24 * 7,
+}
+
+
+def manifest_path(mirror_gdb):
+    """Returns the path of the freshness manifest kept beside the mirror gdb"""
+    return os.path.splitext(mirror_gdb)[0] + '_manifest.json'
+
+
+def read_manifest(mirror_gdb):
+    """Returns the freshness manifest - {layer: {'name': copy in the gdb, 'synced': iso date, 'features': count}} -
+    or {} if there isn't one"""
+    try:
+        with open(manifest_path(mirror_gdb)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def is_fresh(mirror_gdb, layer, max_age_hours=None):
+    """
+    Checks whether the mirror copy of a layer was synced recently enough to be used.
+
+    Args:
+        mirror_gdb: Path to the mirror FileGDB
+        layer: Warehouse layer name, e.g. 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
+        max_age_hours: Maximum age of the copy. Defaults to the layer's age in MIRROR_LAYERS
+
+    Returns:
+        bool
+    """
+    entry = read_manifest(mirror_gdb).get(layer)
+    if not entry:
+        return False
+    if max_age_hours is None:
+        max_age_hours = MIRROR_LAYERS.get(layer, 0)
+    synced = datetime.strptime(entry['synced'], '%Y-%m-%dT%H:%M:%S')
+    return datetime.now() - synced <= timedelta(hours=max_age_hours)
+
+
+def mirror_path(mirror_gdb, layer, entry=None):
+    """Returns the path of the current mirror copy of a layer, from its manifest entry"""
+    entry = entry if entry is not None else read_manifest(mirror_gdb).get(layer, {})
+    if 'name' in entry:
+        return os.path.join(mirror_gdb, entry['name'])
+    return layer_path(mirror_gdb, layer)     # synced before copies were named by sync time
+
+
+def resolve(connection, layer, mirror_gdb=None, max_age_hours=None):
+    """
+    Returns the path tools should read a warehouse layer from - the mirror copy if there is a fresh one,
+    otherwise the layer through the connection.
+
+    Args:
+        connection: BCGW connection file (or local stand-in) from bcgw_connection.get_connection
+        layer: Warehouse layer name, e.g. 'WHSE_ADMIN_BOUNDARIES.FADM_TFL_ALL_SP'
+        mirror_gdb: Optional path to the mirror FileGDB
+        max_age_hours: Maximum age of the mirror copy. Defaults to the layer's age in MIRROR_LAYERS
+
+    Returns:
+        Path to the layer
+    """
+    if mirror_gdb and is_fresh(mirror_gdb, layer, max_age_hours):
+        mirror_layer = mirror_path(mirror_gdb, layer)
+        if arcpy.Exists(mirror_layer):
+            arcpy.AddMessage('Reading ' + layer + ' from the local mirror')
+            return mirror_layer
+    return layer_path(connection, layer)
+
+
+def sync(connection, mirror_gdb, layers=None, force=False):
+    """
+    Copies warehouse layers into the mirror gdb (created if needed). Only stale layers are copied unless
+    force is True. Each layer is copied to a new feature class named by the sync time and spatially indexed,
+    then the manifest is switched to it, so tools never read a partial copy and nothing is renamed or deleted
+    under a tool reading the old copy. If a copy fails, the old copy stays in use. Old copies are deleted
+    once nothing holds a lock on them (otherwise by a later sync).
+
+    Args:
+        connection: BCGW connection file from bcgw_connection.get_connection
+        mirror_gdb: Path to the mirror FileGDB
+        layers: list of layer names to sync. Defaults to all of MIRROR_LAYERS
+        force: Copy layers even if the mirror copy is still fresh
+
+    Returns:
+        list of the layers copied
+    """
+    if not arcpy.Exists(mirror_gdb):
+        arcpy.CreateFileGDB_management(os.path.dirname(mirror_gdb), os.path.basename(mirror_gdb))
+
+    synced = []
+    for layer in layers or sorted(MIRROR_LAYERS):
+        if not force and is_fresh(mirror_gdb, layer):
+            continue
+        #the copy is as fresh as the moment it started reading from the warehouse
+        started = datetime.now().replace(microsecond=0)
+        base_name = os.path.basename(layer_path(mirror_gdb, layer))
+        new_name = base_name + '_' + started.strftime('%Y%m%d%H%M%S')
+
+        arcpy.AddMessage('Mirroring ' + layer)
+        try:
+            arcpy.FeatureClassToFeatureClass_conversion(layer_path(connection, layer), mirror_gdb, new_name)
+            arcpy.AddSpatialIndex_management(os.path.join(mirror_gdb, new_name))
+            features = int(arcpy.GetCount_management(os.path.join(mirror_gdb, new_name))[0])
+        except arcpy.ExecuteError:
+            arcpy.AddWarning('Unable to mirror {} - the previous copy is still used\n{}'.format(layer, arcpy.GetMessages(2)))
+            _delete_copies(mirror_gdb, base_name, keep=mirror_path(mirror_gdb, layer))
+            continue
+
+        manifest = read_manifest(mirror_gdb)
+        manifest[layer] = {'name': new_name, 'synced': started.isoformat(), 'features': features}
+        _write_manifest(mirror_gdb, manifest)
+        _delete_copies(mirror_gdb, base_name, keep=os.path.join(mirror_gdb, new_name))
+        synced.append(layer)
+    return synced
+
+
+def _write_manifest(mirror_gdb, manifest):
+    """Writes the manifest to a temporary file and swaps it in, so tools never read a partly written manifest"""
+    temp_path = manifest_path(mirror_gdb) + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path(mirror_gdb))
+
+
+def _delete_copies(mirror_gdb, base_name, keep):
+    """Deletes the copies of a layer other than keep (including partial copies). Copies locked by a tool are
+    left for a later sync"""
+    pattern = re.compile('^' + re.escape(base_name) + r'(_\d{14}|_sync)?$', re.IGNORECASE)
+    for _, _, names in arcpy.da.Walk(mirror_gdb, datatype='FeatureClass'):
+        for name in names:
+            copy = os.path.join(mirror_gdb, name)
+            if pattern.match(name) and os.path.normcase(copy) != os.path.normcase(keep):
+                try:
+                    arcpy.Delete_management(copy)
+                except arcpy.ExecuteError:
+                    pass
+
+
+if __name__ == '__main__':
+    # Usage (e.g. from a scheduled task, run from the TFL_Updates folder):
+    #   python -m utils.warehouse_mirror <BCGW user> [--force]
+    # The password is read from the BCGW_PASSWORD environment variable (set for the account running the task), so
+    # it doesn't appear in the task definition or process list. The mirror is written to
+    # TFL_Config.Resources.WAREHOUSE_MIRROR_GDB
+    import TFL_Config
+    from utils import bcgw_connection
+    password = os.environ.get('BCGW_PASSWORD')
+    if not password:
+        sys.exit('Set the BCGW_PASSWORD environment variable for the account running the mirror sync')
+    connection = bcgw_connection.get_connection(sys.argv[1], password)
+    if not connection:
+        sys.exit('Unable to connect to the BCGW')
+    sync(connection, TFL_Config.Resources.WAREHOUSE_MIRROR_GDB, force='--force' in sys.argv[2:])